@@ -0,0 +1,212 @@
+"""
+聊天路由：页面、/chat、/chat/stream、/sessions...（python app.py 也只是启动这个 ASGI 应用）
+同步的 ChatService 调用放到线程池执行，不阻塞事件循环；与 /api/* 共用同一个进程内的
+检索器、数据库连接池和会话缓存。用户ID保存在签名 Cookie 会话中（SessionMiddleware）。
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from itsdangerous import BadData, URLSafeTimedSerializer
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from starlette.concurrency import run_in_threadpool
+
+from app.core.chat_service import chat_service
+from app.utils.auth import get_session_secret
+from app.utils.logger import logger
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TEMPLATE_DIR = os.path.join(ROOT_DIR, 'templates')
+STATIC_DIR = os.path.join(ROOT_DIR, 'static')
+
+router = APIRouter(tags=["chat"])
+
+_templates = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+
+
+# 旧版 Flask 入口的会话 Cookie 有效期（PERMANENT_SESSION_LIFETIME 默认 31 天）
+_LEGACY_COOKIE_MAX_AGE = 31 * 24 * 3600
+
+
+def _legacy_user_id(request: Request) -> Optional[str]:
+    """
+    读取旧版 Flask 会话 Cookie 中的 user_id（同名 session Cookie，itsdangerous 签名，
+    salt 为 cookie-session，HMAC-SHA1），SessionMiddleware 无法解码时用于迁移老用户
+    """
+    raw = request.cookies.get('session')
+    if not raw:
+        return None
+    serializer = URLSafeTimedSerializer(
+        get_session_secret(), salt='cookie-session',
+        signer_kwargs={'key_derivation': 'hmac', 'digest_method': hashlib.sha1})
+    try:
+        data = serializer.loads(raw, max_age=_LEGACY_COOKIE_MAX_AGE)
+    except BadData:
+        return None
+    user_id = data.get('user_id') if isinstance(data, dict) else None
+    return user_id if isinstance(user_id, str) and user_id else None
+
+
+def get_user_id(request: Request) -> str:
+    """获取或创建用户ID；旧版 Flask Cookie 中的用户ID迁移到新会话，会话列表不丢失"""
+    user_id = request.session.get('user_id')
+    if not user_id:
+        user_id = _legacy_user_id(request) or str(uuid.uuid4())
+        request.session['user_id'] = user_id
+    return user_id
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    # 逗号分隔的多个标签，忽略弱校验前缀 W/
+    tags = [t.strip() for t in header.split(',')]
+    tags = [t[2:] if t.startswith('W/') else t for t in tags]
+    return '*' in tags or f'"{etag}"' in tags
+
+
+@router.get("/", response_class=HTMLResponse)
+def index(request: Request):
+    """主页"""
+    def url_for(endpoint: str, **values) -> str:
+        # 模板沿用 Flask 写法 url_for('static', filename=...)
+        if 'filename' in values:
+            values['path'] = values.pop('filename')
+        return str(request.app.url_path_for(endpoint, **values))
+
+    return HTMLResponse(_templates.get_template('index.html').render(url_for=url_for))
+
+
+@router.post("/chat")
+async def chat(request: Request):
+    """处理聊天消息"""
+    data = await _json_body(request)
+    user_message = (data.get('message') or '').strip()
+    if not user_message:
+        return {'success': False, 'error': '消息不能为空'}
+    user_id = get_user_id(request)
+    try:
+        chat_response = await run_in_threadpool(
+            chat_service.send_message,
+            message=user_message,
+            session_id=data.get('session_id'),
+            user_id=user_id
+        )
+    except Exception as e:
+        logger.exception(f"Error in chat endpoint: {e}")
+        return JSONResponse({'success': False, 'error': '服务器内部错误'}, status_code=500)
+    return {
+        'success': chat_response.success,
+        'response': chat_response.response,
+        'session_id': chat_response.session_id,
+        'message_id': chat_response.message_id,
+        'timestamp': chat_response.timestamp.isoformat() if chat_response.timestamp else None,
+        'error': chat_response.error,
+        'session': chat_response.session,
+        'source_id': chat_response.source_id,
+        'confidence': chat_response.confidence,
+        'timings': chat_response.timings
+    }
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: Request):
+    """流式聊天（SSE）：依次推送 session / answer / candidates / done 事件"""
+    data = await _json_body(request)
+    user_message = (data.get('message') or '').strip()
+    if not user_message:
+        return JSONResponse({'success': False, 'error': '消息不能为空'}, status_code=400)
+    user_id = get_user_id(request)
+
+    def events():
+        for event, payload in chat_service.stream_message(
+            message=user_message,
+            session_id=data.get('session_id'),
+            user_id=user_id
+        ):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    # 同步生成器由 Starlette 在线程池中逐条迭代
+    return StreamingResponse(events(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # 关闭 nginx 代理缓冲，事件逐条送达
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@router.get("/sessions")
+async def get_sessions(request: Request):
+    """获取用户的聊天会话列表（支持 If-None-Match，未变化时返回 304）"""
+    user_id = get_user_id(request)
+    try:
+        version = await run_in_threadpool(chat_service.get_sessions_version, user_id)
+        etag = hashlib.md5(f"{user_id}:{version}".encode('utf-8')).hexdigest()
+        # 允许浏览器缓存，但每次使用前必须携带 ETag 重新验证
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        sessions = await run_in_threadpool(chat_service.get_sessions_list, user_id)
+        return JSONResponse({'success': True, 'sessions': sessions}, headers=headers)
+    except Exception as e:
+        logger.exception(f"Error in get_sessions: {e}")
+        return JSONResponse({'success': False, 'error': '获取会话列表失败'}, status_code=500)
+
+
+@router.post("/sessions")
+async def create_session(request: Request):
+    """创建新的聊天会话"""
+    data = await _json_body(request)
+    user_id = get_user_id(request)
+    try:
+        session_id = await run_in_threadpool(chat_service.create_session, data.get('title'), user_id)
+        session = await run_in_threadpool(chat_service.get_session_summary, session_id)
+        return {'success': True, 'session_id': session_id, 'session': session}
+    except Exception as e:
+        logger.exception(f"Error in create_session: {e}")
+        return JSONResponse({'success': False, 'error': '创建会话失败'}, status_code=500)
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: int):
+    """删除聊天会话"""
+    try:
+        success = await run_in_threadpool(chat_service.delete_session, session_id)
+        return {'success': success}
+    except Exception as e:
+        logger.exception(f"Error in delete_session: {e}")
+        return JSONResponse({'success': False, 'error': '删除会话失败'}, status_code=500)
+
+
+@router.get("/sessions/{session_id}/messages")
+async def get_session_messages(session_id: int, limit: int = 100, before_id: Optional[int] = None,
+                               after_id: Optional[int] = None):
+    """获取会话的消息历史（游标分页：?before_id= 向上翻页，?after_id= 拉取新消息）"""
+    limit = min(max(limit, 1), 500)
+    try:
+        messages = await run_in_threadpool(
+            chat_service.get_session_history, session_id, limit, before_id=before_id, after_id=after_id
+        )
+        return {
+            'success': True,
+            'messages': messages,
+            # 下一页游标：向上翻页时把 before_id 传回即可
+            'before_id': messages[0]['id'] if messages else None,
+            'has_more': len(messages) >= limit
+        }
+    except Exception as e:
+        logger.exception(f"Error in get_session_messages: {e}")
+        return JSONResponse({'success': False, 'error': '获取消息历史失败'}, status_code=500)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from app.utils.config import load_config, set_conf, get_conf
+from app.utils.config import get_snapshot, update_conf
 from app.utils.logger import logger
 from app.utils.auth import require_admin_auth
 
@@ -14,13 +14,13 @@ class UpdateConfigRequest(BaseModel):
 @router.get('/config')
 def get_config(_: bool = require_admin_auth()):
     try:
-        data = load_config()
+        conf = get_snapshot().retrieval
         return {
             'retrieval': {
-                'fuse_alpha': get_conf('retrieval.fuse_alpha', 0.5),
+                'fuse_alpha': conf.fuse_alpha,
                 'confidence_threshold': {
-                    'high': get_conf('retrieval.confidence_threshold.high', 0.8),
-                    'low': get_conf('retrieval.confidence_threshold.low', 0.5)
+                    'high': conf.high,
+                    'low': conf.low
                 }
             }
         }
@@ -31,12 +31,16 @@ def get_config(_: bool = require_admin_auth()):
 @router.put('/config')
 def update_config(req: UpdateConfigRequest, _: bool = require_admin_auth()):
     try:
+        # 多项修改合并为一次原子写入，其他 worker 只会看到一次变化
+        values = {}
         if req.fuse_alpha is not None:
-            set_conf('retrieval.fuse_alpha', float(req.fuse_alpha))
+            values['retrieval.fuse_alpha'] = float(req.fuse_alpha)
         if req.high is not None:
-            set_conf('retrieval.confidence_threshold.high', float(req.high))
+            values['retrieval.confidence_threshold.high'] = float(req.high)
         if req.low is not None:
-            set_conf('retrieval.confidence_threshold.low', float(req.low))
+            values['retrieval.confidence_threshold.low'] = float(req.low)
+        if values:
+            update_conf(values)
         return get_config()
     except Exception as e:
         logger.exception(f"update_config failed: {e}")
@@ -1,7 +1,13 @@
+import json
+import time
+import sqlite3
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from app.models.schemas import FAQItem, IngestRequest
-from app.core.data_manager import init_db, insert_faqs, list_faqs, delete_faq, update_faq, rebuild_fts
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.models.schemas import FAQItem, IngestRequest, FAQUpdate, FAQBulkUpdateRequest, FAQBulkDeleteRequest
+from app.core.data_manager import init_db, upsert_faqs, list_faqs, update_faqs, delete_faqs, rebuild_fts, optimize_fts, get_db_stats
+from app.core.dedup import check_items, ensure_indexed
+from app.core.retriever import refresh_faq_vectors
 from app.utils.logger import logger
 from app.utils.auth import require_admin_auth
 
@@ -11,30 +17,176 @@ init_db()
 
 @router.post("/ingest")
 def ingest(req: IngestRequest, _: bool = require_admin_auth()):
+    if req.near_duplicates not in ("off", "flag", "skip"):
+        raise HTTPException(status_code=422, detail="near_duplicates must be off/flag/skip")
     try:
+        items = req.items
+        near_dups = []
+        if req.near_duplicates != "off":
+            flagged = check_items([item.question for item in items], req.near_duplicate_threshold)
+            near_dups = [
+                {"index": i, "question": items[i].question, "matches": matches}
+                for i, matches in sorted(flagged.items())
+            ]
+            if req.near_duplicates == "skip":
+                items = [item for i, item in enumerate(items) if i not in flagged]
         rows = [(
             item.question,
             item.answer,
             item.language or "auto",
             ",".join(item.tags) if item.tags else None,
             item.source,
-        ) for item in req.items]
-        count = insert_faqs(rows)
+        ) for item in items]
+        # 按内容指纹 upsert：重复导入同一数据不会产生重复行
+        result = upsert_faqs(rows, with_ids=True)
+        inserted_ids = result.pop("inserted_ids")
+        if req.near_duplicates != "off":
+            ensure_indexed()
+        if req.embed:
+            # 只为本次新插入的行编码并补丁内存索引，不扫描整个语料
+            result["embedded"] = refresh_faq_vectors(inserted_ids)
         if req.rebuild_index:
             rebuild_fts()
-        return {"inserted": count}
+        elif req.optimize_index:
+            optimize_fts()
+        result["near_duplicates"] = near_dups
+        if req.near_duplicates == "skip":
+            result["skipped"] = len(req.items) - len(items)
+        return result
     except Exception as e:
         logger.exception(f"Ingest failed: {e}")
         raise HTTPException(status_code=500, detail="ingest_failed")
 
+def _stream_json_array(rows, chunk_rows: int = 200):
+    """逐批序列化为 JSON 数组，大页不必先在内存中拼出完整响应体"""
+    yield "["
+    buf = []
+    for i, r in enumerate(rows):
+        buf.append(("," if i else "") + json.dumps({k: r[k] for k in r.keys()}, ensure_ascii=False))
+        if len(buf) >= chunk_rows:
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+    yield "]"
+
 @router.get("/faqs")
-def faqs(limit: int = 100, offset: int = 0):
+def faqs(limit: int = 100, offset: int = 0, before_id: Optional[int] = None, fields: Optional[str] = None,
+         tag: Optional[str] = None, source: Optional[str] = None, language: Optional[str] = None):
+    limit = max(1, min(limit, 5000))
     try:
-        rows = list_faqs(limit, offset)
-        return [{k: r[k] for k in r.keys()} for r in rows]
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        # 多取一行判断是否还有下一页
+        rows = list_faqs(limit + 1, offset, before_id=before_id, fields=field_list,
+                         tag=tag, source=source, language=language)
     except Exception as e:
         logger.exception(f"List faqs failed: {e}")
         raise HTTPException(status_code=500, detail="list_failed")
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # 下一页游标放在响应头，响应体保持原有的数组格式
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if has_more:
+        headers["X-Next-Before-Id"] = str(rows[-1]["id"])
+    return StreamingResponse(_stream_json_array(rows), media_type="application/json", headers=headers)
+
+# 单次批量操作的上限，控制写事务时长
+MAX_BULK_ITEMS = 1000
+
+
+def _update_fields(update: FAQUpdate) -> dict:
+    # pydantic v2 的 model_dump，v1 回退到 .dict()（v2 中 .dict() 会发出弃用警告）
+    dump = getattr(update, "model_dump", None) or update.dict
+    fields = dump(exclude_unset=True)
+    fields.pop("id", None)
+    if "tags" in fields:
+        fields["tags"] = ",".join(fields["tags"]) if fields["tags"] else None
+    for key in ("question", "answer"):
+        if key in fields and not fields[key]:
+            raise HTTPException(status_code=422, detail=f"{key} must not be empty")
+    return fields
+
+
+def _apply_updates(updates) -> dict:
+    """写库（FTS 由触发器就地更新）→ 只为受影响的行重新编码并替换向量缓存，返回写入到可检索的耗时"""
+    started = time.perf_counter()
+    try:
+        ids = update_faqs(updates)
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=409, detail="duplicate_content")
+    written = time.perf_counter()
+    embedded = refresh_faq_vectors(ids)
+    done = time.perf_counter()
+    found = set(ids)
+    return {
+        "updated": len(ids),
+        "ids": ids,
+        "missing": [faq_id for faq_id, _ in updates if faq_id not in found],
+        "embedded": embedded,
+        "latency_ms": {
+            "write": round((written - started) * 1000, 2),
+            "embed": round((done - written) * 1000, 2),
+            "total": round((done - started) * 1000, 2),
+        },
+    }
+
+
+def _apply_deletes(ids) -> dict:
+    started = time.perf_counter()
+    deleted = delete_faqs(ids)
+    written = time.perf_counter()
+    refresh_faq_vectors(deleted)
+    done = time.perf_counter()
+    found = set(deleted)
+    return {
+        "deleted": len(deleted),
+        "ids": deleted,
+        "missing": [faq_id for faq_id in ids if faq_id not in found],
+        "latency_ms": {
+            "write": round((written - started) * 1000, 2),
+            "total": round((done - started) * 1000, 2),
+        },
+    }
+
+
+@router.put("/faqs/{faq_id}")
+def update_one(faq_id: int, req: FAQUpdate, _: bool = require_admin_auth()):
+    result = _apply_updates([(faq_id, _update_fields(req))])
+    if not result["updated"]:
+        raise HTTPException(status_code=404, detail="faq_not_found")
+    return result
+
+
+@router.delete("/faqs/{faq_id}")
+def delete_one(faq_id: int, _: bool = require_admin_auth()):
+    result = _apply_deletes([faq_id])
+    if not result["deleted"]:
+        raise HTTPException(status_code=404, detail="faq_not_found")
+    return result
+
+
+@router.post("/faqs/bulk_update")
+def bulk_update(req: FAQBulkUpdateRequest, _: bool = require_admin_auth()):
+    if len(req.items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=422, detail=f"at most {MAX_BULK_ITEMS} items per request")
+    return _apply_updates([(item.id, _update_fields(item)) for item in req.items])
+
+
+@router.post("/faqs/bulk_delete")
+def bulk_delete(req: FAQBulkDeleteRequest, _: bool = require_admin_auth()):
+    if len(req.ids) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=422, detail=f"at most {MAX_BULK_ITEMS} ids per request")
+    return _apply_deletes(req.ids)
+
+
+@router.post("/optimize_index")
+def optimize(merge_pages: int = 0, _: bool = require_admin_auth()):
+    try:
+        optimize_fts(merge_pages or None)
+        return {"status": "ok"}
+    except Exception as e:
+        logger.exception(f"Optimize index failed: {e}")
+        raise HTTPException(status_code=500, detail="optimize_failed")
 
 @router.post("/rebuild_index")
 def rebuild(_: bool = require_admin_auth()):
@@ -45,3 +197,10 @@ def rebuild(_: bool = require_admin_auth()):
         logger.exception(f"Rebuild index failed: {e}")
         raise HTTPException(status_code=500, detail="rebuild_failed")
 
+@router.get("/stats")
+def stats(days: int = 30, _: bool = require_admin_auth()):
+    try:
+        return get_db_stats(days)
+    except Exception as e:
+        logger.exception(f"Get stats failed: {e}")
+        raise HTTPException(status_code=500, detail="stats_failed")
@@ -5,17 +5,26 @@
 
 import time
 import random
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from datetime import datetime
 
 from app.core.data_manager import (
     create_chat_session, get_chat_sessions, get_chat_session,
     add_chat_message, get_chat_messages, delete_chat_session,
-    get_chat_session_by_latest_message, init_db
+    get_chat_session_by_latest_message, get_chat_sessions_etag, get_faqs_by_ids, init_db
 )
+from app.core.retriever import cached_retrieve, get_semantic_retriever
+from app.core.query_log import log_query, warm_caches
+from app.core.matcher import apply_threshold
+from app.core.intents import get_intent_matcher
+from app.core.session_cache import SessionCache
 from app.models.schemas import ChatSession, ChatMessage, ChatRequest, ChatResponse
+from app.utils.config import get_conf, get_snapshot
+from app.utils.metrics import Counter, observe_stage, stage_timer
 from app.utils.logger import logger
 
+_ANSWERS = Counter('wonk_chat_answers_total', 'Chat answers by retrieval confidence level', ('level',))
+
 
 class ChatService:
     """聊天服务类"""
@@ -23,8 +32,15 @@ class ChatService:
     def __init__(self):
         # 确保数据库已初始化
         init_db()
+        # 活跃会话缓存：元数据、用户最近会话与最近消息，热会话无需读库
+        self.cache = SessionCache(
+            max_sessions=int(get_conf('chat.session_cache.max_sessions', 1024)),
+            ttl=float(get_conf('chat.session_cache.ttl_seconds', 600)),
+            tail_size=int(get_conf('chat.session_cache.tail_messages', 50)),
+            enabled=bool(get_conf('chat.session_cache.enabled', True)),
+        )
         
-        # 模拟的聊天机器人回复
+        # 低置信度时使用的通用回复
         self.sample_responses = [
             "这是一个很有趣的问题！让我想想...",
             "根据我的理解，我认为...",
@@ -36,50 +52,76 @@ class ChatService:
             "基于现有的信息，我的建议是...",
         ]
     
-    def generate_response(self, user_message: str) -> str:
+    @property
+    def retriever(self):
+        """与 /api/query 共用的进程内语义检索器"""
+        return get_semantic_retriever()
+    
+    def warm_up(self) -> None:
+        """启动时预热：加载模型与向量缓存，再用查询日志中的热门查询填充查询向量与结果缓存"""
+        started = time.perf_counter()
+        self.retriever.warm_up()
+        logger.info(f"Chat retriever warmed up in {(time.perf_counter() - started) * 1000:.0f} ms")
+        warm_caches()
+    
+    def answer(self, user_message: str) -> Dict[str, Any]:
         """
-        生成机器人回复的函数
-        这里可以集成真正的AI模型，比如OpenAI GPT、本地模型等
+        检索式回答：BM25 + 语义融合检索，按置信度阈值决定是否采用FAQ答案
+        低置信度时回退到内置回复。返回 response/source_id/confidence/level/candidates/timings
         """
-        # 模拟处理时间
-        time.sleep(random.uniform(0.5, 2.0))
-        
-        # 简单的关键词回复逻辑
-        user_message_lower = user_message.lower()
-        
-        if any(word in user_message_lower for word in ['你好', 'hello', 'hi', '您好']):
-            return "你好！很高兴见到你！我是 Wonk，你的智能助手。有什么我可以帮助你的吗？"
-        
-        elif any(word in user_message_lower for word in ['再见', 'bye', '拜拜', '再会']):
-            return "再见！希望我们的对话对你有帮助。期待下次与你交流！"
-        
-        elif any(word in user_message_lower for word in ['谢谢', 'thank', '感谢']):
-            return "不客气！我很高兴能够帮助你。如果还有其他问题，随时可以问我！"
-        
-        elif any(word in user_message_lower for word in ['你是谁', '介绍', 'who are you']):
-            return "我是 Wonk，一个智能聊天机器人。我可以回答问题、提供建议、进行对话。我的目标是为用户提供有用和有趣的交流体验！"
-        
-        elif any(word in user_message_lower for word in ['天气', 'weather']):
-            return "抱歉，我目前还无法获取实时天气信息。不过你可以查看天气应用或网站来获取最新的天气预报！"
-        
-        elif any(word in user_message_lower for word in ['时间', 'time', '几点']):
-            current_time = time.strftime("%Y年%m月%d日 %H:%M:%S")
-            return f"现在的时间是：{current_time}"
-        
-        elif any(word in user_message_lower for word in ['帮助', 'help', '功能']):
-            return """我可以帮助你：
-• 回答各种问题
-• 进行日常对话
-• 提供建议和想法
-• 解释概念和知识点
-• 协助解决问题
-
-你可以问我任何你感兴趣的话题！"""
-        
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        self.retriever.check_stale()
+        conf = get_snapshot().retrieval
+        top_k = conf.top_k
+        bm25_rows, fused, cache_hit = cached_retrieve(user_message, top_k=top_k, alpha=conf.fuse_alpha,
+                                                      semantic_retriever=self.retriever, timings=timings)
+        t_hydrate = time.perf_counter()
+        top = fused[:top_k]
+        rows = {r['id']: r for r in bm25_rows}
+        rows.update(get_faqs_by_ids([rid for rid, _ in top if rid not in rows]))
+        candidates = [
+            {'id': rid, 'question': rows[rid]['question'], 'score': round(float(score), 4)}
+            for rid, score in top if rid in rows
+        ]
+        hydrate_s = time.perf_counter() - t_hydrate
+        observe_stage('hydrate', hydrate_s)
+        timings['hydrate'] = round(hydrate_s * 1000, 3)
+        best_score, level = apply_threshold([(c['id'], c['score']) for c in candidates], high=conf.high,
+                                            low=conf.low)
+        _ANSWERS.inc(level)
+        source_id = None
+        if level == 'high':
+            source_id = candidates[0]['id']
+            response = rows[source_id]['answer']
+        elif level == 'mid':
+            source_id = candidates[0]['id']
+            response = f"你是不是想问「{candidates[0]['question']}」？\n\n{rows[source_id]['answer']}"
         else:
-            # 随机选择一个通用回复
-            base_response = random.choice(self.sample_responses)
-            return f"{base_response}\n\n关于「{user_message}」这个话题，我觉得这很值得深入探讨。你能告诉我更多相关的背景信息吗？"
+            response = self._canned_response(user_message)
+        timings['answer'] = round((time.perf_counter() - started) * 1000, 3)
+        log_query('chat', user_message, top_k, timings['answer'], source_id is not None, cache_hit, level=level)
+        return {
+            'response': response,
+            'source_id': source_id,
+            'confidence': round(float(best_score), 4),
+            'level': level,
+            'candidates': candidates,
+            'timings': timings,
+        }
+    
+    def generate_response(self, user_message: str) -> str:
+        """生成机器人回复（检索式，无人为延迟）"""
+        return self.answer(user_message)['response']
+    
+    def _canned_response(self, user_message: str) -> str:
+        """低置信度时的内置回复：意图匹配（单次扫描）+ 通用回复"""
+        reply = get_intent_matcher().respond(user_message)
+        if reply is not None:
+            return reply
+        # 随机选择一个通用回复
+        base_response = random.choice(self.sample_responses)
+        return f"{base_response}\n\n关于「{user_message}」这个话题，我觉得这很值得深入探讨。你能告诉我更多相关的背景信息吗？"
     
     def create_session(self, title: str = None, user_id: str = None) -> int:
         """创建新的聊天会话"""
@@ -87,25 +129,57 @@ class ChatService:
             title = f"新对话 - {datetime.now().strftime('%m月%d日 %H:%M')}"
         
         session_id = create_chat_session(title, user_id)
+        session = get_chat_session(session_id)
+        if session:
+            # 新会话没有消息，缓存中的空消息列表即为完整历史
+            self.cache.put_session(dict(session), new=True)
         logger.info(f"Created new chat session: {session_id}")
         return session_id
     
+    def _load_session(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """先查缓存，未命中再读库并回填"""
+        meta = self.cache.get_session(session_id)
+        if meta is None:
+            session = get_chat_session(session_id)
+            if session is None:
+                return None
+            meta = dict(session)
+            self.cache.put_session(meta)
+        return meta
+    
     def get_or_create_session(self, session_id: Optional[int] = None, user_id: str = None) -> int:
         """获取或创建聊天会话"""
         if session_id:
             # 验证会话是否存在
-            session = get_chat_session(session_id)
-            if session:
+            if self._load_session(session_id):
                 return session_id
         
         # 尝试获取最近的会话
+        latest_id = self.cache.get_latest(user_id)
+        if latest_id is not None:
+            return latest_id
         recent_session = get_chat_session_by_latest_message(user_id)
         if recent_session:
+            self.cache.put_session(dict(recent_session))
+            self.cache.set_latest(user_id, recent_session['id'])
             return recent_session['id']
         
         # 创建新会话
         return self.create_session(user_id=user_id)
     
+    def _add_message(self, session_id: int, user_id: Optional[str], role: str, content: str) -> int:
+        """写库并同步写入会话缓存"""
+        with stage_timer('chat_db_write'):
+            message_id = add_chat_message(session_id, role, content)
+        self.cache.record_message(session_id, user_id, {
+            'id': message_id,
+            'role': role,
+            'content': content,
+            # 与库中 CURRENT_TIMESTAMP 相同的 UTC 格式
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+        })
+        return message_id
+    
     def send_message(self, message: str, session_id: Optional[int] = None, user_id: str = None) -> ChatResponse:
         """发送消息并获取回复"""
         try:
@@ -113,22 +187,37 @@ class ChatService:
             actual_session_id = self.get_or_create_session(session_id, user_id)
             
             # 保存用户消息
-            user_message_id = add_chat_message(actual_session_id, 'user', message)
+            t0 = time.perf_counter()
+            user_message_id = self._add_message(actual_session_id, user_id, 'user', message)
+            t1 = time.perf_counter()
             
             # 生成机器人回复
-            bot_response = self.generate_response(message)
+            result = self.answer(message)
+            bot_response = result['response']
             
             # 保存机器人回复
-            bot_message_id = add_chat_message(actual_session_id, 'assistant', bot_response)
+            t2 = time.perf_counter()
+            bot_message_id = self._add_message(actual_session_id, user_id, 'assistant', bot_response)
+            t3 = time.perf_counter()
             
-            logger.info(f"Chat exchange in session {actual_session_id}: user_msg={user_message_id}, bot_msg={bot_message_id}")
+            timings = dict(result['timings'])
+            timings['save_user'] = round((t1 - t0) * 1000, 3)
+            timings['save_reply'] = round((t3 - t2) * 1000, 3)
+            timings['total'] = round((t3 - t0) * 1000, 3)
+            logger.info(f"Chat exchange in session {actual_session_id}: user_msg={user_message_id}, "
+                        f"bot_msg={bot_message_id}, level={result['level']}, total={timings['total']}ms")
             
             return ChatResponse(
                 success=True,
                 response=bot_response,
                 session_id=actual_session_id,
                 message_id=bot_message_id,
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                # 携带更新后的会话摘要，前端可就地更新列表而无需重新拉取
+                session=self.get_session_summary(actual_session_id),
+                source_id=result['source_id'],
+                confidence=result['confidence'],
+                timings=timings
             )
             
         except Exception as e:
@@ -140,11 +229,66 @@ class ChatService:
                 error=str(e)
             )
     
-    def get_session_history(self, session_id: int, limit: int = 100) -> List[Dict[str, Any]]:
-        """获取会话历史"""
+    def stream_message(self, message: str, session_id: Optional[int] = None,
+                       user_id: str = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式处理消息，依次产出 (事件名, 数据)：session → answer → candidates → done，出错时产出 error
+        用户消息与回复在回答生成后成对写库：客户端在回答前断开时两条都不写，推送回答期间断开
+        （生成器被关闭）也会在 finally 中写完，不会留下没有回复的用户消息。
+        done 中的 ttfb_ms / total_ms 为服务端测得的首个事件产出耗时与整体耗时，不含网络传输与代理缓冲
+        """
+        started = time.perf_counter()
+        try:
+            actual_session_id = self.get_or_create_session(session_id, user_id)
+            ttfb_ms = round((time.perf_counter() - started) * 1000, 3)
+            yield 'session', {'session_id': actual_session_id}
+            
+            result = self.answer(message)
+            try:
+                yield 'answer', {
+                    'response': result['response'],
+                    'source_id': result['source_id'],
+                    'confidence': result['confidence'],
+                    'level': result['level'],
+                }
+                yield 'candidates', {'candidates': result['candidates']}
+            finally:
+                t0 = time.perf_counter()
+                user_message_id = self._add_message(actual_session_id, user_id, 'user', message)
+                t1 = time.perf_counter()
+                bot_message_id = self._add_message(actual_session_id, user_id, 'assistant', result['response'])
+                t2 = time.perf_counter()
+            timings = dict(result['timings'])
+            timings['save_user'] = round((t1 - t0) * 1000, 3)
+            timings['save_reply'] = round((t2 - t1) * 1000, 3)
+            total_ms = round((t2 - started) * 1000, 3)
+            logger.info(f"Chat stream in session {actual_session_id}: user_msg={user_message_id}, "
+                        f"bot_msg={bot_message_id}, level={result['level']}, ttfb={ttfb_ms}ms, total={total_ms}ms")
+            yield 'done', {
+                'session_id': actual_session_id,
+                'message_id': bot_message_id,
+                'user_message_id': user_message_id,
+                'timestamp': datetime.now().isoformat(),
+                'session': self.get_session_summary(actual_session_id),
+                'timings': timings,
+                'ttfb_ms': ttfb_ms,
+                'total_ms': total_ms,
+            }
+        except Exception as e:
+            logger.error(f"Error in stream_message: {e}")
+            yield 'error', {'error': str(e)}
+    
+    def get_session_history(self, session_id: int, limit: int = 100,
+                            before_id: Optional[int] = None,
+                            after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取会话历史（默认最新一页，before_id/after_id 为游标）；缓存的最近消息能覆盖时不读库"""
         try:
-            messages = get_chat_messages(session_id, limit)
-            return [
+            cached = self.cache.get_messages(session_id, limit, before_id=before_id, after_id=after_id)
+            if cached is not None:
+                return cached
+            version = self.cache.message_version(session_id)
+            messages = get_chat_messages(session_id, limit, before_id=before_id, after_id=after_id)
+            history = [
                 {
                     'id': msg['id'],
                     'role': msg['role'],
@@ -153,6 +297,10 @@ class ChatService:
                 }
                 for msg in messages
             ]
+            if before_id is None and after_id is None:
+                # 最新一页可回填缓存；不足 limit 条说明已是全部历史
+                self.cache.put_messages(session_id, history, complete=len(history) < limit, version=version)
+            return history
         except Exception as e:
             logger.error(f"Error getting session history: {e}")
             return []
@@ -161,23 +309,42 @@ class ChatService:
         """获取会话列表"""
         try:
             sessions = get_chat_sessions(user_id, limit)
-            return [
-                {
-                    'id': session['id'],
-                    'title': session['title'],
-                    'created_at': session['created_at'],
-                    'updated_at': session['updated_at']
-                }
-                for session in sessions
-            ]
+            return [self._session_to_dict(session) for session in sessions]
         except Exception as e:
             logger.error(f"Error getting sessions list: {e}")
             return []
     
+    def get_session_summary(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """获取单个会话摘要（与会话列表项格式一致）"""
+        try:
+            session = self._load_session(session_id)
+            return self._session_to_dict(session) if session else None
+        except Exception as e:
+            logger.error(f"Error getting session summary: {e}")
+            return None
+    
+    def get_sessions_version(self, user_id: str = None) -> str:
+        """获取会话列表版本号，列表未变化时版本号不变"""
+        return get_chat_sessions_etag(user_id)
+    
+    @staticmethod
+    def _session_to_dict(session) -> Dict[str, Any]:
+        return {
+            'id': session['id'],
+            'title': session['title'],
+            'created_at': session['created_at'],
+            'updated_at': session['updated_at']
+        }
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """会话缓存命中率统计"""
+        return self.cache.stats()
+    
     def delete_session(self, session_id: int) -> bool:
         """删除会话"""
         try:
             deleted_count = delete_chat_session(session_id)
+            self.cache.invalidate(session_id)
             logger.info(f"Deleted chat session {session_id}, affected rows: {deleted_count}")
             return deleted_count > 0
         except Exception as e:
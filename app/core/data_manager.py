@@ -1,7 +1,17 @@
 import os
+import re
+import json
+import bisect
+import time
+import zlib
+import hashlib
 import sqlite3
+import threading
+import unicodedata
+from array import array
 from contextlib import contextmanager
-from typing import Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.utils.cache import TTLCache
 from app.utils.logger import logger
 
 DB_PATH = os.getenv("WONK_DB_PATH", "data/database.db")
@@ -9,10 +19,51 @@ DB_PATH = os.getenv("WONK_DB_PATH", "data/database.db")
 # 确保目录存在
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# 连接池：按 DB_PATH 分组复用空闲连接，避免每次操作都重新打开数据库文件；
+# 连接不绑定线程（check_same_thread=False），但同一时刻只借给一个使用者
+POOL_SIZE = int(os.getenv("WONK_DB_POOL_SIZE", "8"))
+_pool: Dict[str, List[sqlite3.Connection]] = {}
+_pool_lock = threading.Lock()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # SQLite 默认不启用外键约束，不打开时 ON DELETE CASCADE 不会生效
+    conn.execute("PRAGMA foreign_keys=ON;")
+    return conn
+
+
+def _release(path: str, conn: sqlite3.Connection) -> None:
+    # 改过事务模式或仍处于事务中的连接不再复用
+    if conn.in_transaction or conn.isolation_level != "":
+        conn.close()
+        return
+    with _pool_lock:
+        idle = _pool.setdefault(path, [])
+        if len(idle) < POOL_SIZE:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def close_pool() -> None:
+    """关闭所有空闲连接（进程退出或切换数据库文件后调用）"""
+    with _pool_lock:
+        conns = [c for idle in _pool.values() for c in idle]
+        _pool.clear()
+    for conn in conns:
+        conn.close()
+
+
 @contextmanager
 def get_conn() -> Iterable[sqlite3.Connection]:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    path = DB_PATH
+    with _pool_lock:
+        idle = _pool.get(path)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = _connect(path)
     try:
         yield conn
         conn.commit()
@@ -21,12 +72,14 @@ def get_conn() -> Iterable[sqlite3.Connection]:
         logger.exception(f"DB error: {e}")
         raise
     finally:
-        conn.close()
+        _release(path, conn)
 
 
 def init_db() -> None:
     with get_conn() as conn:
         cur = conn.cursor()
+        # 新建库启用增量 VACUUM（已有库需执行一次完整 VACUUM 才会切换）
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
         # 基础表
         cur.execute(
             """
@@ -69,11 +122,35 @@ def init_db() -> None:
             """
         )
 
+        # 冷数据归档表：长期空闲会话的历史消息压缩后按会话存为一个 BLOB
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_message_archive (
+                session_id INTEGER PRIMARY KEY,
+                codec TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                stored_bytes INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (session_id) REFERENCES chat_sessions (id) ON DELETE CASCADE
+            );
+            """
+        )
+
         # 创建索引
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id);")
+        # (session_id, id) 复合索引：按会话分页时直接走索引顺序，无需排序
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id_id ON chat_messages(session_id, id);")
+        # 单列 session_id 索引已被复合索引覆盖，删除以减少写放大
+        cur.execute("DROP INDEX IF EXISTS idx_chat_messages_session_id;")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_timestamp ON chat_messages(timestamp);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON chat_sessions(user_id);")
+        # (user_id, updated_at) 复合索引：会话列表可只走索引
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated ON chat_sessions(user_id, updated_at);")
+        cur.execute("DROP INDEX IF EXISTS idx_chat_sessions_user_id;")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions(updated_at);")
+        # FAQ 管理列表按来源/语言过滤并按 id 翻页
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_faqs_source_id ON faqs(source, id);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_faqs_language_id ON faqs(language, id);")
         # FTS5 可选创建
         try:
             cur.execute(
@@ -106,34 +183,373 @@ def init_db() -> None:
         except sqlite3.OperationalError:
             pass
 
+        _init_stats(cur)
+        _init_content_hash(cur)
+        _init_embeddings(cur)
+
+
+def _ensure_column(cur: sqlite3.Cursor, table: str, column: str, ddl: str) -> None:
+    """为已有库补充新增列（CREATE TABLE IF NOT EXISTS 不会修改旧表结构）"""
+    cur.execute(f"PRAGMA table_info({table});")
+    if column not in {row[1] for row in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl};")
+
+
+def _init_content_hash(cur: sqlite3.Cursor) -> None:
+    _ensure_column(cur, 'faqs', 'content_hash', 'TEXT')
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_faqs_content_hash';")
+    if cur.fetchone():
+        # 唯一索引与回填在同一事务中建立，索引已存在说明回填已完成；之后的写入都带指纹，
+        # 仍为 NULL 的只有回填时留下的重复行，不必在每次 init_db() 时重新哈希、重复告警
+        return
+    cur.execute("SELECT id, question, answer FROM faqs WHERE content_hash IS NULL ORDER BY id;")
+    pending = cur.fetchall()
+    if pending:
+        # 回填旧数据：重复内容只为最早的一条写入哈希，其余保持 NULL 以便唯一索引可以建立
+        cur.execute("SELECT content_hash FROM faqs WHERE content_hash IS NOT NULL;")
+        seen = {row[0] for row in cur.fetchall()}
+        updates = []
+        duplicates = 0
+        for row in pending:
+            h = content_hash(row['question'], row['answer'])
+            if h in seen:
+                duplicates += 1
+                continue
+            seen.add(h)
+            updates.append((h, row['id']))
+        cur.executemany("UPDATE faqs SET content_hash = ? WHERE id = ?;", updates)
+        logger.info(f"Backfilled content_hash for {len(updates)} faqs")
+        if duplicates:
+            logger.warning(f"{duplicates} duplicate faqs left without content_hash, "
+                           f"run scripts/find_duplicates.py --exact --delete to remove them")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_faqs_content_hash ON faqs(content_hash);")
+
+
+def _init_embeddings(cur: sqlite3.Cursor) -> None:
+    # 预计算的向量与FAQ同库存放，按模型标记；服务启动时直接加载，不在请求路径上编码全库
+    cur.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS faq_embeddings (
+            faq_id INTEGER PRIMARY KEY,
+            model TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            FOREIGN KEY (faq_id) REFERENCES faqs (id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_faq_embeddings_model ON faq_embeddings(model);
+        -- 问题或答案变化后向量失效，由下一次 embed 补算
+        CREATE TRIGGER IF NOT EXISTS faq_embeddings_au AFTER UPDATE OF question, answer ON faqs
+        WHEN old.question IS NOT new.question OR old.answer IS NOT new.answer BEGIN
+          DELETE FROM faq_embeddings WHERE faq_id = new.id;
+        END;
+        """
+    )
+
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_faq_text(text: Optional[str]) -> str:
+    """规范化文本：NFKC（全角转半角）、小写、去掉空白与标点"""
+    return _NON_WORD.sub('', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def normalize_query(text: Optional[str]) -> str:
+    """规范化用户查询（用于查询日志）：去掉首尾空白并合并连续空白；不做全角转换，回放时检索行为与原查询一致"""
+    return ' '.join((text or '').split())
+
+
+def content_hash(question: str, answer: str) -> str:
+    """问答内容指纹：规范化后的问题与答案共同决定，格式差异不影响结果"""
+    key = normalize_faq_text(question) + '\x1f' + normalize_faq_text(answer)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# 由触发器维护的计数器，读取统计时无需 COUNT(*) 全表扫描；值为全量重算时使用的查询
+# faq_generation 在FAQ每次增删改时递增，检索结果缓存以此判断是否过期；代数只增不减，
+# 重算时在原值上递增，避免与旧缓存键重合
+_STATS_SOURCES = {
+    'sessions': "SELECT COUNT(*) FROM chat_sessions",
+    'messages': "SELECT COUNT(*) FROM chat_messages",
+    'archived_messages': "SELECT COALESCE(SUM(message_count), 0) FROM chat_message_archive",
+    'users': "SELECT COUNT(DISTINCT user_id) FROM chat_sessions WHERE user_id IS NOT NULL",
+    'faqs': "SELECT COUNT(*) FROM faqs",
+    'faq_generation': "SELECT COALESCE((SELECT value FROM db_stats WHERE key = 'faq_generation'), 0) + 1",
+    # 会话列表代数：会话增删改（含新消息推进 updated_at）时递增，会话列表 ETag 由此得出
+    'session_generation': "SELECT COALESCE((SELECT value FROM db_stats WHERE key = 'session_generation'), 0) + 1",
+}
+_STATS_KEYS = tuple(_STATS_SOURCES)
+
+
+def _init_stats(cur: sqlite3.Cursor) -> None:
+    cur.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS db_stats (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS chat_user_stats (
+            user_id TEXT PRIMARY KEY,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS chat_daily_stats (
+            day TEXT PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TRIGGER IF NOT EXISTS stats_sessions_ai AFTER INSERT ON chat_sessions BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'sessions';
+          INSERT OR IGNORE INTO chat_user_stats(user_id, sessions) SELECT new.user_id, 0 WHERE new.user_id IS NOT NULL;
+          UPDATE chat_user_stats SET sessions = sessions + 1 WHERE user_id = new.user_id;
+          UPDATE db_stats SET value = value + 1 WHERE key = 'users'
+            AND (SELECT sessions FROM chat_user_stats WHERE user_id = new.user_id) = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS stats_sessions_ad AFTER DELETE ON chat_sessions BEGIN
+          UPDATE db_stats SET value = value - 1 WHERE key = 'sessions';
+          UPDATE chat_user_stats SET sessions = sessions - 1 WHERE user_id = old.user_id;
+          UPDATE db_stats SET value = value - 1 WHERE key = 'users'
+            AND (SELECT sessions FROM chat_user_stats WHERE user_id = old.user_id) = 0;
+          DELETE FROM chat_user_stats WHERE user_id = old.user_id AND sessions <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS stats_messages_ai AFTER INSERT ON chat_messages BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'messages';
+          INSERT OR IGNORE INTO chat_daily_stats(day, messages) VALUES (date(new.timestamp), 0);
+          UPDATE chat_daily_stats SET messages = messages + 1 WHERE day = date(new.timestamp);
+        END;
+        CREATE TRIGGER IF NOT EXISTS stats_messages_ad AFTER DELETE ON chat_messages BEGIN
+          UPDATE db_stats SET value = value - 1 WHERE key = 'messages';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS stats_archive_ai AFTER INSERT ON chat_message_archive BEGIN
+          UPDATE db_stats SET value = value + new.message_count WHERE key = 'archived_messages';
+        END;
+        CREATE TRIGGER IF NOT EXISTS stats_archive_au AFTER UPDATE OF message_count ON chat_message_archive BEGIN
+          UPDATE db_stats SET value = value + new.message_count - old.message_count WHERE key = 'archived_messages';
+        END;
+        CREATE TRIGGER IF NOT EXISTS stats_archive_ad AFTER DELETE ON chat_message_archive BEGIN
+          UPDATE db_stats SET value = value - old.message_count WHERE key = 'archived_messages';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS stats_faqs_ai AFTER INSERT ON faqs BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'faqs';
+        END;
+        CREATE TRIGGER IF NOT EXISTS stats_faqs_ad AFTER DELETE ON faqs BEGIN
+          UPDATE db_stats SET value = value - 1 WHERE key = 'faqs';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS faq_generation_ai AFTER INSERT ON faqs BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'faq_generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS faq_generation_au AFTER UPDATE ON faqs BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'faq_generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS faq_generation_ad AFTER DELETE ON faqs BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'faq_generation';
+        END;
+        """
+    )
+    _ensure_column(cur, 'chat_user_stats', 'version', 'INTEGER NOT NULL DEFAULT 0')
+    # 用户的会话列表版本取自单调递增的 session_generation：updated_at 只有秒级精度，
+    # 同一秒内的新消息改变列表顺序却不改变 MAX(updated_at)，不能用来做 ETag
+    cur.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS session_generation_ai AFTER INSERT ON chat_sessions BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'session_generation';
+          INSERT OR IGNORE INTO chat_user_stats(user_id, sessions) SELECT new.user_id, 0 WHERE new.user_id IS NOT NULL;
+          UPDATE chat_user_stats SET version = (SELECT value FROM db_stats WHERE key = 'session_generation')
+            WHERE user_id = new.user_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS session_generation_au AFTER UPDATE ON chat_sessions BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'session_generation';
+          UPDATE chat_user_stats SET version = (SELECT value FROM db_stats WHERE key = 'session_generation')
+            WHERE user_id IN (old.user_id, new.user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS session_generation_ad AFTER DELETE ON chat_sessions BEGIN
+          UPDATE db_stats SET value = value + 1 WHERE key = 'session_generation';
+          UPDATE chat_user_stats SET version = (SELECT value FROM db_stats WHERE key = 'session_generation')
+            WHERE user_id = old.user_id;
+        END;
+        """
+    )
+    cur.execute("SELECT key FROM db_stats;")
+    missing = [key for key in _STATS_KEYS if key not in {row[0] for row in cur.fetchall()}]
+    if len(missing) == len(_STATS_KEYS):
+        # 首次启用时全量回填一次
+        _refresh_stats(cur)
+    else:
+        # 升级后新增的计数项只补这几项，已有计数与每日统计保持不变
+        for key in missing:
+            cur.execute(f"INSERT OR IGNORE INTO db_stats(key, value) SELECT ?, ({_STATS_SOURCES[key]});", (key,))
+
+
+def _refresh_stats(cur: sqlite3.Cursor) -> None:
+    for key, source in _STATS_SOURCES.items():
+        cur.execute(f"INSERT OR REPLACE INTO db_stats(key, value) SELECT ?, ({source});", (key,))
+    cur.execute("DELETE FROM chat_user_stats;")
+    cur.execute(
+        "INSERT INTO chat_user_stats(user_id, sessions, version) "
+        "SELECT user_id, COUNT(*), (SELECT value FROM db_stats WHERE key = 'session_generation') "
+        "FROM chat_sessions WHERE user_id IS NOT NULL GROUP BY user_id;"
+    )
+    # 每日消息数不随清理与归档递减，已清理消息的计数无法从在线数据重算：
+    # 与已有行合并，只把低于在线消息数的天补齐，不清空历史
+    cur.execute(
+        "SELECT date(timestamp), COUNT(*) FROM chat_messages WHERE timestamp IS NOT NULL GROUP BY date(timestamp);"
+    )
+    live = cur.fetchall()
+    cur.executemany("INSERT OR IGNORE INTO chat_daily_stats(day, messages) VALUES (?, 0);", [(d,) for d, _ in live])
+    cur.executemany("UPDATE chat_daily_stats SET messages = MAX(messages, ?) WHERE day = ?;",
+                    [(n, d) for d, n in live])
+
+
+def refresh_db_stats() -> None:
+    """全量重算统计计数器（用于修复，平时由触发器增量维护）；每日消息数只补齐、不清空"""
+    with get_conn() as conn:
+        _refresh_stats(conn.cursor())
+    logger.info("DB stats refreshed")
+
+
+def get_db_stats(days: int = 30) -> Dict[str, Any]:
+    """
+    读取统计信息：会话/消息/用户/FAQ 计数与最近 days 天的每日消息数
+    全部为主键或索引查找，适合监控面板高频轮询
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT key, value FROM db_stats;")
+        stats: Dict[str, Any] = {key: 0 for key in _STATS_KEYS}
+        stats.update({row['key']: row['value'] for row in cur.fetchall()})
+        # updated_at 有索引，MAX 只需读取索引末端
+        cur.execute("SELECT MAX(updated_at) FROM chat_sessions;")
+        stats['last_activity'] = cur.fetchone()[0]
+        cur.execute(
+            "SELECT day, messages FROM chat_daily_stats WHERE day >= date('now', ?) ORDER BY day ASC;",
+            (f"-{int(days)} days",)
+        )
+        stats['daily_messages'] = [{'day': row['day'], 'messages': row['messages']} for row in cur.fetchall()]
+        return stats
+
 
 def rebuild_fts() -> None:
+    """
+    全量重建FTS索引，仅用于修复（日常写入由 faqs_ai/ad/au 触发器增量维护）
+    """
     with get_conn() as conn:
         cur = conn.cursor()
         try:
-            cur.execute("DELETE FROM faqs_fts;")
-            cur.execute(
-                "INSERT INTO faqs_fts(rowid, question, answer, tags) SELECT id, question, answer, tags FROM faqs;"
-            )
+            # 外部内容表使用 FTS5 的 rebuild 命令从 faqs 重新生成索引
+            cur.execute("INSERT INTO faqs_fts(faqs_fts) VALUES('rebuild');")
             logger.info("FTS rebuilt")
         except sqlite3.OperationalError as e:
             logger.warning(f"Cannot rebuild FTS: {e}")
 
 
+def optimize_fts(merge_pages: Optional[int] = None) -> None:
+    """
+    整理FTS索引段：
+    - merge_pages 为空时执行 optimize，将所有段合并为一个（适合批量导入之后）
+    - 否则执行增量 merge，每次最多处理约 merge_pages 页，可在空闲时反复调用
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            if merge_pages:
+                cur.execute("INSERT INTO faqs_fts(faqs_fts, rank) VALUES('merge', ?);", (int(merge_pages),))
+            else:
+                cur.execute("INSERT INTO faqs_fts(faqs_fts) VALUES('optimize');")
+            logger.info(f"FTS optimized (merge_pages={merge_pages})")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Cannot optimize FTS: {e}")
+
+
 def insert_faqs(items: List[Tuple[str, str, str, Optional[str], Optional[str]]]) -> int:
+    """写入FAQ（按内容指纹幂等），返回新插入的条数"""
+    return upsert_faqs(items)['inserted']
+
+
+def upsert_faqs(items: List[Tuple[str, str, str, Optional[str], Optional[str]]],
+                with_ids: bool = False) -> Dict[str, Any]:
+    """
+    按内容指纹 upsert：新内容插入；已存在的内容只在 language/tags/source 变化时更新
+    重复导入同一数据源不会产生重复行，未变化的行也不会触发FTS重建
+    返回 {'inserted', 'updated', 'unchanged'}；with_ids=True 时另含 'inserted_ids'
+    （只有新插入的行需要编码向量，元数据更新不影响问答文本）
+    """
+    rows = [(q, a, lang, tags, source, content_hash(q, a)) for q, a, lang, tags, source in items]
     with get_conn() as conn:
         cur = conn.cursor()
+        # 同一事务内新插入的行ID都大于插入前的最大ID
+        max_before = cur.execute("SELECT COALESCE(MAX(id), 0) FROM faqs;").fetchone()[0] if with_ids else 0
         cur.executemany(
-            "INSERT INTO faqs(question, answer, language, tags, source) VALUES (?, ?, ?, ?, ?);",
-            items,
+            "INSERT OR IGNORE INTO faqs(question, answer, language, tags, source, content_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            rows,
         )
-        return cur.rowcount
+        inserted = max(cur.rowcount, 0)
+        cur.executemany(
+            "UPDATE faqs SET language = ?, tags = ?, source = ? "
+            "WHERE content_hash = ? AND (language IS NOT ? OR tags IS NOT ? OR source IS NOT ?);",
+            [(lang, tags, source, h, lang, tags, source) for _, _, lang, tags, source, h in rows],
+        )
+        updated = max(cur.rowcount, 0)
+        result: Dict[str, Any] = {'inserted': inserted, 'updated': updated,
+                                  'unchanged': len(rows) - inserted - updated}
+        if with_ids:
+            cur.execute("SELECT id FROM faqs WHERE id > ? ORDER BY id;", (max_before,))
+            result['inserted_ids'] = [row[0] for row in cur.fetchall()]
+    return result
 
 
-def list_faqs(limit: int = 100, offset: int = 0) -> List[sqlite3.Row]:
+# 可投影的列；id 始终返回，作为翻页游标
+FAQ_FIELDS = ('id', 'question', 'answer', 'language', 'tags', 'source', 'created_at', 'content_hash')
+
+
+def list_faqs(limit: int = 100, offset: int = 0, before_id: Optional[int] = None,
+              fields: Optional[List[str]] = None, tag: Optional[str] = None,
+              source: Optional[str] = None, language: Optional[str] = None) -> List[sqlite3.Row]:
+    """
+    按ID倒序列出FAQ
+    - before_id：键集分页游标，只返回 id < before_id 的行，深翻页不再扫描丢弃前面的行
+    - offset：兼容旧调用，与 before_id 同时给出时忽略
+    - fields：投影列（未知列名忽略），id 总是包含
+    - tag/source/language：过滤条件；source/language 走 (列, id) 复合索引，tag 走 FTS 列过滤
+    """
+    cols = ['id'] + [f for f in (fields or FAQ_FIELDS) if f in FAQ_FIELDS and f != 'id']
+    where: List[str] = []
+    params: List[Any] = []
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+        offset = 0
+    if source is not None:
+        where.append("source = ?")
+        params.append(source)
+    if language is not None:
+        where.append("language = ?")
+        params.append(language)
+    if tag:
+        # tags 以逗号拼接存储；instr 做精确的整标签匹配（不用 LIKE，标签中的 % _ 不会被当作通配符），
+        # FTS 子查询负责缩小候选
+        where.append("instr(',' || tags || ',', ?) > 0")
+        params.append(f",{tag},")
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM faqs ORDER BY id DESC LIMIT ? OFFSET ?;", (limit, offset))
+        base = f"SELECT {', '.join(cols)} FROM faqs"
+        tail = " ORDER BY id DESC LIMIT ? OFFSET ?;"
+        if tag:
+            fts_where = where + ["id IN (SELECT rowid FROM faqs_fts WHERE faqs_fts MATCH ?)"]
+            phrase = '"' + tag.replace('"', '""') + '"'
+            try:
+                cur.execute(base + " WHERE " + " AND ".join(fts_where) + tail,
+                            params + [f"tags : {phrase}", limit, offset])
+                return cur.fetchall()
+            except sqlite3.OperationalError:
+                # FTS 不可用时只用 LIKE 过滤
+                pass
+        sql = base + (" WHERE " + " AND ".join(where) if where else "") + tail
+        cur.execute(sql, params + [limit, offset])
         return cur.fetchall()
 
 
@@ -144,6 +560,27 @@ def get_all_faqs() -> List[sqlite3.Row]:
         return cur.fetchall()
 
 
+def get_faqs_by_ids(ids: List[int]) -> Dict[int, sqlite3.Row]:
+    """按主键批量取FAQ，返回 {id: row}"""
+    if not ids:
+        return {}
+    with get_conn() as conn:
+        cur = conn.cursor()
+        placeholders = ",".join("?" * len(ids))
+        cur.execute(
+            f"SELECT id, question, answer, language, tags, source FROM faqs WHERE id IN ({placeholders});",
+            list(ids)
+        )
+        return {row['id']: row for row in cur.fetchall()}
+
+
+def get_faq_generation() -> int:
+    """FAQ 数据代数：任何增删改（含其他进程的导入）都会使其变化，主键查找"""
+    with get_conn() as conn:
+        row = conn.execute("SELECT value FROM db_stats WHERE key = 'faq_generation';").fetchone()
+        return int(row[0]) if row else 0
+
+
 def count_faqs() -> int:
     with get_conn() as conn:
         cur = conn.cursor()
@@ -163,12 +600,123 @@ def update_faq(faq_id: int, question: str, answer: str, language: str, tags: Opt
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute(
-            "UPDATE faqs SET question=?, answer=?, language=?, tags=?, source=? WHERE id=?;",
-            (question, answer, language, tags, source, faq_id),
+            "UPDATE faqs SET question=?, answer=?, language=?, tags=?, source=?, content_hash=? WHERE id=?;",
+            (question, answer, language, tags, source, content_hash(question, answer), faq_id),
         )
         return cur.rowcount
 
 
+def get_faqs_without_embedding(model: str, limit: int = 1000, after_id: int = 0,
+                               ids: Optional[List[int]] = None) -> List[sqlite3.Row]:
+    """按ID顺序取出尚无该模型向量的FAQ（其他模型的旧向量视为缺失）；ids 限定范围"""
+    id_filter = f" AND f.id IN ({','.join('?' * len(ids))})" if ids else ""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            SELECT f.id, f.question, f.answer FROM faqs f
+            LEFT JOIN faq_embeddings e ON e.faq_id = f.id AND e.model = ?
+            WHERE f.id > ? AND e.faq_id IS NULL{id_filter} ORDER BY f.id LIMIT ?;
+            """,
+            [model, after_id] + list(ids or []) + [limit]
+        )
+        return cur.fetchall()
+
+
+def save_embeddings(model: str, items: List[Tuple[int, Any]]) -> int:
+    """写入 [(faq_id, 向量)]，向量以 float32 存为 BLOB；返回写入条数"""
+    rows = []
+    for faq_id, vec in items:
+        arr = vec if isinstance(vec, array) and vec.typecode == 'f' else array('f', vec)
+        rows.append((faq_id, model, len(arr), arr.tobytes()))
+    with get_conn() as conn:
+        cur = conn.cursor()
+        # faq_embeddings 上没有触发器，REPLACE 可安全覆盖旧模型的向量
+        cur.executemany(
+            "INSERT OR REPLACE INTO faq_embeddings(faq_id, model, dim, vector) VALUES (?, ?, ?, ?);", rows
+        )
+    return len(rows)
+
+
+def load_embeddings(model: str, faq_ids: Optional[List[int]] = None) -> Tuple[List[int], List[array]]:
+    """加载该模型的向量（faq_ids 为空时加载全部），返回 (faq_id 列表, float32 数组列表)"""
+    ids: List[int] = []
+    vectors: List[array] = []
+    id_filter = f" AND faq_id IN ({','.join('?' * len(faq_ids))})" if faq_ids else ""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT faq_id, vector FROM faq_embeddings WHERE model = ?{id_filter} ORDER BY faq_id;",
+            [model] + list(faq_ids or [])
+        )
+        for row in cur:
+            vec = array('f')
+            vec.frombytes(row['vector'])
+            ids.append(row['faq_id'])
+            vectors.append(vec)
+    return ids, vectors
+
+
+def count_embeddings(model: Optional[str] = None) -> int:
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if model is None:
+            cur.execute("SELECT COUNT(*) FROM faq_embeddings;")
+        else:
+            cur.execute("SELECT COUNT(*) FROM faq_embeddings WHERE model = ?;", (model,))
+        return int(cur.fetchone()[0])
+
+
+def get_faq(faq_id: int) -> Optional[sqlite3.Row]:
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, question, answer, language, tags, source FROM faqs WHERE id = ?;", (faq_id,))
+        return cur.fetchone()
+
+
+_FAQ_UPDATABLE = ('question', 'answer', 'language', 'tags', 'source')
+
+
+def update_faqs(updates: List[Tuple[int, Dict[str, Any]]]) -> List[int]:
+    """
+    批量部分更新，单个事务；只写入给出的字段，问题或答案变化时重算内容指纹
+    FTS 行由触发器就地更新，向量由触发器置为失效；返回实际存在的 id 列表
+    与已有内容重复时抛出 sqlite3.IntegrityError，整批回滚
+    """
+    updated: List[int] = []
+    with get_conn() as conn:
+        cur = conn.cursor()
+        for faq_id, fields in updates:
+            fields = {k: v for k, v in fields.items() if k in _FAQ_UPDATABLE}
+            cur.execute("SELECT question, answer FROM faqs WHERE id = ?;", (faq_id,))
+            row = cur.fetchone()
+            if row is None:
+                continue
+            if 'question' in fields or 'answer' in fields:
+                fields['content_hash'] = content_hash(fields.get('question', row['question']),
+                                                      fields.get('answer', row['answer']))
+            if fields:
+                assignments = ", ".join(f"{k} = ?" for k in fields)
+                cur.execute(f"UPDATE faqs SET {assignments} WHERE id = ?;", list(fields.values()) + [faq_id])
+            updated.append(faq_id)
+    return updated
+
+
+def delete_faqs(ids: List[int], batch_size: int = 500) -> List[int]:
+    """批量删除，返回实际删除的 id 列表（FTS 行由触发器删除，向量级联删除）"""
+    deleted: List[int] = []
+    with get_conn() as conn:
+        cur = conn.cursor()
+        for i in range(0, len(ids), batch_size):
+            chunk = list(ids[i:i + batch_size])
+            placeholders = ",".join("?" * len(chunk))
+            cur.execute(f"SELECT id FROM faqs WHERE id IN ({placeholders});", chunk)
+            existing = [row[0] for row in cur.fetchall()]
+            cur.execute(f"DELETE FROM faqs WHERE id IN ({placeholders});", chunk)
+            deleted.extend(existing)
+    return deleted
+
+
 def search_bm25(query: str, top_k: int = 10) -> List[sqlite3.Row]:
     with get_conn() as conn:
         cur = conn.cursor()
@@ -197,6 +745,95 @@ def search_bm25(query: str, top_k: int = 10) -> List[sqlite3.Row]:
             return cur.fetchall()
 
 
+# ==================== 归档编解码 ====================
+
+# 解压耗时统计（进程内），供归档统计展示回迁延迟；线程池中并发读取，更新与读取都需持锁
+ARCHIVE_READ_STATS: Dict[str, float] = {'reads': 0, 'messages': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+_archive_stats_lock = threading.Lock()
+
+# 最近解压的归档（按会话），向上翻页穿过归档时每页不必重新解压整个 BLOB；
+# 键含 archived_at / message_count / stored_bytes，重新归档后自然失效
+_archive_cache = TTLCache(max_size=16, ttl=600)
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except Exception:
+        return None
+
+
+def archive_codecs() -> List[str]:
+    """当前环境可用的压缩算法（zstd 需安装 zstandard）"""
+    return ['zlib', 'zstd'] if _zstd() else ['zlib']
+
+
+def encode_archive(messages: List[Dict[str, Any]], codec: str = 'zlib') -> Tuple[bytes, int]:
+    """将消息列表序列化并压缩，返回 (压缩数据, 原始字节数)"""
+    raw = json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if codec == 'zstd':
+        zstd = _zstd()
+        if zstd is None:
+            raise ValueError("zstd codec requires the 'zstandard' package")
+        return zstd.ZstdCompressor(level=10).compress(raw), len(raw)
+    if codec == 'zlib':
+        return zlib.compress(raw, 9), len(raw)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+def decode_archive(payload: bytes, codec: str) -> List[Dict[str, Any]]:
+    """解压归档数据为消息列表（按ID升序）"""
+    if codec == 'zstd':
+        zstd = _zstd()
+        if zstd is None:
+            raise ValueError("zstd codec requires the 'zstandard' package")
+        raw = zstd.ZstdDecompressor().decompress(payload)
+    else:
+        raw = zlib.decompress(payload)
+    return json.loads(raw.decode('utf-8'))
+
+
+def archive_read_stats() -> Dict[str, float]:
+    """解压耗时统计的一致快照"""
+    with _archive_stats_lock:
+        return dict(ARCHIVE_READ_STATS)
+
+
+def _load_archived_messages(cur: sqlite3.Cursor, session_id: int) -> Optional[List[Dict[str, Any]]]:
+    cur.execute("SELECT codec, payload FROM chat_message_archive WHERE session_id = ?;", (session_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    start = time.perf_counter()
+    messages = decode_archive(row['payload'], row['codec'])
+    elapsed = (time.perf_counter() - start) * 1000
+    with _archive_stats_lock:
+        ARCHIVE_READ_STATS['reads'] += 1
+        ARCHIVE_READ_STATS['messages'] += len(messages)
+        ARCHIVE_READ_STATS['total_ms'] += elapsed
+        ARCHIVE_READ_STATS['max_ms'] = max(ARCHIVE_READ_STATS['max_ms'], elapsed)
+    return messages
+
+
+def _cached_archive(cur: sqlite3.Cursor, session_id: int) -> Optional[Tuple[List[Dict[str, Any]], List[int]]]:
+    """会话的归档消息及其ID列表（升序，供二分定位游标）；无归档时返回 None"""
+    cur.execute(
+        "SELECT archived_at, message_count, stored_bytes FROM chat_message_archive WHERE session_id = ?;",
+        (session_id,)
+    )
+    meta = cur.fetchone()
+    if meta is None:
+        return None
+    key = (DB_PATH, session_id, meta['archived_at'], meta['message_count'], meta['stored_bytes'])
+    cached = _archive_cache.get(key)
+    if cached is None:
+        messages = [dict(m, session_id=session_id) for m in _load_archived_messages(cur, session_id) or []]
+        cached = (messages, [m['id'] for m in messages])
+        _archive_cache.put(key, cached)
+    return cached
+
+
 # ==================== 聊天相关方法 ====================
 
 def create_chat_session(title: str, user_id: Optional[str] = None) -> int:
@@ -227,6 +864,22 @@ def get_chat_sessions(user_id: Optional[str] = None, limit: int = 50) -> List[sq
         return cur.fetchall()
 
 
+def get_chat_sessions_etag(user_id: Optional[str] = None) -> str:
+    """
+    计算会话列表的版本标识（用于 ETag），主键查找
+    会话数与触发器维护的版本号：新建/删除/修改会话、新消息都会把版本推进到新的 session_generation
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if user_id:
+            cur.execute("SELECT sessions, version FROM chat_user_stats WHERE user_id = ?;", (user_id,))
+            row = cur.fetchone()
+            return f"{row[0]}-{row[1]}" if row else "0-0"
+        cur.execute("SELECT key, value FROM db_stats WHERE key IN ('sessions', 'session_generation');")
+        values = {row[0]: row[1] for row in cur.fetchall()}
+        return f"{values.get('sessions', 0)}-{values.get('session_generation', 0)}"
+
+
 def get_chat_session(session_id: int) -> Optional[sqlite3.Row]:
     """获取单个聊天会话"""
     with get_conn() as conn:
@@ -264,15 +917,50 @@ def add_chat_message(session_id: int, role: str, content: str) -> int:
         return message_id
 
 
-def get_chat_messages(session_id: int, limit: int = 100) -> List[sqlite3.Row]:
-    """获取聊天消息历史"""
+def get_chat_messages(session_id: int, limit: int = 100,
+                      before_id: Optional[int] = None,
+                      after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    获取聊天消息历史（基于消息ID的游标分页，结果按时间正序，每条为 dict）
+    - 不带游标：返回最新的 limit 条
+    - before_id：返回该消息之前的 limit 条（向上翻页）
+    - after_id：返回该消息之后的 limit 条（增量拉取）
+    已归档的历史消息会透明回迁：归档消息的ID都小于该会话的在线消息，只有一页越过在线消息的
+    起点时才读取归档，并按游标在归档内二分切出所需的一段
+    """
+    columns = "SELECT id, session_id, role, content, timestamp FROM chat_messages"
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM chat_messages WHERE session_id = ? ORDER BY timestamp ASC LIMIT ?;",
-            (session_id, limit)
-        )
-        return cur.fetchall()
+        if after_id is not None:
+            cur.execute(f"{columns} WHERE session_id = ? AND id > ? ORDER BY id ASC LIMIT ?;",
+                        (session_id, after_id, limit))
+            rows = [dict(row) for row in cur.fetchall()]
+            cur.execute("SELECT MIN(id) FROM chat_messages WHERE session_id = ?;", (session_id,))
+            first_live = cur.fetchone()[0]
+            if first_live is not None and after_id >= first_live:
+                return rows
+            archive = _cached_archive(cur, session_id)
+            if archive is None:
+                return rows
+            messages, ids = archive
+            start = bisect.bisect_right(ids, after_id)
+            return (messages[start:start + limit] + rows)[:limit]
+
+        if before_id is not None:
+            cur.execute(f"{columns} WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?;",
+                        (session_id, before_id, limit))
+        else:
+            cur.execute(f"{columns} WHERE session_id = ? ORDER BY id DESC LIMIT ?;", (session_id, limit))
+        rows = [dict(row) for row in cur.fetchall()]
+        rows.reverse()
+        if len(rows) >= limit or limit <= 0:
+            return rows
+        archive = _cached_archive(cur, session_id)
+        if archive is None:
+            return rows
+        messages, ids = archive
+        end = bisect.bisect_left(ids, before_id) if before_id is not None else len(ids)
+        return messages[max(0, end - (limit - len(rows))):end] + rows
 
 
 def delete_chat_session(session_id: int) -> int:
@@ -309,3 +997,60 @@ def get_chat_session_by_latest_message(user_id: Optional[str] = None) -> Optiona
             )
         return cur.fetchone()
 
+
+def iter_chat_export(user_id: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, after_session_id: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    流式导出会话及其消息（单条有序 JOIN 查询，逐行消费游标）
+    每次只在内存中保留一个会话的消息，按会话ID升序产出，
+    after_session_id 用于断点续导；since/until 按会话 updated_at 过滤
+    """
+    sql = """
+        SELECT s.id AS s_id, s.title, s.user_id, s.created_at, s.updated_at,
+               a.session_id IS NOT NULL AS archived,
+               m.id AS m_id, m.role, m.content, m.timestamp
+        FROM chat_sessions s
+        LEFT JOIN chat_message_archive a ON a.session_id = s.id
+        LEFT JOIN chat_messages m ON m.session_id = s.id
+        WHERE s.id > ?
+    """
+    params: List[Any] = [after_session_id]
+    if user_id:
+        sql += " AND s.user_id = ?"
+        params.append(user_id)
+    if since:
+        sql += " AND s.updated_at >= ?"
+        params.append(since)
+    if until:
+        sql += " AND s.updated_at < ?"
+        params.append(until)
+    sql += " ORDER BY s.id ASC, m.id ASC;"
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        current = None
+        for row in cur:
+            if current is None or current['id'] != row['s_id']:
+                if current is not None:
+                    yield current
+                current = {
+                    'id': row['s_id'],
+                    'title': row['title'],
+                    'user_id': row['user_id'],
+                    'created_at': row['created_at'],
+                    'updated_at': row['updated_at'],
+                    'messages': []
+                }
+                if row['archived']:
+                    # 归档数据单独读取，避免 JOIN 时每行重复拷贝 BLOB
+                    current['messages'] = _load_archived_messages(conn.cursor(), row['s_id']) or []
+            if row['m_id'] is not None:
+                current['messages'].append({
+                    'id': row['m_id'],
+                    'role': row['role'],
+                    'content': row['content'],
+                    'timestamp': row['timestamp']
+                })
+        if current is not None:
+            yield current
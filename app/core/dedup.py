@@ -0,0 +1,216 @@
+"""
+近似重复检测模块
+基于 MinHash + LSH 分桶：每条问题计算一次签名并按 band 落桶，
+新问题只与同桶候选比较，避免 O(N²) 的两两比对。
+签名与分桶持久化在 SQLite 中，写入时增量维护。
+"""
+
+import random
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.data_manager import get_conn, normalize_faq_text
+from app.utils.logger import logger
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rnd = random.Random(20250810)
+_PERMS = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def _shingles(text: str) -> List[int]:
+    norm = normalize_faq_text(text)
+    if len(norm) <= SHINGLE_SIZE:
+        return [zlib.crc32(norm.encode('utf-8'))]
+    return list({zlib.crc32(norm[i:i + SHINGLE_SIZE].encode('utf-8'))
+                 for i in range(len(norm) - SHINGLE_SIZE + 1)})
+
+
+def minhash(text: str) -> List[int]:
+    """计算文本的 MinHash 签名（字符 3-gram，对中英文都适用）"""
+    shingles = _shingles(text)
+    return [min(((a * h + b) % _PRIME) & _MAX_HASH for h in shingles) for a, b in _PERMS]
+
+
+def similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """由签名估计 Jaccard 相似度"""
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / float(NUM_PERM)
+
+
+def band_buckets(sig: Sequence[int]) -> List[int]:
+    """签名分 band 后各自哈希为桶号，任一 band 相同即成为候选"""
+    buckets = []
+    for band in range(BANDS):
+        chunk = array('I', sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+        buckets.append(zlib.crc32(chunk.tobytes(), band))
+    return buckets
+
+
+def _encode_sig(sig: Sequence[int]) -> bytes:
+    return array('I', sig).tobytes()
+
+
+def _decode_sig(blob: bytes) -> List[int]:
+    sig = array('I')
+    sig.frombytes(blob)
+    return sig.tolist()
+
+
+def _ensure_tables(cur) -> None:
+    cur.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS faq_minhash (
+            faq_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL,
+            FOREIGN KEY (faq_id) REFERENCES faqs (id) ON DELETE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS faq_lsh (
+            bucket INTEGER NOT NULL,
+            faq_id INTEGER NOT NULL,
+            FOREIGN KEY (faq_id) REFERENCES faqs (id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_faq_lsh_bucket ON faq_lsh(bucket);
+        CREATE INDEX IF NOT EXISTS idx_faq_lsh_faq_id ON faq_lsh(faq_id);
+        -- 问题文本变化后签名失效，下次 ensure_indexed 时重新计算
+        CREATE TRIGGER IF NOT EXISTS faq_minhash_au AFTER UPDATE OF question ON faqs BEGIN
+          DELETE FROM faq_lsh WHERE faq_id = new.id;
+          DELETE FROM faq_minhash WHERE faq_id = new.id;
+        END;
+        """
+    )
+
+
+def ensure_indexed(batch_size: int = 1000) -> int:
+    """为尚未计算签名的FAQ补算签名并落桶，返回新索引的条数"""
+    total = 0
+    with get_conn() as conn:
+        _ensure_tables(conn.cursor())
+    while True:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT f.id, f.question FROM faqs f
+                LEFT JOIN faq_minhash m ON m.faq_id = f.id
+                WHERE m.faq_id IS NULL ORDER BY f.id LIMIT ?;
+                """,
+                (batch_size,)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            sigs = []
+            buckets = []
+            for row in rows:
+                sig = minhash(row['question'])
+                sigs.append((row['id'], _encode_sig(sig)))
+                buckets.extend((b, row['id']) for b in band_buckets(sig))
+            cur.executemany("INSERT OR REPLACE INTO faq_minhash(faq_id, signature) VALUES (?, ?);", sigs)
+            cur.executemany("INSERT INTO faq_lsh(bucket, faq_id) VALUES (?, ?);", buckets)
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+    if total:
+        logger.info(f"MinHash indexed {total} faqs")
+    return total
+
+
+def find_similar(question: str, threshold: float = DEFAULT_THRESHOLD,
+                 limit: int = 5) -> List[Tuple[int, float]]:
+    """查找与 question 近似重复的已有FAQ，返回 [(faq_id, 相似度)]，按相似度降序"""
+    return _find_similar_sig(minhash(question), threshold, limit)
+
+
+def _find_similar_sig(sig: List[int], threshold: float, limit: int) -> List[Tuple[int, float]]:
+    buckets = band_buckets(sig)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        placeholders = ",".join("?" * len(buckets))
+        cur.execute(
+            f"""
+            SELECT m.faq_id, m.signature FROM faq_minhash m
+            WHERE m.faq_id IN (SELECT DISTINCT faq_id FROM faq_lsh WHERE bucket IN ({placeholders}));
+            """,
+            buckets
+        )
+        matches = []
+        for row in cur.fetchall():
+            score = similarity(sig, _decode_sig(row['signature']))
+            if score >= threshold:
+                matches.append((row['faq_id'], score))
+    matches.sort(key=lambda x: x[1], reverse=True)
+    return matches[:limit]
+
+
+def check_items(questions: Iterable[str], threshold: float = DEFAULT_THRESHOLD) -> Dict[int, List[Dict[str, object]]]:
+    """
+    检查一批待导入问题：与库中已有FAQ、以及批内前面的问题比较
+    返回 {批内下标: [{'id': faq_id 或 None, 'index': 批内下标 或 None, 'similarity': x}]}
+    """
+    ensure_indexed()
+    flagged: Dict[int, List[Dict[str, object]]] = {}
+    local_buckets: Dict[int, List[int]] = {}
+    local_sigs: List[List[int]] = []
+    for i, question in enumerate(questions):
+        sig = minhash(question)
+        hits: List[Dict[str, object]] = [
+            {'id': faq_id, 'index': None, 'similarity': round(score, 3)}
+            for faq_id, score in _find_similar_sig(sig, threshold, 5)
+        ]
+        seen = set()
+        for b in band_buckets(sig):
+            for j in local_buckets.get(b, ()):
+                if j in seen:
+                    continue
+                seen.add(j)
+                score = similarity(sig, local_sigs[j])
+                if score >= threshold:
+                    hits.append({'id': None, 'index': j, 'similarity': round(score, 3)})
+            local_buckets.setdefault(b, []).append(i)
+        local_sigs.append(sig)
+        if hits:
+            flagged[i] = hits
+    return flagged
+
+
+def scan_near_duplicates(threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[int, int, float]]:
+    """扫描全库近似重复对，只比较同桶候选；返回 [(较早ID, 较晚ID, 相似度)]"""
+    ensure_indexed()
+    pairs: Dict[Tuple[int, int], float] = {}
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT bucket, group_concat(faq_id) AS ids FROM faq_lsh GROUP BY bucket HAVING COUNT(*) > 1;"
+        )
+        groups = [sorted(int(x) for x in row['ids'].split(',')) for row in cur.fetchall()]
+        sig_cache: Dict[int, List[int]] = {}
+
+        def sig_of(faq_id: int) -> Optional[List[int]]:
+            if faq_id not in sig_cache:
+                row = cur.execute("SELECT signature FROM faq_minhash WHERE faq_id = ?;", (faq_id,)).fetchone()
+                sig_cache[faq_id] = _decode_sig(row['signature']) if row else None
+            return sig_cache[faq_id]
+
+        checked = set()
+        for ids in groups:
+            for x in range(len(ids)):
+                for y in range(x + 1, len(ids)):
+                    key = (ids[x], ids[y])
+                    if key in checked:
+                        continue
+                    checked.add(key)
+                    a, b = sig_of(ids[x]), sig_of(ids[y])
+                    if a is None or b is None:
+                        continue
+                    score = similarity(a, b)
+                    if score >= threshold:
+                        pairs[key] = score
+    return sorted(((a, b, s) for (a, b), s in pairs.items()), key=lambda x: (x[0], x[1]))
@@ -0,0 +1,195 @@
+"""
+意图匹配模块
+把所有意图的关键词编译成一个 Aho-Corasick 自动机，对消息只扫描一遍即可找出命中的意图，
+耗时与消息长度成正比，与意图/关键词数量无关。
+意图从配置 chat.intents 读取（缺省使用 DEFAULT_INTENTS），配置文件变化后自动重新编译。
+
+配置格式：
+    chat:
+      intents:
+        - name: greeting
+          priority: 100        # 同一条消息命中多个意图时取优先级最高者，相同时取配置中靠前的
+          keywords: [你好, hello]
+          response: 你好！
+回复文本中的 {time} 会替换为当前时间。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from app.utils.config import get_conf, check_config_changed, config_version
+from app.utils.logger import logger
+
+
+class Intent(NamedTuple):
+    name: str
+    priority: int
+    keywords: List[str]
+    response: str
+
+
+DEFAULT_INTENTS: List[Dict[str, Any]] = [
+    {
+        'name': 'greeting',
+        'priority': 70,
+        'keywords': ['你好', 'hello', 'hi', '您好'],
+        'response': "你好！很高兴见到你！我是 Wonk，你的智能助手。有什么我可以帮助你的吗？",
+    },
+    {
+        'name': 'goodbye',
+        'priority': 60,
+        'keywords': ['再见', 'bye', '拜拜', '再会'],
+        'response': "再见！希望我们的对话对你有帮助。期待下次与你交流！",
+    },
+    {
+        'name': 'thanks',
+        'priority': 50,
+        'keywords': ['谢谢', 'thank', '感谢'],
+        'response': "不客气！我很高兴能够帮助你。如果还有其他问题，随时可以问我！",
+    },
+    {
+        'name': 'identity',
+        'priority': 40,
+        'keywords': ['你是谁', '介绍', 'who are you'],
+        'response': "我是 Wonk，一个智能聊天机器人。我可以回答问题、提供建议、进行对话。我的目标是为用户提供有用和有趣的交流体验！",
+    },
+    {
+        'name': 'weather',
+        'priority': 30,
+        'keywords': ['天气', 'weather'],
+        'response': "抱歉，我目前还无法获取实时天气信息。不过你可以查看天气应用或网站来获取最新的天气预报！",
+    },
+    {
+        'name': 'time',
+        'priority': 20,
+        'keywords': ['时间', 'time', '几点'],
+        'response': "现在的时间是：{time}",
+    },
+    {
+        'name': 'help',
+        'priority': 10,
+        'keywords': ['帮助', 'help', '功能'],
+        'response': """我可以帮助你：
+• 回答各种问题
+• 进行日常对话
+• 提供建议和想法
+• 解释概念和知识点
+• 协助解决问题
+
+你可以问我任何你感兴趣的话题！""",
+    },
+]
+
+
+def parse_intents(raw: Any) -> List[Intent]:
+    """校验并转换配置中的意图列表，无效项跳过"""
+    intents: List[Intent] = []
+    for i, item in enumerate(raw or []):
+        if not isinstance(item, dict) or not item.get('response'):
+            logger.warning(f"Skip invalid intent #{i}: {item!r}")
+            continue
+        keywords = item.get('keywords') or []
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        intents.append(Intent(
+            name=str(item.get('name') or f'intent_{i}'),
+            priority=int(item.get('priority', 0)),
+            keywords=[str(k) for k in keywords if str(k).strip()],
+            response=str(item['response']),
+        ))
+    return intents
+
+
+class IntentMatcher:
+    """多模式一次扫描匹配器（Aho-Corasick），关键词不区分大小写、按子串匹配"""
+
+    def __init__(self, intents: List[Intent]):
+        # 按优先级排序后的下标即 rank，rank 越小优先级越高
+        order = sorted(range(len(intents)), key=lambda i: (-intents[i].priority, i))
+        self.intents = [intents[i] for i in order]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态上可命中的最高优先级（含失败链上的输出），无输出为 None
+        self._best: List[Optional[int]] = [None]
+        self.keyword_count = 0
+        for rank, intent in enumerate(self.intents):
+            for keyword in intent.keywords:
+                self._add(keyword.lower(), rank)
+        self._build_fail_links()
+
+    def _add(self, keyword: str, rank: int) -> None:
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            node = nxt
+        if self._best[node] is None or rank < self._best[node]:
+            self._best[node] = rank
+        self.keyword_count += 1
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail = self._goto[f].get(ch, 0)
+                self._fail[child] = fail if fail != child else 0
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+
+    def match(self, text: str) -> Optional[Intent]:
+        """返回命中的最高优先级意图，没有命中返回 None"""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        node = 0
+        best: Optional[int] = None
+        for ch in text.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            rank = best_at[node]
+            if rank is not None and (best is None or rank < best):
+                best = rank
+                if best == 0:
+                    break
+        return None if best is None else self.intents[best]
+
+    def respond(self, text: str) -> Optional[str]:
+        intent = self.match(text)
+        if intent is None:
+            return None
+        return intent.response.replace('{time}', time.strftime("%Y年%m月%d日 %H:%M:%S"))
+
+
+_matcher: Optional[IntentMatcher] = None
+_matcher_version = -1
+_lock = threading.Lock()
+
+
+def get_intent_matcher() -> IntentMatcher:
+    """当前配置对应的匹配器；配置文件变化（节流检查 mtime）或经 API 修改后自动重新编译"""
+    global _matcher, _matcher_version
+    check_config_changed()
+    version = config_version()
+    if _matcher is None or _matcher_version != version:
+        with _lock:
+            if _matcher is None or _matcher_version != version:
+                raw = get_conf('chat.intents')
+                intents = parse_intents(raw) if raw else parse_intents(DEFAULT_INTENTS)
+                started = time.perf_counter()
+                _matcher = IntentMatcher(intents)
+                _matcher_version = version
+                logger.info(f"Intent matcher compiled: {len(intents)} intents, {_matcher.keyword_count} keywords "
+                            f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return _matcher
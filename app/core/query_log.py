@@ -0,0 +1,119 @@
+"""
+查询日志模块
+/api/query 与 /chat 每次检索追加一行 JSON：规范化后的查询、top_k、耗时、是否找到答案、是否命中结果缓存。
+写入经 loguru enqueue 队列由后台线程完成（见 add_jsonl_sink），请求线程只做一次入队。
+日志用于两件事：
+- 启动预热：读取最近的记录，按出现次数取前 N 个查询预先检索，填充查询向量与结果缓存；
+- 压测回放：scripts/replay_queries.py 按指定速率重放真实流量。
+
+配置（monitoring.query_log）：
+    enabled: true
+    path: logs/queries.jsonl
+    rotation: 50 MB
+    retention: 5
+    warm_top_n: 200        # 启动时预热的查询数，0 关闭
+    warm_scan_lines: 20000 # 预热时读取的最近记录数
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.data_manager import normalize_query
+from app.utils.config import get_conf, get_snapshot
+from app.utils.logger import logger, add_jsonl_sink
+
+_sink_id: Optional[int] = None
+_sink_lock = threading.Lock()
+
+
+def _log_path() -> str:
+    return get_conf('monitoring.query_log.path', 'logs/queries.jsonl')
+
+
+def _ensure_sink() -> None:
+    global _sink_id
+    if _sink_id is not None:
+        return
+    with _sink_lock:
+        if _sink_id is None:
+            _sink_id = add_jsonl_sink(
+                'querylog',
+                _log_path(),
+                rotation=get_conf('monitoring.query_log.rotation', '50 MB'),
+                retention=int(get_conf('monitoring.query_log.retention', 5)),
+            )
+
+
+def log_query(kind: str, query: str, top_k: int, latency_ms: float, found: bool, cache_hit: bool,
+              level: Optional[str] = None) -> None:
+    """记录一次检索；kind 为 'query'（/api/query）或 'chat'"""
+    if not get_conf('monitoring.query_log.enabled', True):
+        return
+    try:
+        _ensure_sink()
+        record: Dict[str, Any] = {
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'kind': kind,
+            'q': normalize_query(query),
+            'top_k': top_k,
+            'ms': round(latency_ms, 3),
+            'found': found,
+            'cache': 'hit' if cache_hit else 'miss',
+        }
+        if level is not None:
+            record['level'] = level
+        logger.bind(sink='querylog').info(json.dumps(record, ensure_ascii=False))
+    except Exception as e:
+        logger.warning(f"Write query log failed: {e}")
+
+
+def read_query_log(path: Optional[str] = None, last: Optional[int] = None) -> List[Dict[str, Any]]:
+    """读取查询日志（可只取最后 last 条），跳过无法解析的行"""
+    path = path or _log_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = deque(f, maxlen=last) if last else list(f)
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('q'):
+            records.append(record)
+    return records
+
+
+def top_queries(records: List[Dict[str, Any]], top_n: int) -> List[Tuple[str, int]]:
+    """按出现次数排序的 (查询, top_k)"""
+    counts = Counter((r['q'], int(r.get('top_k') or 5)) for r in records)
+    return [key for key, _ in counts.most_common(top_n)]
+
+
+def warm_caches(top_n: Optional[int] = None) -> int:
+    """用最近的热门查询预热查询向量与检索结果缓存，返回预热的查询数"""
+    from app.core.retriever import cached_retrieve, get_semantic_retriever
+
+    top_n = int(get_conf('monitoring.query_log.warm_top_n', 200) if top_n is None else top_n)
+    if top_n <= 0:
+        return 0
+    started = time.perf_counter()
+    records = read_query_log(last=int(get_conf('monitoring.query_log.warm_scan_lines', 20000)))
+    alpha = get_snapshot().retrieval.fuse_alpha
+    retriever = get_semantic_retriever()
+    warmed = 0
+    for query, top_k in top_queries(records, top_n):
+        try:
+            cached_retrieve(query, top_k=top_k, alpha=alpha, semantic_retriever=retriever)
+            warmed += 1
+        except Exception as e:
+            logger.warning(f"Warm query failed: {e}")
+    if warmed:
+        logger.info(f"Warmed {warmed} recent queries in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return warmed
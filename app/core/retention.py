@@ -0,0 +1,250 @@
+"""
+数据保留模块
+按时间批量清理旧会话、清扫孤儿消息、归档冷数据，并通过增量 VACUUM 回收文件空间。
+每个批次使用独立的短事务，可在服务运行期间定时执行而不长时间占用写锁。
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from app.core.data_manager import (
+    get_conn, encode_archive, decode_archive, archive_codecs, archive_read_stats
+)
+from app.utils.logger import logger
+
+
+def _invalidate_cached_sessions(session_ids) -> None:
+    """让本进程活跃会话缓存中被清理/归档的会话失效（延迟导入，避免脚本加载检索器）"""
+    from app.core.chat_service import chat_service
+    for session_id in session_ids:
+        chat_service.cache.invalidate(session_id)
+
+
+def count_old_sessions(days: int) -> int:
+    """统计超过 days 天未更新的会话数量"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT COUNT(*) FROM chat_sessions WHERE updated_at < datetime('now', ?);",
+            (f"-{int(days)} days",)
+        )
+        return int(cur.fetchone()[0])
+
+
+def purge_old_sessions(days: int, batch_size: int = 500, max_batches: Optional[int] = None,
+                       pause: float = 0.0) -> Dict[str, int]:
+    """
+    分批删除超过 days 天未更新的会话及其消息
+    - batch_size：每个事务删除的会话数，控制单次持有写锁的时间
+    - max_batches：本次最多执行的批次数（None 表示直到删完）
+    - pause：批次之间的休眠秒数，给在线请求让出写锁
+    返回 {'sessions': 删除会话数, 'messages': 删除消息数, 'batches': 批次数}
+    """
+    cutoff = f"-{int(days)} days"
+    stats = {'sessions': 0, 'messages': 0, 'batches': 0}
+    while max_batches is None or stats['batches'] < max_batches:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT id FROM chat_sessions WHERE updated_at < datetime('now', ?) ORDER BY updated_at LIMIT ?;",
+                (cutoff, batch_size)
+            )
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            placeholders = ",".join("?" * len(ids))
+            # 先显式删除消息（走 session_id 索引），再删会话，避免逐行级联
+            cur.execute(f"DELETE FROM chat_messages WHERE session_id IN ({placeholders});", ids)
+            stats['messages'] += cur.rowcount
+            cur.execute(f"DELETE FROM chat_sessions WHERE id IN ({placeholders});", ids)
+            stats['sessions'] += cur.rowcount
+        _invalidate_cached_sessions(ids)
+        stats['batches'] += 1
+        logger.info(f"Retention batch {stats['batches']}: sessions={len(ids)}, total={stats['sessions']}")
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def count_orphan_messages() -> int:
+    """统计所属会话已不存在的消息数量"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COUNT(*) FROM chat_messages m
+            WHERE NOT EXISTS (SELECT 1 FROM chat_sessions s WHERE s.id = m.session_id);
+            """
+        )
+        return int(cur.fetchone()[0])
+
+
+def sweep_orphan_messages(batch_size: int = 5000, pause: float = 0.0) -> int:
+    """分批删除孤儿消息（外键未启用时期遗留的数据），返回删除条数"""
+    total = 0
+    while True:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                DELETE FROM chat_messages WHERE id IN (
+                    SELECT m.id FROM chat_messages m
+                    WHERE NOT EXISTS (SELECT 1 FROM chat_sessions s WHERE s.id = m.session_id)
+                    LIMIT ?
+                );
+                """,
+                (batch_size,)
+            )
+            deleted = cur.rowcount
+        total += deleted
+        if deleted < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    if total:
+        logger.info(f"Swept {total} orphan chat messages")
+    return total
+
+
+def archive_idle_sessions(days: int, batch_size: int = 100, codec: Optional[str] = None,
+                          max_batches: Optional[int] = None, pause: float = 0.0) -> Dict[str, int]:
+    """
+    将超过 days 天未更新的会话历史消息压缩归档到 chat_message_archive
+    每个会话保留最后一条消息在线，保证消息表的最大ID不会回退
+    （SQLite 会复用被删除的最大 rowid，否则新消息可能与归档消息ID冲突）
+    已有归档的会话再次空闲时会与新消息合并重新归档
+    返回 {'sessions', 'messages', 'raw_bytes', 'stored_bytes', 'batches'}
+    """
+    codec = codec or archive_codecs()[-1]
+    cutoff = f"-{int(days)} days"
+    stats = {'sessions': 0, 'messages': 0, 'raw_bytes': 0, 'stored_bytes': 0, 'batches': 0}
+    last_id = 0
+    while max_batches is None or stats['batches'] < max_batches:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT s.id FROM chat_sessions s
+                WHERE s.id > ? AND s.updated_at < datetime('now', ?)
+                  AND (SELECT COUNT(*) FROM chat_messages m WHERE m.session_id = s.id) > 1
+                ORDER BY s.id LIMIT ?;
+                """,
+                (last_id, cutoff, batch_size)
+            )
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            for session_id in ids:
+                cur.execute(
+                    "SELECT id, role, content, timestamp FROM chat_messages WHERE session_id = ? ORDER BY id ASC;",
+                    (session_id,)
+                )
+                live = [dict(row) for row in cur.fetchall()][:-1]
+                cur.execute(
+                    "SELECT codec, payload FROM chat_message_archive WHERE session_id = ?;", (session_id,)
+                )
+                existing = cur.fetchone()
+                messages = (decode_archive(existing['payload'], existing['codec']) if existing else []) + live
+                payload, raw_bytes = encode_archive(messages, codec)
+                # 不使用 INSERT OR REPLACE：REPLACE 的隐式删除不会触发统计触发器
+                values = (codec, len(messages), raw_bytes, len(payload), payload, session_id)
+                if existing:
+                    cur.execute(
+                        """
+                        UPDATE chat_message_archive
+                        SET codec = ?, message_count = ?, raw_bytes = ?, stored_bytes = ?, payload = ?,
+                            archived_at = CURRENT_TIMESTAMP
+                        WHERE session_id = ?;
+                        """,
+                        values
+                    )
+                else:
+                    cur.execute(
+                        """
+                        INSERT INTO chat_message_archive
+                            (codec, message_count, raw_bytes, stored_bytes, payload, session_id)
+                        VALUES (?, ?, ?, ?, ?, ?);
+                        """,
+                        values
+                    )
+                cur.execute(
+                    "DELETE FROM chat_messages WHERE session_id = ? AND id <= ?;",
+                    (session_id, live[-1]['id'])
+                )
+                stats['sessions'] += 1
+                stats['messages'] += len(live)
+                stats['raw_bytes'] += raw_bytes
+                stats['stored_bytes'] += len(payload)
+        _invalidate_cached_sessions(ids)
+        last_id = ids[-1]
+        stats['batches'] += 1
+        logger.info(f"Archive batch {stats['batches']}: sessions={len(ids)}, total={stats['sessions']}")
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def get_archive_stats() -> Dict[str, Any]:
+    """归档统计：节省的字节数与本进程内的回迁延迟"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COUNT(*), COALESCE(SUM(message_count), 0),
+                   COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(stored_bytes), 0)
+            FROM chat_message_archive;
+            """
+        )
+        sessions, messages, raw_bytes, stored_bytes = cur.fetchone()
+    read_stats = archive_read_stats()
+    reads = read_stats['reads']
+    return {
+        'sessions': sessions,
+        'messages': messages,
+        'raw_bytes': raw_bytes,
+        'stored_bytes': stored_bytes,
+        'saved_bytes': raw_bytes - stored_bytes,
+        'rehydrate_reads': reads,
+        'rehydrate_avg_ms': round(read_stats['total_ms'] / reads, 3) if reads else 0.0,
+        'rehydrate_max_ms': round(read_stats['max_ms'], 3),
+    }
+
+
+def incremental_vacuum(pages: int = 0) -> Dict[str, int]:
+    """
+    回收空闲页，让数据库文件真正缩小
+    pages 为 0 时回收全部空闲页；库未处于 INCREMENTAL 模式时只返回统计，
+    需先执行一次 enable_incremental_vacuum()
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        mode = cur.execute("PRAGMA auto_vacuum;").fetchone()[0]
+        before = cur.execute("PRAGMA freelist_count;").fetchone()[0]
+        if mode == 2:
+            cur.execute(f"PRAGMA incremental_vacuum({int(pages)});").fetchall()
+        else:
+            logger.warning("auto_vacuum is not INCREMENTAL, run enable_incremental_vacuum() once")
+        after = cur.execute("PRAGMA freelist_count;").fetchone()[0]
+    return {'auto_vacuum': mode, 'freed_pages': before - after, 'free_pages': after}
+
+
+def enable_incremental_vacuum() -> None:
+    """将已有库切换到 INCREMENTAL 模式（需要一次完整 VACUUM，会短暂锁库）"""
+    with get_conn() as conn:
+        conn.isolation_level = None
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("VACUUM;")
+    logger.info("Database switched to incremental auto_vacuum")
+
+
+def run_retention(days: int, batch_size: int = 500, vacuum_pages: int = 0,
+                  pause: float = 0.0) -> Dict[str, int]:
+    """执行一轮完整的保留策略：清理旧会话 → 清扫孤儿消息 → 增量 VACUUM"""
+    stats = purge_old_sessions(days, batch_size=batch_size, pause=pause)
+    stats['orphans'] = sweep_orphan_messages(pause=pause)
+    stats['freed_pages'] = incremental_vacuum(vacuum_pages)['freed_pages']
+    return stats
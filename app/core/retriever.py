@@ -1,8 +1,17 @@
 import os
+import time
+import threading
 from typing import List, Tuple, Optional
 from math import sqrt
 from app.utils.logger import logger
-from app.core.data_manager import search_bm25, get_all_faqs
+from app.utils.config import get_conf
+from app.utils.metrics import observe_stage, stage_timer
+from app.utils.cache import TTLCache
+from app.core import data_manager
+from app.core.data_manager import (
+    search_bm25, get_all_faqs, count_faqs, get_faqs_without_embedding, save_embeddings, load_embeddings,
+    get_faq_generation, normalize_query
+)
 
 # 语义检索依赖按需导入
 _USE_SEMANTIC = os.getenv("WONK_USE_SEMANTIC", "true").lower() == "true"
@@ -29,6 +38,19 @@ class SemanticRetriever:
         self.model = None
         self.embeddings: List[List[float]] = []
         self.id_map: List[int] = []
+        # 构建/增量维护缓存时的FAQ总数（供 /metrics 展示）
+        self.faq_count: Optional[int] = None
+        # 缓存所对应的FAQ数据代数（触发器维护，任何进程的增删改都会使其变化），查询侧据此判断缓存是否过期
+        self.faq_generation: Optional[int] = None
+        # 内存向量索引每次整体加载、增量修补或丢弃时递增，依赖索引内容的缓存据此失效
+        self.generation = 0
+        # 查询文本 → 向量；热门问题无需重复编码
+        self.query_cache = TTLCache(
+            max_size=int(get_conf('performance.vector_cache.max_size', 10000)),
+            ttl=get_conf('performance.vector_cache.ttl', 3600),
+            enabled=bool(get_conf('performance.vector_cache.enabled', True)),
+        )
+        self._lock = threading.Lock()
         self.available = False
         self._lazy_init()
 
@@ -57,40 +79,142 @@ class SemanticRetriever:
             self.available = False
             logger.warning(f"Semantic retrieval disabled: {st}")
 
-    def _encode(self, texts: List[str]) -> List[List[float]]:
+    @property
+    def model_tag(self) -> Optional[str]:
+        """存储向量时使用的模型标记，换模型后旧向量自动视为缺失"""
+        if self.backend == 'fastembed':
+            return f"fastembed:{self.fe_model_name}"
+        if self.backend == 'st':
+            return f"st:{self.st_model_name}"
+        return None
+
+    @staticmethod
+    def _batch_size() -> int:
+        return max(1, int(get_conf('models.batch_size', 32)))
+
+    def _encode(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        batch_size = batch_size or self._batch_size()
         if self.backend == 'fastembed':
             # fastembed 返回生成器，逐条获取
             embs: List[List[float]] = []
-            for e in self.model.embed(texts):
+            for e in self.model.embed(texts, batch_size=batch_size):
                 embs.append(list(e))
             return embs
         elif self.backend == 'st':
-            embs = self.model.encode(texts, convert_to_numpy=False, show_progress_bar=False)
+            embs = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=False,
+                                     show_progress_bar=False)
             # ensure python lists
             return [list(map(float, vec)) for vec in embs]
         else:
             return []
 
+    @staticmethod
+    def _faq_text(row) -> str:
+        return row["question"] + " \n" + row["answer"]
+
+    def embed_missing(self, chunk_size: int = 1000, batch_size: Optional[int] = None) -> int:
+        """为尚无当前模型向量的FAQ批量编码并持久化，返回新编码的条数"""
+        if not self.available:
+            return 0
+        total = 0
+        last_id = 0
+        while True:
+            rows = get_faqs_without_embedding(self.model_tag, limit=chunk_size, after_id=last_id)
+            if not rows:
+                break
+            embs = self._encode([self._faq_text(r) for r in rows], batch_size=batch_size)
+            save_embeddings(self.model_tag, [(r["id"], e) for r, e in zip(rows, embs)])
+            total += len(rows)
+            last_id = rows[-1]["id"]
+            if len(rows) < chunk_size:
+                break
+        if total:
+            logger.info(f"Encoded {total} faq embeddings, model={self.model_tag}")
+        return total
+
     def build_from_db(self):
+        """加载已存储的向量；仅对缺失的FAQ编码（正常情况下已在导入时完成）"""
         if not self.available:
             return
         try:
-            rows = get_all_faqs()
-            if not rows:
-                self.embeddings = []
-                self.id_map = []
-                return
-            texts = [r["question"] + " \n" + r["answer"] for r in rows]
-            ids = [r["id"] for r in rows]
-            embs = self._encode(texts)
-            self.embeddings = embs
-            self.id_map = ids
-            logger.info(f"Built vector cache from DB: {len(ids)} items, backend={self.backend}")
+            # 先读代数再加载：加载期间发生的修改会在下次 check_stale 时被发现
+            generation = get_faq_generation()
+            missing = self.embed_missing()
+            if missing:
+                logger.warning(f"{missing} faqs were encoded on the query path, "
+                               f"run scripts/build_embeddings.py after bulk imports")
+            count = count_faqs()
+            ids, embs = load_embeddings(self.model_tag)
+            with self._lock:
+                self.embeddings = embs
+                self.id_map = ids
+                self.faq_count = count
+                self.faq_generation = generation
+                self.generation += 1
+            logger.info(f"Loaded vector cache from DB: {len(ids)} items, backend={self.backend}")
         except Exception as e:
             logger.warning(f"Build vector cache failed: {e}")
             self.embeddings = []
             self.id_map = []
 
+    def check_stale(self) -> None:
+        """
+        FAQ 数据代数与缓存不一致时丢弃缓存，下次查询重新加载。代数由触发器维护（主键查找，无需 COUNT），
+        其他 worker/进程的导入与编辑同样会使其变化；本进程处理的编辑由 refresh_ids 增量修补并同步代数，不会走到这里
+        """
+        if not self.available or self.faq_generation is None:
+            return
+        with stage_timer('faq_generation'):
+            generation = get_faq_generation()
+        if generation != self.faq_generation:
+            with self._lock:
+                self.embeddings = []
+                self.faq_generation = None
+                self.generation += 1
+
+    def warm_up(self) -> None:
+        """预先加载向量缓存，避免首个请求承担加载耗时"""
+        if self.available and not self.embeddings:
+            self.build_from_db()
+
+    def refresh_ids(self, faq_ids: List[int], chunk_size: int = 500) -> int:
+        """
+        增量维护：只为受影响的FAQ重新编码，并就地替换内存中的向量；已删除的移出缓存
+        缓存尚未构建时只持久化向量，下次查询时整体加载。返回新编码的条数
+        编码前记录数据代数，修补时代数未变才同步（compare-and-set）；编码期间有其他编辑时
+        保留旧代数，由 check_stale 发现并整体重新加载，避免把未修补的修改当作已同步
+        """
+        if not self.available or not faq_ids:
+            return 0
+        generation = get_faq_generation()
+        encoded = 0
+        fresh_ids: List[int] = []
+        fresh_embs: list = []
+        faq_ids = sorted(set(faq_ids))
+        for i in range(0, len(faq_ids), chunk_size):
+            chunk = faq_ids[i:i + chunk_size]
+            rows = get_faqs_without_embedding(self.model_tag, limit=len(chunk), ids=chunk)
+            if rows:
+                embs = self._encode([self._faq_text(r) for r in rows])
+                save_embeddings(self.model_tag, [(r["id"], e) for r, e in zip(rows, embs)])
+                encoded += len(rows)
+            ids, embs = load_embeddings(self.model_tag, chunk)
+            fresh_ids.extend(ids)
+            fresh_embs.extend(embs)
+        with self._lock:
+            if self.embeddings:
+                affected = set(faq_ids)
+                pairs = [(rid, emb) for rid, emb in zip(self.id_map, self.embeddings) if rid not in affected]
+                pairs.extend(zip(fresh_ids, fresh_embs))
+                pairs.sort(key=lambda x: x[0])
+                self.id_map = [rid for rid, _ in pairs]
+                self.embeddings = [emb for _, emb in pairs]
+                self.faq_count = count_faqs()
+                if get_faq_generation() == generation:
+                    self.faq_generation = generation
+                self.generation += 1
+        return encoded
+
     def query(self, text: str, top_k: int = 10) -> List[Tuple[int, float]]:
         if not self.available:
             return []
@@ -98,15 +222,93 @@ class SemanticRetriever:
             self.build_from_db()
             if not self.embeddings:
                 return []
-        q = self._encode([text])[0]
+        with self._lock:
+            id_map, embeddings = self.id_map, self.embeddings
+        q = self.query_cache.get(text)
+        if q is None:
+            with stage_timer('embed'):
+                q = self._encode([text])[0]
+            self.query_cache.put(text, q)
         # 计算余弦相似度，返回 top_k
-        sims = []
-        for idx, emb in enumerate(self.embeddings):
-            sims.append((self.id_map[idx], _cosine(q, emb)))
-        sims.sort(key=lambda x: x[1], reverse=True)
+        with stage_timer('vector'):
+            sims = []
+            for idx, emb in enumerate(embeddings):
+                sims.append((id_map[idx], _cosine(q, emb)))
+            sims.sort(key=lambda x: x[1], reverse=True)
         return sims[:top_k]
 
 
+_shared: Optional[SemanticRetriever] = None
+_shared_lock = threading.Lock()
+
+
+def get_semantic_retriever() -> SemanticRetriever:
+    """进程内共享的语义检索器：模型只加载一次，查询与导入共用"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = SemanticRetriever()
+    return _shared
+
+
+def embed_missing_faqs(chunk_size: int = 1000, batch_size: Optional[int] = None) -> int:
+    """导入路径调用：为新写入的FAQ预计算向量；语义检索不可用时返回 0"""
+    if not _USE_SEMANTIC:
+        return 0
+    retriever = get_semantic_retriever()
+    if not retriever.available:
+        return 0
+    return retriever.embed_missing(chunk_size=chunk_size, batch_size=batch_size)
+
+
+def refresh_faq_vectors(faq_ids: List[int]) -> int:
+    """FAQ 更新/删除后调用：只重新编码并替换受影响的向量"""
+    if not _USE_SEMANTIC:
+        return 0
+    return get_semantic_retriever().refresh_ids(faq_ids)
+
+
+_result_cache: Optional[TTLCache] = None
+
+
+def get_result_cache() -> TTLCache:
+    """检索结果缓存（performance.query_cache）；键包含FAQ数据代数与向量索引代数，数据变化后旧结果自然失效"""
+    global _result_cache
+    if _result_cache is None:
+        with _shared_lock:
+            if _result_cache is None:
+                _result_cache = TTLCache(
+                    max_size=int(get_conf('performance.query_cache.max_size', 1000)),
+                    ttl=get_conf('performance.query_cache.ttl', 300),
+                    enabled=bool(get_conf('performance.query_cache.enabled', True)),
+                )
+    return _result_cache
+
+
+def cached_retrieve(query: str, top_k: int = 5, alpha: float = 0.5,
+                    semantic_retriever: Optional[SemanticRetriever] = None,
+                    timings: Optional[dict] = None, use_cache: bool = True):
+    """
+    带结果缓存的 retrieve；查询先经 normalize_query（只合并空白），与查询日志中的写法一致，
+    日志预热的结果可被真实请求命中。use_cache=False 时不读缓存（结果仍写回），
+    用于需要完整分阶段耗时的调试请求。返回 (bm25_rows, fused, 是否命中缓存)
+    """
+    query = normalize_query(query)
+    cache = get_result_cache()
+    sem_generation = -1
+    if _USE_SEMANTIC and semantic_retriever and semantic_retriever.available:
+        sem_generation = semantic_retriever.generation
+    key = (data_manager.DB_PATH, query, top_k, round(alpha, 4), get_faq_generation(), sem_generation)
+    cached = cache.get(key) if use_cache else None
+    if cached is not None:
+        return cached[0], cached[1], True
+    bm25_rows, fused = retrieve(query, top_k=top_k, alpha=alpha, semantic_retriever=semantic_retriever,
+                                timings=timings)
+    cache.put(key, (bm25_rows, fused))
+    return bm25_rows, fused, False
+
+
 def fuse_scores(bm25_results, semantic_scores: dict, alpha: float = 0.5) -> List[Tuple[int, float]]:
     # 归一化 BM25 分数（越小越好）→ 转为相似度
     if not bm25_results and not semantic_scores:
@@ -153,17 +355,32 @@ def _fuzzy_fallback(query: str, top_k: int = 5) -> List[Tuple[int, float]]:
 
 
 def retrieve(query: str, top_k: int = 5, alpha: float = 0.5,
-             semantic_retriever: Optional[SemanticRetriever] = None):
+             semantic_retriever: Optional[SemanticRetriever] = None,
+             timings: Optional[dict] = None):
+    """BM25 + 语义融合检索；各阶段耗时计入 /metrics，传入 timings 字典时另记一份（毫秒）"""
+    t0 = time.perf_counter()
     bm25_rows = search_bm25(query, top_k=top_k)
+    t1 = time.perf_counter()
     # 仅当可用时使用语义检索
     semantic_scores = {}
     if _USE_SEMANTIC and semantic_retriever and semantic_retriever.available:
         sem = semantic_retriever.query(query, top_k=top_k)
         semantic_scores = {rid: score for rid, score in sem}
+    t2 = time.perf_counter()
     fused = fuse_scores(bm25_rows, semantic_scores, alpha=alpha)
+    t3 = time.perf_counter()
+    observe_stage('bm25', t1 - t0)
+    observe_stage('fuse', t3 - t2)
+    if timings is not None:
+        timings['bm25'] = round((t1 - t0) * 1000, 3)
+        timings['semantic'] = round((t2 - t1) * 1000, 3)
+        timings['fuse'] = round((t3 - t2) * 1000, 3)
     if not fused:
         # 最后兜底：模糊匹配
         fuzzy = _fuzzy_fallback(query, top_k=top_k)
         fused = fuzzy
+        elapsed = time.perf_counter() - t3
+        observe_stage('fuzzy', elapsed)
+        if timings is not None:
+            timings['fuzzy'] = round(elapsed * 1000, 3)
     return bm25_rows, fused
-
@@ -0,0 +1,209 @@
+"""
+会话缓存模块
+进程内有界 LRU：缓存活跃会话的元数据、用户→最近会话映射以及最近若干条消息，
+写消息时同步写入（write-through），删除会话时失效；热会话的聊天与历史查看无需读库。
+缓存按进程独立，所有写入需经过 ChatService 才能保持一致；过期时间兜底进程外的修改（如保留任务）。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class _Entry:
+    __slots__ = ('meta', 'tail', 'complete', 'expires', 'version')
+
+    def __init__(self, meta: Optional[Dict[str, Any]], expires: float):
+        self.meta = meta
+        # 按ID正序的最近消息；None 表示尚未加载
+        self.tail: Optional[List[Dict[str, Any]]] = None
+        # tail 是否包含该会话的全部消息
+        self.complete = False
+        self.expires = expires
+        # 每写入一条消息递增，用于丢弃与并发写入交错的读库结果
+        self.version = 0
+
+
+class SessionCache:
+    """有界 LRU + TTL 的会话缓存，线程安全"""
+
+    KINDS = ('session', 'latest', 'history')
+
+    def __init__(self, max_sessions: int = 1024, ttl: float = 600.0, tail_size: int = 50, enabled: bool = True):
+        self.max_sessions = max(1, int(max_sessions))
+        self.ttl = float(ttl)
+        self.tail_size = max(1, int(tail_size))
+        self.enabled = enabled
+        self._sessions: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self._latest: 'OrderedDict[Optional[str], tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {k: 0 for k in self.KINDS}
+        self._misses = {k: 0 for k in self.KINDS}
+
+    # ---- 内部工具 ----
+
+    def _entry(self, session_id: int, now: float) -> Optional[_Entry]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry.expires < now:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _ensure(self, session_id: int, now: float) -> _Entry:
+        entry = self._entry(session_id, now)
+        if entry is None:
+            entry = _Entry(None, now + self.ttl)
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            entry.expires = now + self.ttl
+        return entry
+
+    def _count(self, kind: str, hit: bool) -> None:
+        if hit:
+            self._hits[kind] += 1
+        else:
+            self._misses[kind] += 1
+
+    # ---- 会话元数据 ----
+
+    def get_session(self, session_id: int) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entry(session_id, time.monotonic())
+            meta = entry.meta if entry else None
+            self._count('session', meta is not None)
+            return meta
+
+    def put_session(self, meta: Dict[str, Any], new: bool = False) -> None:
+        """缓存会话元数据；new=True 表示刚创建的空会话，消息列表可直接视为完整"""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._ensure(meta['id'], time.monotonic())
+            entry.meta = dict(meta)
+            if new:
+                entry.tail = []
+                entry.complete = True
+
+    # ---- 用户 → 最近会话 ----
+
+    def get_latest(self, user_id: Optional[str]) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._latest.get(user_id)
+            now = time.monotonic()
+            if item is not None and (item[1] < now or item[0] not in self._sessions):
+                del self._latest[user_id]
+                item = None
+            if item is not None:
+                self._latest.move_to_end(user_id)
+            self._count('latest', item is not None)
+            return item[0] if item else None
+
+    def set_latest(self, user_id: Optional[str], session_id: int) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._latest[user_id] = (session_id, time.monotonic() + self.ttl)
+            self._latest.move_to_end(user_id)
+            while len(self._latest) > self.max_sessions:
+                self._latest.popitem(last=False)
+
+    # ---- 最近消息 ----
+
+    def get_messages(self, session_id: int, limit: int, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """能由缓存的消息尾部完整回答时返回结果（语义同 get_chat_messages），否则返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entry(session_id, time.monotonic())
+            result = None
+            if entry is not None and entry.tail is not None:
+                tail = entry.tail
+                # tail 包含 id >= tail[0].id 的全部消息
+                if after_id is not None:
+                    if entry.complete or (tail and after_id >= tail[0]['id']):
+                        result = [m for m in tail if m['id'] > after_id][:limit]
+                else:
+                    older = tail if before_id is None else [m for m in tail if m['id'] < before_id]
+                    if entry.complete or len(older) >= limit:
+                        result = older[-limit:] if limit > 0 else []
+            self._count('history', result is not None)
+            return [dict(m) for m in result] if result is not None else None
+
+    def message_version(self, session_id: int) -> int:
+        """读库前取版本号，put_messages 时传回"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry.version if entry else 0
+
+    def put_messages(self, session_id: int, messages: List[Dict[str, Any]], complete: bool,
+                     version: int = 0) -> None:
+        """缓存从库中读到的最新一页消息（必须是不带游标的查询结果）；读库期间有新消息写入时放弃"""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._ensure(session_id, time.monotonic())
+            if entry.version != version:
+                return
+            entry.tail = [dict(m) for m in messages[-self.tail_size:]]
+            entry.complete = complete and len(messages) <= self.tail_size
+
+    def record_message(self, session_id: int, user_id: Optional[str], message: Dict[str, Any]) -> None:
+        """写穿：新消息追加到尾部，并推进会话更新时间与用户最近会话"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._ensure(session_id, now)
+            entry.version += 1
+            if entry.meta is not None:
+                entry.meta['updated_at'] = message.get('timestamp')
+            if entry.tail is not None:
+                tail = entry.tail
+                # 并发写入同一会话时按ID有序插入
+                pos = len(tail)
+                while pos and tail[pos - 1]['id'] > message['id']:
+                    pos -= 1
+                tail.insert(pos, dict(message))
+                if len(tail) > self.tail_size:
+                    del tail[0]
+                    entry.complete = False
+            self._latest[user_id] = (session_id, now + self.ttl)
+            self._latest.move_to_end(user_id)
+            while len(self._latest) > self.max_sessions:
+                self._latest.popitem(last=False)
+
+    def invalidate(self, session_id: int) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            for user_id in [u for u, (sid, _) in self._latest.items() if sid == session_id]:
+                del self._latest[user_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._latest.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = {
+                'enabled': self.enabled,
+                'sessions': len(self._sessions),
+                'users': len(self._latest),
+            }
+            for kind in self.KINDS:
+                hits, misses = self._hits[kind], self._misses[kind]
+                total = hits + misses
+                result[kind] = {'hits': hits, 'misses': misses,
+                                'hit_ratio': round(hits / total, 4) if total else 0.0}
+            return result
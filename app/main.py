@@ -1,29 +1,76 @@
-from fastapi import FastAPI
+import threading
+import time
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.sessions import SessionMiddleware
 from app.utils.logger import logger
+from app.utils.ratelimit import RateLimitMiddleware, rate_limit_stats
+from app.utils.config import get_conf
+from app.utils.auth import get_session_secret, is_metrics_request
+from app.utils import metrics
 
 app = FastAPI(title="Wonk Chatbot API", version="0.1.0")
 
-# CORS 允许本机和简单前端
+# 限流与排队（security.rate_limit）；最先添加即位于最内层，可读取会话中的 user_id，
+# 被拒绝的响应仍经过 CORS 处理
+app.add_middleware(RateLimitMiddleware)
+
+
+class ApiCORSMiddleware(CORSMiddleware):
+    """
+    CORS 只作用于 /api/*（管理员 Bearer 令牌鉴权，不依赖 Cookie，因此不允许携带凭据）；
+    聊天页面与 /chat、/sessions 靠会话 Cookie 识别用户，只允许同源访问
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not (scope['path'] == '/api' or scope['path'].startswith('/api/')):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# CORS 允许本机和简单前端调用 /api/*；来源等由配置 cors.* 指定（修改后需重启）
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    ApiCORSMiddleware,
+    allow_origins=get_conf('cors.allow_origins', ["*"]),
+    allow_credentials=bool(get_conf('cors.allow_credentials', False)),
+    allow_methods=get_conf('cors.allow_methods', ["*"]),
+    allow_headers=get_conf('cors.allow_headers', ["*"]),
+)
+
+# 聊天页面的用户ID保存在签名 Cookie 中
+app.add_middleware(
+    SessionMiddleware,
+    secret_key=get_session_secret(),
+    max_age=30 * 24 * 3600,
 )
 
 # 导入并注册路由
 from app.api.query import router as query_router
 from app.api.manage import router as manage_router
 from app.api.config_api import router as config_router
+from app.api.chat import router as chat_router, STATIC_DIR
+from app.core.chat_service import chat_service
+from app.core.retriever import get_semantic_retriever, get_result_cache
 
 app.include_router(query_router)
 app.include_router(manage_router)
 app.include_router(config_router)
+app.include_router(chat_router)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+
 
-@app.get("/")
-def root():
+@app.on_event("startup")
+def warm_up():
+    # 后台预热检索模型与向量缓存，不阻塞启动
+    threading.Thread(target=chat_service.warm_up, daemon=True).start()
+
+
+@app.get("/api")
+def api_info():
     return {
         "name": "Wonk Chatbot API",
         "version": "0.1.0",
@@ -31,6 +78,8 @@ def root():
         "endpoints": {
             "health": "/health",
             "docs": "/docs",
+            "chat": "POST /chat",
+            "sessions": "/sessions",
             "query": "POST /api/query",
             "config": "/api/config",
             "ingest": "POST /api/ingest"
@@ -40,5 +89,64 @@ def root():
 @app.get("/health")
 def health():
     logger.info("Health check OK")
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "timestamp": time.time(),
+        "session_cache": chat_service.cache_stats(),
+        "rate_limit": rate_limit_stats()
+    }
+
+
+def _register_gauges():
+    """抓取时读取的规模与命中率指标，均来自内存中的计数，不查库"""
+    cache_kinds = chat_service.cache.KINDS
+    metrics.register_gauge(
+        'wonk_session_cache_lookups_total', 'Session cache lookups by kind and result',
+        lambda: {(k, r): chat_service.cache_stats()[k][r + 's'] for k in cache_kinds for r in ('hit', 'miss')},
+        ('kind', 'result'), kind='counter')
+    metrics.register_gauge(
+        'wonk_session_cache_hit_ratio', 'Session cache hit ratio by kind',
+        lambda: {(k,): chat_service.cache_stats()[k]['hit_ratio'] for k in cache_kinds}, ('kind',))
+    metrics.register_gauge('wonk_session_cache_sessions', 'Sessions held in the session cache',
+                           lambda: chat_service.cache_stats()['sessions'])
+    caches = {
+        'query_vector': lambda: get_semantic_retriever().query_cache,
+        'result': get_result_cache,
+    }
+    metrics.register_gauge(
+        'wonk_cache_lookups_total', 'Query vector / retrieval result cache lookups',
+        lambda: {(name, r): getattr(get(), r + 's') for name, get in caches.items() for r in ('hit', 'miss')},
+        ('cache', 'result'), kind='counter')
+    metrics.register_gauge(
+        'wonk_cache_entries', 'Entries held in the query vector / retrieval result caches',
+        lambda: {(name,): len(get()) for name, get in caches.items()}, ('cache',))
+    metrics.register_gauge('wonk_vector_index_size', 'Vectors loaded in the in-memory semantic index',
+                           lambda: len(get_semantic_retriever().id_map))
+    metrics.register_gauge('wonk_vector_index_generation', 'Reloads and patches of the in-memory semantic index',
+                           lambda: get_semantic_retriever().generation, kind='counter')
+    metrics.register_gauge('wonk_index_faqs', 'FAQ count when the semantic index was last built or patched',
+                           lambda: get_semantic_retriever().faq_count)
+    metrics.register_gauge(
+        'wonk_rate_limit_rejections_total', 'Requests rejected by the rate limiter (429) or the in-flight gate (503)',
+        lambda: {('429',): rate_limit_stats().get('limited', 0), ('503',): rate_limit_stats().get('rejected', 0)},
+        ('status',), kind='counter')
+    metrics.register_gauge('wonk_inflight_requests', 'Requests currently admitted by the in-flight gate',
+                           lambda: rate_limit_stats().get('inflight', 0))
+    metrics.register_gauge('wonk_queued_requests', 'Requests waiting in the in-flight gate queue',
+                           lambda: rate_limit_stats().get('waiting', 0))
+
+
+_register_gauges()
+
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(authorized: bool = Depends(is_metrics_request)):
+    """
+    Prometheus 文本格式指标；默认关闭，monitoring.metrics.enabled 为 true 时才开放（否则 404），
+    并且需要携带管理员token或 WONK_METRICS_TOKEN（Bearer），否则 401
+    """
+    if not get_conf('monitoring.metrics.enabled', False):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return Response(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
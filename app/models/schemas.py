@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class FAQItem(BaseModel):
@@ -13,6 +13,8 @@ class FAQItem(BaseModel):
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    # 需携带管理员token：在响应中返回各阶段耗时
+    debug: bool = False
 
 class Candidate(BaseModel):
     question: str
@@ -27,10 +29,36 @@ class QueryResponse(BaseModel):
     source_id: Optional[int] = None
     candidates: List[Candidate] = Field(default_factory=list)
     trace_id: Optional[str] = None
+    # 仅管理员 debug=true 时返回（毫秒）
+    timings: Optional[Dict[str, float]] = None
 
 class IngestRequest(BaseModel):
     items: List[FAQItem]
-    rebuild_index: bool = True
+    # 写入由触发器增量索引；全量重建仅用于修复
+    rebuild_index: bool = False
+    optimize_index: bool = False
+    # 近似重复处理：off 不检测 / flag 照常写入并在响应中标出 / skip 跳过近似重复项
+    near_duplicates: str = Field(default="off", description="off/flag/skip")
+    near_duplicate_threshold: float = 0.8
+    # 写入后为新FAQ预计算向量；离线批量导入可关闭，改用 scripts/build_embeddings.py
+    embed: bool = True
+
+class FAQUpdate(BaseModel):
+    # 部分更新：只写入请求中给出的字段
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    language: Optional[str] = None
+    tags: Optional[List[str]] = None
+    source: Optional[str] = None
+
+class FAQBulkUpdateItem(FAQUpdate):
+    id: int
+
+class FAQBulkUpdateRequest(BaseModel):
+    items: List[FAQBulkUpdateItem]
+
+class FAQBulkDeleteRequest(BaseModel):
+    ids: List[int]
 
 # 聊天相关模型
 class ChatSession(BaseModel):
@@ -58,4 +86,10 @@ class ChatResponse(BaseModel):
     message_id: Optional[int] = None
     timestamp: Optional[datetime] = None
     error: Optional[str] = None
+    session: Optional[Dict[str, Any]] = None
+    # 检索命中的FAQ与置信度；低置信度回退内置回复时 source_id 为空
+    source_id: Optional[int] = None
+    confidence: Optional[float] = None
+    # 各阶段耗时（毫秒）
+    timings: Optional[Dict[str, float]] = None
 
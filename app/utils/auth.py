@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.utils.logger import logger
@@ -16,6 +17,10 @@ def get_admin_token() -> str:
         return default_token
     return token
 
+def get_session_secret() -> str:
+    """聊天会话 Cookie 的签名密钥，优先从环境变量 WONK_SECRET_KEY 读取"""
+    return os.getenv('WONK_SECRET_KEY', 'wonk-chatbot-secret-key-change-in-production')
+
 def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> bool:
     """验证管理员token"""
     expected_token = get_admin_token()
@@ -31,6 +36,23 @@ def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     logger.info("Admin token verified successfully")
     return True
 
+optional_security = HTTPBearer(auto_error=False)
+
+def is_admin_request(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> bool:
+    """可选鉴权：携带有效管理员token时返回 True，未携带或无效时返回 False（不拒绝请求）"""
+    if credentials is None:
+        return False
+    return credentials.credentials == get_admin_token()
+
+def is_metrics_request(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> bool:
+    """/metrics 鉴权：接受管理员token，或环境变量 WONK_METRICS_TOKEN 设置的只读抓取token"""
+    if credentials is None:
+        return False
+    metrics_token = os.getenv('WONK_METRICS_TOKEN')
+    if metrics_token and credentials.credentials == metrics_token:
+        return True
+    return credentials.credentials == get_admin_token()
+
 def require_admin_auth():
     """管理员鉴权依赖，用于保护管理接口"""
     return Depends(verify_admin_token)
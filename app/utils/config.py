@@ -1,12 +1,35 @@
+import copy
 import os
+import tempfile
+import threading
+import time
 import yaml
 from functools import lru_cache
-from typing import Any, Dict
+from typing import Any, Dict, NamedTuple, Optional
 
 CONFIG_PATH = os.getenv('WONK_CONFIG', 'config.yaml')
+# 配置文件 mtime 的检查间隔（秒），热路径上最多每隔这么久 stat 一次
+CONFIG_CHECK_INTERVAL = float(os.getenv('WONK_CONFIG_CHECK_INTERVAL', '1.0'))
+
+# 配置版本号：每次缓存失效时递增，依赖配置编译出的结构（如意图匹配器）据此判断是否需要重建
+_config_version = 0
+_loaded_mtime: Optional[int] = None
+_last_check = 0.0
+# 串行化本进程内的“读-改-写”，避免并发 update_conf 互相覆盖对方的修改
+_write_lock = threading.RLock()
+
+
+def _config_mtime() -> Optional[int]:
+    try:
+        return os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return None
+
 
 @lru_cache(maxsize=1)
 def load_config() -> Dict[str, Any]:
+    global _loaded_mtime
+    _loaded_mtime = _config_mtime()
     try:
         with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
             data = yaml.safe_load(f)
@@ -16,20 +39,61 @@ def load_config() -> Dict[str, Any]:
 
 
 def reload_config_cache():
+    global _config_version
     try:
         load_config.cache_clear()
     except Exception:
         pass
+    _config_version += 1
+
+
+def config_version() -> int:
+    return _config_version
+
+
+def check_config_changed(interval: Optional[float] = None) -> bool:
+    """
+    节流检查配置文件是否被外部修改：距上次检查不足 interval 秒时直接返回 False；
+    mtime 与加载时不同则清空缓存并递增版本号，返回 True
+    """
+    global _last_check
+    now = time.monotonic()
+    if now - _last_check < (CONFIG_CHECK_INTERVAL if interval is None else interval):
+        return False
+    _last_check = now
+    load_config()
+    if _config_mtime() != _loaded_mtime:
+        reload_config_cache()
+        return True
+    return False
 
 
 def save_config(data: Dict[str, Any]) -> None:
-    # 确保目录存在
+    """
+    先写同目录下的临时文件再 os.replace 原子替换：其他进程按 mtime 重新加载时
+    不会读到写了一半的 YAML（解析失败会被当作空配置）；临时文件名由 mkstemp 生成，
+    同一进程内的并发写入也不会共用同一个临时文件
+    """
     d = os.path.dirname(CONFIG_PATH)
     if d and not os.path.exists(d):
         os.makedirs(d, exist_ok=True)
-    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-        yaml.safe_dump(data, f, sort_keys=False, allow_unicode=True)
-    reload_config_cache()
+    with _write_lock:
+        fd, tmp_path = tempfile.mkstemp(dir=d or '.', prefix=f"{os.path.basename(CONFIG_PATH)}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                yaml.safe_dump(data, f, sort_keys=False, allow_unicode=True)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp 创建的文件权限为 0600，沿用原配置文件的权限
+            try:
+                os.chmod(tmp_path, os.stat(CONFIG_PATH).st_mode & 0o777)
+            except OSError:
+                pass
+            os.replace(tmp_path, CONFIG_PATH)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        reload_config_cache()
 
 
 def get_conf(path: str, default=None):
@@ -44,14 +108,68 @@ def get_conf(path: str, default=None):
 
 
 def set_conf(path: str, value: Any) -> Dict[str, Any]:
-    data = load_config() or {}
-    cur = data
-    parts = path.split('.')
-    for p in parts[:-1]:
-        if p not in cur or not isinstance(cur[p], dict):
-            cur[p] = {}
-        cur = cur[p]
-    cur[parts[-1]] = value
-    save_config(data)
+    return update_conf({path: value})
+
+
+def update_conf(values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按点分路径一次修改多项并只写一次文件；在副本上修改，不影响其他线程正在读取的缓存。
+    整个读-改-写持有模块锁，并发调用按顺序生效，不会丢失彼此的修改
+    """
+    with _write_lock:
+        data = copy.deepcopy(load_config() or {})
+        for path, value in values.items():
+            cur = data
+            parts = path.split('.')
+            for p in parts[:-1]:
+                if p not in cur or not isinstance(cur[p], dict):
+                    cur[p] = {}
+                cur = cur[p]
+            cur[parts[-1]] = value
+        save_config(data)
     return data
 
+
+class RetrievalConfig(NamedTuple):
+    top_k: int
+    fuse_alpha: float
+    high: float
+    low: float
+
+
+class ConfigSnapshot(NamedTuple):
+    """热路径使用的配置快照：解析与类型转换只在配置变化时做一次，之后只读属性"""
+    version: int
+    retrieval: RetrievalConfig
+
+
+_snapshot: Optional[ConfigSnapshot] = None
+
+
+def _build_snapshot(version: int) -> ConfigSnapshot:
+    return ConfigSnapshot(
+        version=version,
+        retrieval=RetrievalConfig(
+            top_k=int(get_conf('retrieval.top_k', 5)),
+            fuse_alpha=float(get_conf('retrieval.fuse_alpha', 0.5)),
+            high=float(get_conf('retrieval.confidence_threshold.high', 0.8)),
+            low=float(get_conf('retrieval.confidence_threshold.low', 0.5)),
+        ),
+    )
+
+
+def get_snapshot() -> ConfigSnapshot:
+    """
+    当前配置快照。每个进程经 check_config_changed 节流检查文件 mtime，
+    任一 worker 经 API 写入配置后，其他 worker 最迟 CONFIG_CHECK_INTERVAL 秒内换用新快照；
+    快照不可变，整体替换引用，读取方不会看到新旧混合的值
+    """
+    global _snapshot
+    check_config_changed()
+    snapshot = _snapshot
+    version = _config_version
+    if snapshot is None or snapshot.version != version:
+        snapshot = _build_snapshot(version)
+        _snapshot = snapshot
+    return snapshot
+
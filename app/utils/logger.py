@@ -3,8 +3,22 @@ import sys
 
 # 基础日志配置
 logger.remove()
+# 绑定了 sink 的记录（慢查询日志、查询日志）只写入各自的文件，不输出到控制台
 logger.add(sys.stderr, level="INFO", enqueue=True, backtrace=False, diagnose=False,
+           filter=lambda record: 'sink' not in record['extra'],
            format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>")
 
-__all__ = ["logger"]
+
+
+def add_jsonl_sink(name: str, path: str, rotation: str = "10 MB", retention: int = 5) -> int:
+    """
+    添加只接收 logger.bind(sink=name) 记录的文件 sink：消息原样写为一行，
+    经 enqueue 队列由后台线程写盘，按大小轮转；返回 sink id
+    """
+    return logger.add(path, format="{message}", level="INFO", enqueue=True,
+                      filter=lambda record: record['extra'].get('sink') == name,
+                      rotation=rotation, retention=retention, encoding='utf-8')
+
+
+__all__ = ["logger", "add_jsonl_sink"]
 
@@ -0,0 +1,238 @@
+"""
+指标模块（Prometheus 文本格式）
+热路径只写当前线程自己的计数单元（threading.local），不加锁；线程首次写入某个指标时登记一次单元，
+/metrics 抓取时再把各线程的单元汇总。汇总读到的可能是某次写入之前或之后的值，对监控来说足够。
+
+    from app.utils.metrics import stage_timer, observe_stage
+    with stage_timer('bm25'):
+        rows = search_bm25(q)
+
+规模类指标（缓存命中率、索引大小等）用 register_gauge 注册回调，只在抓取时计算。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+from app.utils.tracing import add_span
+
+# 秒；覆盖从亚毫秒的缓存命中到数秒的模型编码
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List['_Metric'] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _fmt(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        with _registry_lock:
+            _registry.append(self)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class _Cells:
+    """某个标签组合下按线程分开的计数单元"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._all: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def mine(self) -> List[float]:
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            cell = [0.0] * self.size
+            self._local.cell = cell
+            with self._lock:
+                self._all.append(cell)
+        return cell
+
+    def total(self) -> List[float]:
+        with self._lock:
+            cells = list(self._all)
+        result = [0.0] * self.size
+        for cell in cells:
+            for i, v in enumerate(cell):
+                result[i] += v
+        return result
+
+
+class _Labelled(_Metric):
+    """按标签值缓存子单元；新标签组合创建时加锁，之后的读写都不加锁"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._children: Dict[Tuple[str, ...], _Cells] = {}
+        self._children_lock = threading.Lock()
+
+    def _cell_size(self) -> int:
+        raise NotImplementedError
+
+    def _child(self, values: Tuple[str, ...]) -> _Cells:
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = _Cells(self._cell_size())
+        return child
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], List[float]]]:
+        with self._children_lock:
+            children = sorted(self._children.items())
+        return [(values, child.total()) for values, child in children]
+
+
+class Counter(_Labelled):
+    kind = 'counter'
+
+    def _cell_size(self) -> int:
+        return 1
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self._child(labelvalues).mine()[0] += amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._child(labelvalues).total()[0]
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, total in self._items():
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {_fmt(total[0])}')
+        return lines
+
+
+class Histogram(_Labelled):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _cell_size(self) -> int:
+        # 各桶计数（非累计，最后一个为 +Inf）+ sum + count
+        return len(self.buckets) + 3
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        cell = self._child(labelvalues).mine()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def snapshot(self, *labelvalues: str) -> Dict[str, float]:
+        total = self._child(labelvalues).total()
+        return {'count': total[-1], 'sum': total[-2]}
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, total in self._items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), total):
+                cumulative += count
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {_fmt(cumulative)}')
+            labels = _labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_fmt(total[-2])}')
+            lines.append(f'{self.name}_count{labels} {_fmt(total[-1])}')
+        return lines
+
+
+GaugeValue = Union[float, Dict[Tuple[str, ...], float]]
+
+
+class _Callback(_Metric):
+    def __init__(self, name: str, help_text: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = (),
+                 kind: str = 'gauge'):
+        self.kind = kind
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            # 回调失败时不输出样本，不影响其他指标
+            return []
+        lines = self.header()
+        if isinstance(value, dict):
+            for values, v in sorted(value.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, values)} {_fmt(v)}')
+        elif value is not None:
+            lines.append(f'{self.name} {_fmt(value)}')
+        return lines
+
+
+def register_gauge(name: str, help_text: str, fn: Callable[[], GaugeValue],
+                   labelnames: Sequence[str] = (), kind: str = 'gauge') -> None:
+    """
+    注册抓取时计算的指标；fn 返回数值，或 {标签值元组: 数值}；重复注册同名指标时替换回调
+    已由其他模块累计的单调计数（如会话缓存命中数）传 kind='counter'
+    """
+    with _registry_lock:
+        for metric in _registry:
+            if metric.name == name and isinstance(metric, _Callback):
+                metric.fn = fn
+                return
+    _Callback(name, help_text, fn, labelnames, kind)
+
+
+STAGE_SECONDS = Histogram('wonk_stage_duration_seconds', 'Time spent per request stage', ('stage',))
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """计入阶段直方图，并累加到当前请求的 Trace（见 app.utils.tracing）"""
+    STAGE_SECONDS.observe(seconds, stage)
+    add_span(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """记录代码块耗时到 wonk_stage_duration_seconds{stage=...}（异常时同样记录）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def render_metrics() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
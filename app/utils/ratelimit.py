@@ -0,0 +1,229 @@
+"""
+请求限流模块
+- TokenBucketLimiter：按 IP 与用户的令牌桶，键按哈希分片，每个分片一把锁，并发请求很少争用同一把锁；
+  每个分片只保留有限个键（LRU 淘汰），异常流量不会撑爆内存。
+- InflightGate：限制同时处理的请求数，超出部分在有界队列中等待；队列已满或等待超时立即返回 503，
+  避免请求无限堆积导致所有人的延迟一起崩溃。
+- RateLimitMiddleware：ASGI 中间件，对配置的路径（默认 /chat 与 /api/query）先限流再排队，
+  放行的响应带 X-Queue-Wait-Ms 头报告排队耗时。
+
+配置（security.rate_limit，修改后自动生效）：
+    enabled: true
+    requests_per_minute: 60   # 每个 IP（及每个用户）的平均速率
+    burst: 20                 # 令牌桶容量，允许的瞬时突发
+    paths: ["/chat", "/api/query"]
+    max_inflight: 32          # 同时处理的请求上限
+    max_queue: 64             # 排队上限，超出直接 503
+    queue_timeout_ms: 2000    # 排队超时
+"""
+
+import asyncio
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.config import get_conf, check_config_changed, config_version
+from app.utils.logger import logger
+
+
+class TokenBucketLimiter:
+    """分片令牌桶：allow(key) 返回 (是否放行, 建议重试等待秒数)"""
+
+    def __init__(self, rate: float, burst: float, shards: int = 16, max_keys: int = 100000):
+        # rate：每秒补充的令牌数
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.shards = max(1, int(shards))
+        self._max_keys = max(1, int(max_keys) // self.shards)
+        self._buckets: List['OrderedDict[str, List[float]]'] = [OrderedDict() for _ in range(self.shards)]
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+
+    def allow(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        shard = zlib.crc32(key.encode('utf-8')) % self.shards if self.shards > 1 else 0
+        buckets = self._buckets[shard]
+        now = time.monotonic()
+        with self._locks[shard]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                # [剩余令牌, 上次补充时间]
+                bucket = buckets[key] = [self.burst, now]
+                if len(buckets) > self._max_keys:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, 0.0
+            return False, (cost - bucket[0]) / self.rate if self.rate > 0 else 60.0
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self._buckets)
+
+
+class InflightGate:
+    """有界并发 + 有界排队；acquire 返回 (是否放行, 排队毫秒数)"""
+
+    def __init__(self, max_inflight: int, max_queue: int, timeout: float):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = float(timeout)
+        self.waiting = 0
+        self.inflight = 0
+        self.rejected = 0
+        # Semaphore 需在事件循环中创建（Python 3.6 下会绑定创建时的 loop）
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> Tuple[bool, float]:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_inflight)
+        if not self._sem.locked():
+            await self._sem.acquire()
+            self.inflight += 1
+            return True, 0.0
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False, 0.0
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False, (time.monotonic() - started) * 1000
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+        return True, (time.monotonic() - started) * 1000
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._sem.release()
+
+
+_middleware: Optional['RateLimitMiddleware'] = None
+
+
+def rate_limit_stats() -> Dict[str, Any]:
+    """限流计数（供 /health 展示）；未安装中间件时只返回 enabled=False"""
+    return _middleware.stats() if _middleware is not None else {'enabled': False}
+
+
+class RateLimitMiddleware:
+    """
+    ASGI 限流中间件：始终按客户端 IP（uvicorn --proxy-headers 下为 X-Forwarded-For 中的真实地址）限流，
+    放在 SessionMiddleware 内侧时再叠加会话中 user_id 的桶
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._version = -1
+        self.enabled = False
+        self.paths: Tuple[str, ...] = ()
+        self.limiter: Optional[TokenBucketLimiter] = None
+        self.gate: Optional[InflightGate] = None
+        self.limited = 0
+        global _middleware
+        _middleware = self
+
+    def _reload(self) -> None:
+        conf = get_conf('security.rate_limit', {}) or {}
+        self.enabled = bool(conf.get('enabled', False))
+        self.paths = tuple(conf.get('paths') or ('/chat', '/api/query'))
+        rpm = float(conf.get('requests_per_minute', 60))
+        rate, burst = rpm / 60.0, max(1.0, float(conf.get('burst', max(1.0, rpm / 3))))
+        # 参数不变时保留原令牌桶：无关的配置修改（如调整 fuse_alpha）不会清空各客户端的桶、重新给满突发额度
+        if self.limiter is None or (self.limiter.rate, self.limiter.burst) != (rate, burst):
+            self.limiter = TokenBucketLimiter(rate, burst)
+        gate = (int(conf.get('max_inflight', 32)), int(conf.get('max_queue', 64)),
+                float(conf.get('queue_timeout_ms', 2000)) / 1000)
+        # 参数不变时保留原闸门，正在处理与排队中的请求不受配置变更影响
+        if self.gate is None or (self.gate.max_inflight, self.gate.max_queue, self.gate.timeout) != gate:
+            self.gate = InflightGate(*gate)
+        self._version = config_version()
+        if self.enabled:
+            logger.info(f"Rate limit: {rpm:g}/min burst {self.limiter.burst:g} on {list(self.paths)}, "
+                        f"inflight {self.gate.max_inflight} queue {self.gate.max_queue}")
+
+    def stats(self) -> Dict[str, Any]:
+        gate = self.gate
+        return {
+            'enabled': self.enabled,
+            'limited': self.limited,
+            'rejected': gate.rejected if gate else 0,
+            'inflight': gate.inflight if gate else 0,
+            'waiting': gate.waiting if gate else 0,
+            'keys': len(self.limiter) if self.limiter else 0,
+        }
+
+    def _match(self, path: str) -> bool:
+        return any(path == p or path.startswith(p.rstrip('/') + '/') for p in self.paths)
+
+    @staticmethod
+    def _client_keys(scope) -> List[str]:
+        """
+        每个请求都计入客户端 IP 的桶；会话中有 user_id 时再计入该用户的桶。
+        user_id 由服务端随时签发，换一个 Cookie 就是一个新桶，只按用户限流会被轮换 Cookie 绕过
+        """
+        client = scope.get('client')
+        keys = ['ip:' + (client[0] if client else 'unknown')]
+        session = scope.get('session') or {}
+        if session.get('user_id'):
+            keys.append('u:' + session['user_id'])
+        return keys
+
+    @staticmethod
+    async def _reject(scope, send, status: int, message: str, headers: Dict[str, str]) -> None:
+        # 与各接口自身的错误格式保持一致
+        body = {'detail': message} if scope['path'].startswith('/api/') else {'success': False, 'error': message}
+        raw = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        header_list = [(b'content-type', b'application/json'), (b'content-length', str(len(raw)).encode())]
+        header_list += [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+        await send({'type': 'http.response.start', 'status': status, 'headers': header_list})
+        await send({'type': 'http.response.body', 'body': raw})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        check_config_changed()
+        if self._version != config_version():
+            self._reload()
+        if not self.enabled or scope.get('method') == 'OPTIONS' or not self._match(scope['path']):
+            await self.app(scope, receive, send)
+            return
+
+        allowed, retry_after = True, 0.0
+        for key in self._client_keys(scope):
+            allowed, retry_after = self.limiter.allow(key)
+            if not allowed:
+                break
+        if not allowed:
+            self.limited += 1
+            await self._reject(scope, send, 429, '请求过于频繁，请稍后再试',
+                               {'Retry-After': str(max(1, int(retry_after + 0.999)))})
+            return
+
+        gate = self.gate
+        ok, waited = await gate.acquire()
+        if not ok:
+            await self._reject(scope, send, 503, '服务繁忙，请稍后再试',
+                               {'Retry-After': '1', 'X-Queue-Wait-Ms': f'{waited:.1f}'})
+            return
+
+        wait_header = (b'x-queue-wait-ms', f'{waited:.1f}'.encode())
+
+        async def send_with_wait(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message)
+                message['headers'] = list(message.get('headers', [])) + [wait_header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_wait)
+        finally:
+            gate.release()
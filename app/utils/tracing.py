@@ -0,0 +1,145 @@
+"""
+请求追踪模块
+每个请求一个 Trace（以 trace_id 标识），保存在上下文变量中；metrics.stage_timer / observe_stage
+记录阶段耗时时同时累加到当前 Trace，调用链上无需层层传递。
+请求结束时，总耗时超过阈值的（以及按采样率抽中的）Trace 以 JSON 行写入本地慢查询日志，
+写入经 loguru 的 enqueue 队列由后台线程完成，并按大小轮转，不阻塞请求。
+
+配置（monitoring.tracing）：
+    enabled: true
+    slow_ms: 500                      # 超过该耗时的请求写入慢日志
+    sample_rate: 0.0                  # 未超时请求的抽样比例（0~1）
+    path: logs/slow_queries.jsonl
+    rotation: 10 MB
+    retention: 5                      # 保留的轮转文件数
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from app.utils.config import get_conf
+from app.utils.logger import logger, add_jsonl_sink
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python 3.6 没有 contextvars，退化为线程局部（同步接口在单个线程内执行完毕）
+    ContextVar = None
+
+
+class Trace:
+    __slots__ = ('trace_id', 'name', 'started', 'spans', 'attrs')
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attrs: Any):
+        self.trace_id = trace_id or str(uuid.uuid4())
+        self.name = name
+        self.started = time.perf_counter()
+        # 阶段 → 毫秒；同一阶段多次出现时累加
+        self.spans: Dict[str, float] = {}
+        self.attrs: Dict[str, Any] = dict(attrs)
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def timings(self) -> Dict[str, float]:
+        result = {k: round(v, 3) for k, v in self.spans.items()}
+        result['total'] = round(self.elapsed_ms(), 3)
+        return result
+
+
+if ContextVar is not None:
+    _current = ContextVar('wonk_trace', default=None)
+
+    def current_trace() -> Optional[Trace]:
+        return _current.get()
+
+    def _set_current(trace: Optional[Trace]):
+        return _current.set(trace)
+
+    def _reset_current(token) -> None:
+        _current.reset(token)
+else:
+    _local = threading.local()
+
+    def current_trace() -> Optional[Trace]:
+        return getattr(_local, 'trace', None)
+
+    def _set_current(trace: Optional[Trace]):
+        previous = current_trace()
+        _local.trace = trace
+        return previous
+
+    def _reset_current(token) -> None:
+        _local.trace = token
+
+
+def add_span(stage: str, seconds: float) -> None:
+    """记入当前请求的 Trace；不在请求上下文中时什么也不做"""
+    trace = current_trace()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+_sink_id: Optional[int] = None
+_sink_lock = threading.Lock()
+
+
+def _ensure_sink() -> None:
+    global _sink_id
+    if _sink_id is not None:
+        return
+    with _sink_lock:
+        if _sink_id is None:
+            _sink_id = add_jsonl_sink(
+                'slowlog',
+                get_conf('monitoring.tracing.path', 'logs/slow_queries.jsonl'),
+                rotation=get_conf('monitoring.tracing.rotation', '10 MB'),
+                retention=int(get_conf('monitoring.tracing.retention', 5)),
+            )
+
+
+def finish_trace(trace: Trace) -> None:
+    """请求结束：超过 slow_ms 或被抽样的 Trace 写入慢日志"""
+    if not get_conf('monitoring.tracing.enabled', True):
+        return
+    total = trace.elapsed_ms()
+    slow = total >= float(get_conf('monitoring.tracing.slow_ms', 500))
+    if not slow and random.random() >= float(get_conf('monitoring.tracing.sample_rate', 0.0)):
+        return
+    _ensure_sink()
+    record = {
+        'ts': datetime.now().isoformat(timespec='milliseconds'),
+        'trace_id': trace.trace_id,
+        'name': trace.name,
+        'slow': slow,
+        'total_ms': round(total, 3),
+        'spans': {k: round(v, 3) for k, v in trace.spans.items()},
+    }
+    record.update(trace.attrs)
+    logger.bind(sink='slowlog').info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def start_trace(name: str, **attrs: Any) -> Iterator[Trace]:
+    """在 with 块内建立当前 Trace；块结束（含异常）时交给 finish_trace"""
+    trace = Trace(name, **attrs)
+    token = _set_current(trace)
+    try:
+        yield trace
+    except Exception as e:
+        trace.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        _reset_current(token)
+        try:
+            finish_trace(trace)
+        except Exception as e:
+            logger.warning(f"Write slow log failed: {e}")
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+部署基准：以真实 HTTP 压测生产部署形态（单进程 ASGI，uvicorn app.main:app）
+
+用法:
+    python benchmarks/bench_asgi.py --requests 2000 --concurrency 16
+    python benchmarks/bench_asgi.py --db data/database.db --workers 2
+在临时库副本上启动服务，预热后以混合负载（/chat 与 /api/query 交替）压测，
+报告吞吐（req/s）、延迟分位数以及服务进程的常驻内存（VmRSS / 峰值 VmHWM，仅 Linux，--workers 1 时最准确）。
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def read_mem_kb(pid: int) -> Tuple[int, int]:
+    """返回进程的 (VmRSS, VmHWM)，单位 KB；无 /proc 时返回 (0, 0)"""
+    rss = hwm = 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    hwm = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, hwm
+
+
+def wait_ready(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} not ready after {timeout:.0f}s')
+
+
+def start_server(args: List[str], port: int, db_path: str, timeout: float) -> subprocess.Popen:
+    env = dict(os.environ, WONK_DB_PATH=db_path, PORT=str(port), PYTHONUNBUFFERED='1')
+    proc = subprocess.Popen(args, cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, timeout)
+    except Exception:
+        proc.kill()
+        raise
+    return proc
+
+
+def uvicorn_cmd(port: int, workers: int) -> List[str]:
+    return [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1',
+            '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+
+
+def sample_questions(db_path: str, count: int) -> List[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute('SELECT question FROM faqs ORDER BY random() LIMIT ?;', (count,)).fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows] or ['What is Wonk?', '你好']
+
+
+class Worker(threading.Thread):
+    """一个压测线程：保持一条 keep-alive 连接，并沿用服务端下发的会话 Cookie"""
+
+    def __init__(self, port: int, jobs: List[Tuple[str, dict]]):
+        super().__init__(daemon=True)
+        self.port = port
+        self.jobs = jobs
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._cookie: Optional[str] = None
+
+    def _request(self, path: str, payload: dict) -> int:
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        headers = {'Content-Type': 'application/json'}
+        if self._cookie:
+            headers['Cookie'] = self._cookie
+        try:
+            self._conn.request('POST', path, body=json.dumps(payload), headers=headers)
+            resp = self._conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = None
+            raise
+        cookie = resp.getheader('Set-Cookie')
+        if cookie:
+            self._cookie = cookie.split(';', 1)[0]
+        return resp.status
+
+    def run(self):
+        for path, payload in self.jobs:
+            started = time.perf_counter()
+            try:
+                ok = self._request(path, payload) == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                self.errors += 1
+
+
+def run_load(port: int, questions: List[str], total: int, concurrency: int) -> Dict[str, float]:
+    jobs = []
+    for i in range(total):
+        q = questions[i % len(questions)]
+        if i % 2:
+            jobs.append(('/api/query', {'query': q, 'top_k': 5}))
+        else:
+            jobs.append(('/chat', {'message': q}))
+    workers = [Worker(port, jobs[i::concurrency]) for i in range(concurrency)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(x for w in workers for x in w.latencies)
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(w.errors for w in workers),
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
+
+
+def bench_server(db_path: str, args) -> Dict[str, float]:
+    proc = start_server(uvicorn_cmd(args.port, args.workers), args.port, db_path, args.startup_timeout)
+    try:
+        questions = sample_questions(db_path, 200)
+        # 预热：加载模型、向量与各级缓存后再计时
+        run_load(args.port, questions, min(args.requests, 100), args.concurrency)
+        idle_kb = read_mem_kb(proc.pid)[0]
+        result = run_load(args.port, questions, args.requests, args.concurrency)
+        rss_kb, hwm_kb = read_mem_kb(proc.pid)
+        result.update({
+            'workers': args.workers,
+            'rss_idle_mb': idle_kb / 1024,
+            'rss_mb': rss_kb / 1024,
+            'hwm_mb': hwm_kb / 1024,
+        })
+        return result
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ASGI deployment over real HTTP')
+    parser.add_argument('--db', default=str(ROOT / 'data' / 'database.db'), help='database to copy for the run')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--port', type=int, default=18500)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        # 在副本上压测，写入的聊天记录不影响原库
+        db_path = os.path.join(td, 'bench.db')
+        shutil.copyfile(args.db, db_path)
+        r = bench_server(db_path, args)
+
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'idle MB':>8} {'RSS MB':>8} {'peak MB':>8}")
+    print(f"{r['workers']:>7} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+          f"{r['p99_ms']:>8.1f} {r['errors']:>6} {r['rss_idle_mb']:>8.1f} {r['rss_mb']:>8.1f} {r['hwm_mb']:>8.1f}")
+    return 1 if r['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
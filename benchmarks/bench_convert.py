@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+CSV → JSONL 转换吞吐基准：对比旧的 iterrows 逐行路径与 DataConverter 分块向量化路径
+
+用法:
+    python benchmarks/bench_convert.py --rows 1000000
+每种路径在独立子进程中运行，分别报告耗时、吞吐与峰值内存 (ru_maxrss)
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+
+def generate_csv(path: Path, rows: int, seed: int = 42) -> None:
+    """生成确定性的中英混合 FAQ CSV"""
+    rnd = random.Random(seed)
+    topics = ['账户', '支付', '物流', 'password', 'refund', 'shipping', '发票', 'API']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('question,answer,language,tags,source\n')
+        for i in range(rows):
+            t = rnd.choice(topics)
+            tags = ';'.join(rnd.sample(topics, 2)) if i % 3 else ','.join(rnd.sample(topics, 3))
+            f.write(f'如何处理{t}问题 {i}?,关于{t}的详细解答 {i} lorem ipsum dolor sit amet,zh,"{tags}",bench\n')
+
+
+def legacy_convert(input_path: str, output_path: str) -> int:
+    """旧实现：整文件读入 + iterrows 逐行构造 JSON"""
+    import pandas as pd
+    df = pd.read_csv(input_path, encoding='utf-8')
+    df = df.dropna(subset=['question', 'answer'])
+    df = df[df['question'].str.strip() != '']
+    df = df[df['answer'].str.strip() != '']
+    df['tags'] = df['tags'].fillna('').astype(str).apply(lambda v: v.strip())
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for _, row in df.iterrows():
+            item = {
+                'question': str(row['question']).strip(),
+                'answer': str(row['answer']).strip(),
+                'language': str(row.get('language', 'auto')).strip(),
+                'source': str(row.get('source', 'imported')).strip()
+            }
+            tags_str = str(row.get('tags', '')).strip()
+            tags = []
+            if tags_str:
+                for separator in [',', ';']:
+                    if separator in tags_str:
+                        tags = [tag.strip() for tag in tags_str.split(separator) if tag.strip()]
+                        break
+                if not tags:
+                    tags = [tags_str]
+            item['tags'] = tags
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def chunked_convert(input_path: str, output_path: str, chunksize: int) -> int:
+    from loguru import logger
+    logger.remove()
+    from convert_data import DataConverter
+    count, _ = DataConverter(chunksize=chunksize).convert_file(input_path, output_path)
+    return count
+
+
+def run_one(mode: str, input_path: str, chunksize: int) -> dict:
+    with tempfile.TemporaryDirectory() as td:
+        out = os.path.join(td, 'out.jsonl')
+        start = time.perf_counter()
+        if mode == 'legacy':
+            count = legacy_convert(input_path, out)
+        else:
+            count = chunked_convert(input_path, out, chunksize)
+        elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'rows': count,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(count / elapsed) if elapsed else 0,
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='CSV conversion throughput benchmark')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--input', help='use an existing CSV instead of generating one')
+    parser.add_argument('--mode', choices=['legacy', 'chunked'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_one(args.mode, args.input, args.chunksize)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as td:
+        input_path = args.input or os.path.join(td, 'bench.csv')
+        if not args.input:
+            generate_csv(Path(input_path), args.rows)
+        results = []
+        for mode in ('legacy', 'chunked'):
+            proc = subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--input', input_path,
+                 '--chunksize', str(args.chunksize)],
+                check=True, capture_output=True, text=True
+            )
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+端到端负载基准：在合成语料（1k / 100k / 1M FAQ）上用并发客户端驱动进程内的 FastAPI 应用
+
+用法:
+    python benchmarks/bench_load.py                                   # 默认 1k 语料，全部场景
+    python benchmarks/bench_load.py --sizes 1000,100000 --data-dir /tmp/wonk-bench --output load.json
+    python benchmarks/bench_load.py --baseline benchmarks/baselines/load.json   # CI：与基线对比，退化时退出码为 1
+    python benchmarks/bench_load.py --scenarios bm25,semantic --sizes 1000000 --requests 50 --data-dir /tmp/wonk-bench
+语料由 benchmarks/corpus.py 确定性生成（--data-dir 指定时按规模缓存复用，1M 首次生成需数分钟），
+语义部分使用桩向量模型，无需下载模型、可离线运行。默认关闭查询向量/结果缓存、查询日志与慢日志，测的是未命中缓存的真实路径
+（--cache 打开两级缓存）。
+
+场景:
+    api_query   POST /api/query（FastAPI，含 20% FTS 未命中 → LIKE 兜底的查询）
+    chat        POST /chat（FastAPI，检索 + 两次消息写入）
+    history     GET /sessions/{id}/messages（FastAPI，合成聊天历史）
+    bm25        search_bm25 直接调用
+    semantic    SemanticRetriever.query 直接调用（全量余弦打分）
+    fuzzy       _fuzzy_fallback 直接调用（需要 rapidfuzz，未安装时跳过）
+    chat_write  add_chat_message 直接调用
+结果为 JSON：每个规模、每个场景的吞吐（req/s）与延迟分位数（ms）。
+--baseline 只与同一机器指纹（platform + python 版本）生成的基线对比，不匹配时跳过对比并打印提示。
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+SCENARIOS = ['api_query', 'chat', 'history', 'bm25', 'semantic', 'fuzzy', 'chat_write']
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def write_bench_config(path: str, cache: bool) -> None:
+    """基于仓库的 config.yaml 生成基准专用配置：关闭限流、查询日志、慢日志与预热，按需关闭缓存"""
+    try:
+        with open(ROOT / 'config.yaml', 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+    except OSError:
+        data = {}
+
+    def put(dotted: str, value: Any) -> None:
+        cur = data
+        parts = dotted.split('.')
+        for p in parts[:-1]:
+            if not isinstance(cur.get(p), dict):
+                cur[p] = {}
+            cur = cur[p]
+        cur[parts[-1]] = value
+
+    put('security.rate_limit.enabled', False)
+    put('monitoring.query_log.enabled', False)
+    put('monitoring.query_log.warm_top_n', 0)
+    put('monitoring.tracing.enabled', False)
+    put('performance.query_cache.enabled', cache)
+    put('performance.vector_cache.enabled', cache)
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(data, f, sort_keys=False, allow_unicode=True)
+
+
+def run_scenario(make_call: Callable[[int], Callable[[int], bool]], requests: int, concurrency: int,
+                 max_seconds: float) -> Dict[str, Any]:
+    """
+    concurrency 个线程各自用 make_call(线程序号) 建立客户端，共同领取 requests 个请求序号；
+    超过 max_seconds 后不再发新请求（大语料上的慢场景据此封顶）
+    """
+    lock = threading.Lock()
+    state = {'next': 0}
+    latencies: List[float] = []
+    errors = [0]
+    deadline = time.perf_counter() + max_seconds
+
+    def worker(index: int) -> None:
+        call = make_call(index)
+        local: List[float] = []
+        failed = 0
+        try:
+            while time.perf_counter() < deadline:
+                with lock:
+                    i = state['next']
+                    if i >= requests:
+                        break
+                    state['next'] = i + 1
+                started = time.perf_counter()
+                try:
+                    ok = call(i)
+                except Exception:
+                    ok = False
+                local.append((time.perf_counter() - started) * 1000)
+                failed += 0 if ok else 1
+        finally:
+            close = getattr(call, 'close', None)
+            if close:
+                close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    lat = sorted(latencies)
+    return {
+        'requests': len(lat),
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'rps': round(len(lat) / elapsed, 2) if elapsed > 0 else 0.0,
+        'mean_ms': round(sum(lat) / len(lat), 3) if lat else 0.0,
+        'p50_ms': round(percentile(lat, 0.50), 3),
+        'p95_ms': round(percentile(lat, 0.95), 3),
+        'p99_ms': round(percentile(lat, 0.99), 3),
+        'max_ms': round(lat[-1], 3) if lat else 0.0,
+    }
+
+
+class _Client:
+    """每线程一个客户端：call(i) -> bool，state 保存该客户端的会话等状态，场景结束时关闭"""
+
+    def __init__(self, client, send: Callable[[Any, int, Dict[str, Any]], bool],
+                 close: Optional[Callable[[], None]] = None):
+        self.client = client
+        self.send = send
+        self.state: Dict[str, Any] = {}
+        self._close = close
+
+    def __call__(self, i: int) -> bool:
+        return self.send(self.client, i, self.state)
+
+    def close(self) -> None:
+        if self._close:
+            self._close()
+
+
+def build_scenarios(ctx: Dict[str, Any]) -> Dict[str, Callable[[int], Callable[[int], bool]]]:
+    from fastapi.testclient import TestClient
+    from app.core import data_manager
+    from app.core.retriever import _fuzzy_fallback
+
+    queries: List[str] = ctx['queries']
+    sessions: List[int] = ctx['sessions']
+    stub = ctx['stub']
+
+    def q(i: int) -> str:
+        return queries[i % len(queries)]
+
+    def asgi(send):
+        def make(_index: int) -> _Client:
+            client = TestClient(ctx['asgi_app'])
+            # 进入上下文后整个场景复用同一个事件循环线程，避免每个请求新建一次
+            client.__enter__()
+            return _Client(client, send, lambda: client.__exit__(None, None, None))
+        return make
+
+    def direct(fn: Callable[[int], Any]):
+        return lambda _index: (lambda i: fn(i) is not None)
+
+    def send_query(client, i: int, state: Dict[str, Any]) -> bool:
+        return client.post('/api/query', json={'query': q(i), 'top_k': 5}).status_code == 200
+
+    def send_chat(client, i: int, state: Dict[str, Any]) -> bool:
+        # 同一客户端的消息写入同一会话，模拟用户连续提问
+        resp = client.post('/chat', json={'message': q(i), 'session_id': state.get('session_id')})
+        if resp.status_code != 200:
+            return False
+        body = resp.json()
+        state['session_id'] = body.get('session_id')
+        return bool(body.get('success'))
+
+    def chat_write(_index: int):
+        # 写入本次运行新建的会话，不改动合成历史（history 场景读取的会话保持不变）
+        session_id = data_manager.create_chat_session('bench write', 'loadtest')
+        return lambda i: data_manager.add_chat_message(session_id, 'user', q(i)) is not None
+
+    def send_history(client, i: int, state: Dict[str, Any]) -> bool:
+        resp = client.get(f'/sessions/{sessions[i % len(sessions)]}/messages', params={'limit': 50})
+        return resp.status_code == 200
+
+    return {
+        'api_query': asgi(send_query),
+        'chat': asgi(send_chat),
+        'history': asgi(send_history),
+        'bm25': direct(lambda i: data_manager.search_bm25(q(i), top_k=5)),
+        'semantic': direct(lambda i: stub.query(q(i), top_k=10)),
+        'fuzzy': direct(lambda i: _fuzzy_fallback(q(i), top_k=5)),
+        'chat_write': chat_write,
+    }
+
+
+def reset_state(stub, db_path: str) -> None:
+    """切换到另一份语料：清空会话缓存、结果缓存与向量索引，并重新加载向量"""
+    from app.core import data_manager
+    from app.core.chat_service import chat_service
+    from app.core.retriever import get_result_cache
+
+    data_manager.DB_PATH = db_path
+    chat_service.cache.clear()
+    get_result_cache().clear()
+    with stub._lock:
+        stub.embeddings = []
+        stub.id_map = []
+        stub.faq_count = None
+        stub.faq_generation = None
+        stub.generation += 1
+    stub.query_cache.clear()
+    stub.build_from_db()
+
+
+def machine_fingerprint(meta: Dict[str, Any]) -> Tuple[Any, Any]:
+    """基线的机器指纹：不同机器/解释器的吞吐与延迟不可比，只与指纹相同的基线对比"""
+    return meta.get('platform'), meta.get('python')
+
+
+def compare(results: Dict[str, Dict[str, Dict[str, Any]]], baseline: Dict[str, Any], tolerance: float,
+            min_delta_ms: float) -> List[str]:
+    """与基线对比：p95 变慢、吞吐下降超过 tolerance，或错误数增加，视为退化；基线中没有的规模/场景不比较"""
+    regressions = []
+    for size, scenarios in (baseline.get('results') or {}).items():
+        for name, base in scenarios.items():
+            cur = results.get(size, {}).get(name)
+            if not cur or 'skipped' in cur or 'skipped' in base:
+                continue
+            if cur['p95_ms'] > base['p95_ms'] * (1 + tolerance) and cur['p95_ms'] - base['p95_ms'] > min_delta_ms:
+                regressions.append(f"{size}/{name}: p95 {base['p95_ms']:.2f} -> {cur['p95_ms']:.2f} ms")
+            if cur['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{size}/{name}: throughput {base['rps']:.1f} -> {cur['rps']:.1f} req/s")
+            if cur['errors'] > base['errors']:
+                regressions.append(f"{size}/{name}: errors {base['errors']} -> {cur['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load benchmark on synthetic corpora')
+    parser.add_argument('--sizes', default='1000', help='comma separated corpus sizes, e.g. 1000,100000,1000000')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=None, help='keep generated corpora here and reuse them (default: temp)')
+    parser.add_argument('--requests', type=int, default=300, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-seconds', type=float, default=30.0, help='stop issuing requests after this long')
+    parser.add_argument('--miss-ratio', type=float, default=0.2, help='share of queries absent from the corpus')
+    parser.add_argument('--sessions', type=int, default=200, help='synthetic chat sessions per corpus')
+    parser.add_argument('--messages', type=int, default=40, help='messages per synthetic session')
+    parser.add_argument('--cache', action='store_true', help='keep query-vector and result caches enabled')
+    parser.add_argument('--output', default=None, help='write JSON results here')
+    parser.add_argument('--baseline', default=None, help='compare against this JSON and exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown vs baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore p95 changes smaller than this')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    names = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix='wonk-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    def db_for(size: int) -> str:
+        return os.path.join(work_dir, f'corpus_{size}_{args.seed}.db')
+
+    # 应用模块在导入时读取配置路径与库路径，必须先设置好
+    config_path = os.path.join(work_dir, 'bench_config.yaml')
+    write_bench_config(config_path, args.cache)
+    os.environ['WONK_CONFIG'] = config_path
+    os.environ['WONK_DB_PATH'] = db_for(sizes[0])
+
+    from app.utils.logger import logger
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    from corpus import (build_corpus, bench_session_ids, chat_watermark, install_stub_retriever, make_queries,
+                        rollback_chat)
+    stub = install_stub_retriever()
+    from app.main import app as asgi_app
+    from app.core.chat_service import chat_service
+
+    fuzzy_available = importlib.util.find_spec('rapidfuzz') is not None
+    report: Dict[str, Any] = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': args.seed,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'miss_ratio': args.miss_ratio,
+            'cache': args.cache,
+        },
+        'corpus': {},
+        'results': {},
+    }
+    print(f"{'size':>8} {'scenario':11} {'reqs':>6} {'err':>4} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    for size in sizes:
+        db_path = db_for(size)
+        stats = build_corpus(db_path, size, args.seed, args.sessions, args.messages)
+        report['corpus'][str(size)] = stats
+        reset_state(stub, db_path)
+        ctx = {
+            'queries': make_queries(size, max(args.requests, 1), args.seed, args.miss_ratio),
+            'sessions': bench_session_ids(args.sessions) or [1],
+            'stub': stub,
+            'asgi_app': asgi_app,
+        }
+        scenarios = build_scenarios(ctx)
+        results: Dict[str, Any] = {}
+        # chat / chat_write 会写入会话与消息，结束后回滚，--data-dir 复用的语料保持确定
+        watermark = chat_watermark()
+        try:
+            for name in names:
+                if name == 'fuzzy' and not fuzzy_available:
+                    results[name] = {'skipped': 'rapidfuzz not installed'}
+                    print(f"{size:>8} {name:11} skipped (rapidfuzz not installed)")
+                    continue
+                r = run_scenario(scenarios[name], args.requests, args.concurrency, args.max_seconds)
+                results[name] = r
+                print(f"{size:>8} {name:11} {r['requests']:>6} {r['errors']:>4} {r['rps']:>9.1f} "
+                      f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['max_ms']:>9.2f}")
+        finally:
+            rollback_chat(watermark)
+            chat_service.cache.clear()
+        report['results'][str(size)] = results
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"results written to {args.output}")
+
+    if not args.data_dir:
+        from app.core.data_manager import close_pool
+        close_pool()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    status = 0
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        base_meta = baseline.get('meta') or {}
+        if machine_fingerprint(base_meta) != machine_fingerprint(report['meta']):
+            print(f"baseline comparison skipped: {args.baseline} was recorded on another machine "
+                  f"(platform {base_meta.get('platform')}, python {base_meta.get('python')}); "
+                  f"regenerate it here with --output")
+            baseline = None
+    if baseline:
+        regressions = compare(report['results'], baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regression(s) vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"no regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    if any(r.get('errors') for res in report['results'].values() for r in res.values()):
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+基准用合成数据：确定性的中英双语 FAQ 语料、聊天历史与查询，以及离线可用的桩向量模型
+同一 (size, seed) 每次生成完全相同的内容，不同机器上的基准结果可以直接对比。
+
+用法:
+    python benchmarks/corpus.py --size 100000 --db /tmp/wonk_100k.db
+    python benchmarks/corpus.py --size 1000000 --db /tmp/wonk_1m.db --sessions 2000 --messages 50
+生成的库包含 FAQ、桩模型向量（model=stub:hash64）与聊天历史；bench_load.py / micro.py 直接复用。
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core import data_manager  # noqa: E402
+from app.core.retriever import SemanticRetriever  # noqa: E402
+
+_ZH_TOPICS = ['账户', '密码', '订单', '发票', '退款', '配送', '会员', '积分', '优惠券', '支付方式',
+              '收货地址', '手机号', '邮箱', '发货时间', '物流信息', '库存', '售后', '保修', '退货', '换货',
+              '实名认证', '登录', '通知', '隐私设置', '账单', '余额', '提现', '充值', '订阅', '套餐',
+              '设备', '数据备份', '客服工单', '评价', '购物车', '收藏夹', '礼品卡', '预约', '合同', '开票信息']
+_ZH_ACTIONS = ['修改', '查询', '取消', '申请', '绑定', '解绑', '找回', '开通', '关闭', '更换',
+               '设置', '删除', '恢复', '导出', '升级', '续费', '暂停', '转移', '核对', '补开']
+_ZH_MODIFIERS = ['在手机上', '在网页端', '海外用户', '企业账户', '第一次', '周末', '节假日', '未登录时',
+                 '批量', '紧急情况下', '通过小程序', '在客户端', '老用户', '新用户', '子账号', '家庭成员',
+                 '离线时', '跨境', '夜间', '多设备']
+_ZH_PRODUCTS = ['标准版', '旗舰版', '专业版', '家庭版', '学生版', '企业版', '试用版', '国际版', '青春版', '尊享版']
+_ZH_TEMPLATES = ['如何{mod}{act}{topic}？', '{mod}{act}{topic}需要多久？', '为什么{mod}无法{act}{topic}？',
+                 '{product}{mod}{act}{topic}失败怎么办？', '{product}支持{mod}{act}{topic}吗？']
+_ZH_ANSWERS = ['请在“{menu}”页面选择{topic}，然后点击“{act}”。', '通常需要{n}个工作日完成。',
+               '{product}用户可在设置中自助办理。', '如仍有问题，请联系{channel}。',
+               '办理前请确认{topic}信息准确无误。', '高峰期处理时间可能延长至{n}天。']
+_ZH_MENUS = ['我的', '账户与安全', '订单中心', '服务中心', '设置', '钱包']
+_ZH_CHANNELS = ['在线客服', '客服热线', '服务邮箱', '官方社区']
+
+_EN_TOPICS = ['account', 'password', 'order', 'invoice', 'refund', 'delivery', 'membership', 'points',
+              'coupon', 'payment method', 'shipping address', 'phone number', 'email', 'shipment', 'tracking',
+              'stock', 'warranty', 'return', 'exchange', 'verification', 'login', 'notification',
+              'privacy settings', 'bill', 'balance', 'withdrawal', 'top-up', 'subscription', 'plan', 'device',
+              'backup', 'support ticket', 'review', 'cart', 'wishlist', 'gift card', 'appointment',
+              'contract', 'billing details', 'license']
+_EN_ACTIONS = ['change', 'check', 'cancel', 'request', 'link', 'unlink', 'recover', 'activate', 'close',
+               'replace', 'set up', 'delete', 'restore', 'export', 'upgrade', 'renew', 'pause', 'transfer',
+               'verify', 'reissue']
+_EN_MODIFIERS = ['on mobile', 'on the web', 'from abroad', 'for a business account', 'for the first time',
+                 'on weekends', 'during holidays', 'without logging in', 'in bulk', 'urgently',
+                 'in the mini app', 'in the desktop client', 'as an existing customer', 'as a new customer',
+                 'for a sub-account', 'for family members', 'offline', 'across borders', 'at night',
+                 'on multiple devices']
+_EN_PRODUCTS = ['Standard', 'Flagship', 'Pro', 'Family', 'Student', 'Enterprise', 'Trial', 'Global', 'Lite',
+                'Premium']
+_EN_TEMPLATES = ['How do I {act} my {topic} {mod}?', 'How long does it take to {act} a {topic} {mod}?',
+                 'Why can\'t I {act} my {topic} {mod}?', 'What if {product} fails to {act} the {topic} {mod}?',
+                 'Does {product} let me {act} the {topic} {mod}?']
+_EN_ANSWERS = ['Open the "{menu}" page, choose {topic} and tap "{act}".', 'It usually takes {n} business days.',
+               '{product} users can do this themselves in Settings.', 'If the problem persists, contact {channel}.',
+               'Please make sure your {topic} details are correct first.',
+               'During peak periods this may take up to {n} days.']
+_EN_MENUS = ['Me', 'Account & Security', 'Orders', 'Help Center', 'Settings', 'Wallet']
+_EN_CHANNELS = ['live chat', 'the support hotline', 'support email', 'the community forum']
+
+# 查询未命中用的词：不出现在语料中
+_MISS_WORDS = ['quasar', 'nebula', 'marmot', 'zeppelin', 'obsidian', 'tundra', 'fjord', 'glacier',
+               '彗星', '鲸鱼', '火山', '极光', '沙漠', '珊瑚', '银河', '冰川']
+
+STUB_DIM = 64
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+
+def _rng(seed: int, index: int) -> random.Random:
+    return random.Random(seed * 1000003 + index)
+
+
+def faq_at(index: int, seed: int = 42) -> Tuple[str, str, str, Optional[str], Optional[str]]:
+    """第 index 条合成 FAQ：(question, answer, language, tags, source)；偶数为中文，奇数为英文"""
+    rnd = _rng(seed, index)
+    if index % 2 == 0:
+        topics, actions, mods, products = _ZH_TOPICS, _ZH_ACTIONS, _ZH_MODIFIERS, _ZH_PRODUCTS
+        templates, answers, menus, channels, lang = _ZH_TEMPLATES, _ZH_ANSWERS, _ZH_MENUS, _ZH_CHANNELS, 'zh'
+        join = ''
+    else:
+        topics, actions, mods, products = _EN_TOPICS, _EN_ACTIONS, _EN_MODIFIERS, _EN_PRODUCTS
+        templates, answers, menus, channels, lang = _EN_TEMPLATES, _EN_ANSWERS, _EN_MENUS, _EN_CHANNELS, 'en'
+        join = ' '
+    slots = {
+        'topic': rnd.choice(topics), 'act': rnd.choice(actions), 'mod': rnd.choice(mods),
+        'product': rnd.choice(products), 'menu': rnd.choice(menus), 'channel': rnd.choice(channels),
+        'n': rnd.randint(1, 30),
+    }
+    question = rnd.choice(templates).format(**slots)
+    answer = join.join(t.format(**slots) for t in rnd.sample(answers, rnd.randint(2, 4)))
+    # 编号保证内容指纹唯一，同时像真实知识库那样带有条目编号
+    answer += f"{join}(#{index})"
+    return question, answer, lang, f"{slots['topic']},{lang}", 'synthetic'
+
+
+def iter_faqs(size: int, seed: int = 42) -> Iterator[Tuple[str, str, str, Optional[str], Optional[str]]]:
+    for i in range(size):
+        yield faq_at(i, seed)
+
+
+def make_queries(size: int, count: int, seed: int = 42, miss_ratio: float = 0.2) -> List[str]:
+    """
+    查询负载：大部分取自语料中的问题（部分去掉标点或只取片段，模拟用户的不完整输入），
+    miss_ratio 比例为语料中不存在的词，走 FTS 未命中 → LIKE 兜底的路径
+    """
+    rnd = random.Random(seed + 7)
+    queries = []
+    for _ in range(count):
+        if rnd.random() < miss_ratio:
+            queries.append(' '.join(rnd.sample(_MISS_WORDS, rnd.randint(1, 3))))
+            continue
+        question = faq_at(rnd.randrange(size), seed)[0]
+        roll = rnd.random()
+        if roll < 0.3:
+            question = question.rstrip('?？')
+        elif roll < 0.5:
+            words = question.split()
+            question = ' '.join(words[:max(1, len(words) // 2)]) if len(words) > 1 else question[:len(question) // 2]
+        queries.append(question)
+    return queries
+
+
+def make_messages(session_index: int, count: int, seed: int = 42) -> List[Tuple[str, str]]:
+    """一个会话的合成历史：用户提问与助手回复交替"""
+    messages = []
+    rnd = _rng(seed + 13, session_index)
+    for _ in range(count // 2):
+        question, answer = faq_at(rnd.randrange(1 << 30), seed)[:2]
+        messages.append(('user', question))
+        messages.append(('assistant', answer))
+    return messages
+
+
+class StubRetriever(SemanticRetriever):
+    """
+    确定性的桩向量模型：词（英文）与字二元组（中文）经 crc32 哈希到 STUB_DIM 维并归一化
+    不下载模型、不依赖 fastembed/torch，但编码与打分路径（向量存储、加载、余弦计算）与真实模型一致
+    """
+
+    def _lazy_init(self):
+        self.model = None
+        self.backend = 'stub'
+        self.available = True
+
+    @property
+    def model_tag(self) -> Optional[str]:
+        return f"stub:hash{STUB_DIM}"
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        text = text.lower()
+        feats = _WORD_RE.findall(text)
+        cjk = _CJK_RE.findall(text)
+        feats.extend(a + b for a, b in zip(cjk, cjk[1:]))
+        return feats or [text]
+
+    def _encode(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        embs = []
+        for text in texts:
+            vec = [0.0] * STUB_DIM
+            for feat in self._features(text):
+                h = zlib.crc32(feat.encode('utf-8'))
+                vec[h % STUB_DIM] += 1.0 if (h >> 16) & 1 else -1.0
+            norm = sum(v * v for v in vec) ** 0.5 or 1.0
+            embs.append(array('f', [v / norm for v in vec]))
+        return embs
+
+
+def install_stub_retriever() -> StubRetriever:
+    """把进程内共享的语义检索器替换为桩模型；须在导入 app.api.query / app.main 之前调用"""
+    from app.core import retriever as retriever_module
+    stub = StubRetriever()
+    retriever_module._shared = stub
+    return stub
+
+
+def build_corpus(db_path: str, size: int, seed: int = 42, sessions: int = 200, messages: int = 40,
+                 batch: int = 5000, embed: bool = True) -> Dict[str, float]:
+    """
+    在 db_path 生成语料（已存在且条数一致时直接复用），返回各阶段耗时与规模
+    生成结束后 data_manager.DB_PATH 指向该库
+    """
+    data_manager.DB_PATH = db_path
+    data_manager.init_db()
+    stats: Dict[str, float] = {'size': size}
+    started = time.perf_counter()
+    existing = data_manager.count_faqs()
+    if existing < size:
+        items: List[Tuple[str, str, str, Optional[str], Optional[str]]] = []
+        for i in range(existing, size):
+            items.append(faq_at(i, seed))
+            if len(items) >= batch:
+                data_manager.insert_faqs(items)
+                items = []
+        if items:
+            data_manager.insert_faqs(items)
+    stats['faqs'] = data_manager.count_faqs()
+    stats['insert_s'] = round(time.perf_counter() - started, 3)
+
+    if embed:
+        started = time.perf_counter()
+        stats['embedded'] = StubRetriever().embed_missing(chunk_size=batch)
+        stats['embed_s'] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    with data_manager.get_conn() as conn:
+        cur = conn.cursor()
+        have = cur.execute("SELECT COUNT(*) FROM chat_sessions WHERE user_id LIKE 'bench-%';").fetchone()[0]
+        for s in range(have, sessions):
+            cur.execute("INSERT INTO chat_sessions (title, user_id) VALUES (?, ?);",
+                        (f"bench session {s}", f"bench-{s % 50}"))
+            session_id = cur.lastrowid
+            cur.executemany(
+                "INSERT INTO chat_messages (session_id, role, content) VALUES (?, ?, ?);",
+                [(session_id, role, content) for role, content in make_messages(s, messages, seed)],
+            )
+    stats['sessions'] = sessions
+    stats['history_s'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def bench_session_ids(limit: int) -> List[int]:
+    with data_manager.get_conn() as conn:
+        rows = conn.execute("SELECT id FROM chat_sessions WHERE user_id LIKE 'bench-%' ORDER BY id LIMIT ?;",
+                            (limit,)).fetchall()
+    return [r[0] for r in rows]
+
+
+def chat_watermark() -> Tuple[int, int]:
+    """当前聊天会话与消息的最大 id；基准写入的数据在结束时按此回滚"""
+    with data_manager.get_conn() as conn:
+        sessions = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_sessions;").fetchone()[0]
+        messages = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_messages;").fetchone()[0]
+    return sessions, messages
+
+
+def rollback_chat(watermark: Tuple[int, int]) -> None:
+    """
+    删除 watermark 之后写入的会话与消息，缓存复用的语料恢复原样
+    （否则每次运行都往合成会话里追加消息，history 等场景的结果随运行次数漂移）
+    """
+    sessions, messages = watermark
+    with data_manager.get_conn() as conn:
+        conn.execute("DELETE FROM chat_messages WHERE id > ? OR session_id > ?;", (messages, sessions))
+        conn.execute("DELETE FROM chat_sessions WHERE id > ?;", (sessions,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic FAQ corpus')
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', required=True, help='target sqlite path (reused if already generated)')
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=40, help='messages per session')
+    parser.add_argument('--no-embed', action='store_true', help='skip stub embeddings')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    stats = build_corpus(args.db, args.size, args.seed, args.sessions, args.messages, embed=not args.no_embed)
+    print(' '.join(f'{k}={v}' for k, v in stats.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+热路径微基准与退化门禁：fuse_scores、apply_threshold、_cosine / 向量打分、search_bm25（FTS 命中、
+FTS 未命中 → LIKE、FTS 语法错误 → LIKE 三条路径）、add_chat_message 与 get_chat_messages
+
+用法:
+    python benchmarks/micro.py                                  # 运行全部，打印每次调用耗时
+    python benchmarks/micro.py --only bm25 --sizes 1000,100000 --data-dir /tmp/wonk-bench
+    python benchmarks/micro.py --record                         # 结果追加到历史文件
+    python benchmarks/micro.py --gate --tolerance 0.3           # 与历史中最近几次的中位数对比，退化时退出码为 1
+门禁只使用同一机器指纹（platform + python 版本）记录的历史；没有匹配的记录时跳过对比并打印提示。
+每项按 timeit 的做法先校准循环次数（单轮不少于 --min-time 秒），重复 --repeat 轮取最快一轮的单次耗时（µs），
+门禁以此对比。数据库类基准在 benchmarks/corpus.py 生成的确定性语料上运行，规模由 --sizes 指定；
+候选融合与向量打分的规模分别由 --candidates / --vectors 指定。
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+DEFAULT_HISTORY = str(ROOT / 'benchmarks' / 'baselines' / 'micro_history.jsonl')
+
+# FTS 命中 / 未命中（走 LIKE）/ 语法错误（OperationalError → LIKE）三类查询
+_HIT_QUERIES = ['refund', 'password recover', 'invoice', 'delivery on mobile', 'membership upgrade']
+_MISS_QUERIES = ['quasar', 'nebula marmot', 'zeppelin', 'obsidian tundra', 'fjord']
+_ERROR_QUERIES = ['refund?', 'how do I "cancel', 'top-up', 'invoice?', 'e-mail']
+
+
+def measure(fn: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    """先把循环次数翻倍到单轮不少于 min_time，再重复 repeat 轮；返回单次调用的最快/中位耗时（µs）"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        rounds.append((time.perf_counter() - started) / loops * 1e6)
+    return {
+        'min_us': round(min(rounds), 3),
+        'median_us': round(statistics.median(rounds), 3),
+        'loops': loops,
+    }
+
+
+def _cycle(items: List[Any]) -> Callable[[], Any]:
+    state = [0]
+
+    def nxt() -> Any:
+        state[0] += 1
+        return items[state[0] % len(items)]
+    return nxt
+
+
+def _random_vector(rnd: random.Random, dim: int) -> array:
+    vec = [rnd.uniform(-1.0, 1.0) for _ in range(dim)]
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return array('f', [v / norm for v in vec])
+
+
+def pure_benchmarks(candidates: List[int], vectors: List[int], dims: List[int],
+                    seed: int) -> List[Tuple[str, Callable[[], Callable[[], Any]]]]:
+    """不依赖数据库的基准：(名称, 准备函数)；准备函数返回被测的无参调用"""
+    from app.core.matcher import apply_threshold
+    from app.core.retriever import _cosine, fuse_scores
+    from corpus import StubRetriever
+
+    benches: List[Tuple[str, Callable[[], Callable[[], Any]]]] = []
+
+    for n in candidates:
+        def fuse_setup(n=n):
+            rnd = random.Random(seed)
+            bm25 = [{'id': i, 'score': -rnd.uniform(0.5, 12.0)} for i in range(n)]
+            semantic = {i: rnd.random() for i in range(n // 2, n + n // 2)}
+            return lambda: fuse_scores(bm25, semantic, alpha=0.5)
+
+        def threshold_setup(n=n):
+            rnd = random.Random(seed)
+            cands = sorted(((i, rnd.random()) for i in range(n)), key=lambda x: x[1], reverse=True)
+            return lambda: apply_threshold(cands, high=0.8, low=0.5)
+
+        benches.append((f'fuse_scores[{n}]', fuse_setup))
+        benches.append((f'apply_threshold[{n}]', threshold_setup))
+
+    for dim in dims:
+        def cosine_setup(dim=dim):
+            rnd = random.Random(seed)
+            a, b = _random_vector(rnd, dim), _random_vector(rnd, dim)
+            return lambda: _cosine(a, b)
+        benches.append((f'cosine[dim={dim}]', cosine_setup))
+
+    for n in vectors:
+        def vector_setup(n=n):
+            # 直接填充内存索引，查询向量已缓存：只测全量余弦打分与排序
+            rnd = random.Random(seed)
+            retriever = StubRetriever()
+            retriever.query_cache.enabled = True
+            retriever.embeddings = [_random_vector(rnd, 64) for _ in range(n)]
+            retriever.id_map = list(range(1, n + 1))
+            retriever.faq_count = n
+            retriever.query('refund on mobile', top_k=10)
+            return lambda: retriever.query('refund on mobile', top_k=10)
+        benches.append((f'vector_query[{n}]', vector_setup))
+    return benches
+
+
+def db_benchmarks(sizes: List[int], db_for: Callable[[int], str], seed: int,
+                  messages: int) -> List[Tuple[str, Callable[[], Callable[[], Any]]]]:
+    from app.core import data_manager
+    from corpus import bench_session_ids, build_corpus, chat_watermark, rollback_chat
+
+    benches: List[Tuple[str, Callable[[], Callable[[], Any]]]] = []
+
+    def use(size: int) -> None:
+        build_corpus(db_for(size), size, seed, sessions=20, messages=messages, embed=False)
+
+    for size in sizes:
+        def bm25_setup(queries: List[str], size=size):
+            def setup():
+                use(size)
+                nxt = _cycle(queries)
+                return lambda: data_manager.search_bm25(nxt(), top_k=5)
+            return setup
+
+        def add_setup(size=size):
+            use(size)
+            # 写入的会话与消息在测完后回滚，--data-dir 复用的语料保持不变
+            watermark = chat_watermark()
+            session_id = data_manager.create_chat_session('micro bench writes', 'micro')
+            nxt = _cycle(_HIT_QUERIES)
+
+            def add():
+                return data_manager.add_chat_message(session_id, 'user', nxt())
+            add.cleanup = lambda: rollback_chat(watermark)
+            return add
+
+        def get_setup(size=size):
+            use(size)
+            nxt = _cycle(bench_session_ids(20) or [1])
+            return lambda: data_manager.get_chat_messages(nxt(), limit=50)
+
+        benches.append((f'bm25_fts_hit[{size}]', bm25_setup(_HIT_QUERIES)))
+        benches.append((f'bm25_like_fallback[{size}]', bm25_setup(_MISS_QUERIES)))
+        benches.append((f'bm25_fts_error[{size}]', bm25_setup(_ERROR_QUERIES)))
+        benches.append((f'add_chat_message[{size}]', add_setup))
+        benches.append((f'get_chat_messages[{size}]', get_setup))
+    return benches
+
+
+def read_history(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
+
+
+def machine_fingerprint(run: Dict[str, Any]) -> Tuple[Any, Any]:
+    """记录的机器指纹：不同机器/解释器的耗时不可比，门禁只对比指纹相同的历史"""
+    return run.get('platform'), run.get('python')
+
+
+def gate(results: Dict[str, Dict[str, float]], history: List[Dict[str, Any]], window: int,
+         tolerance: float, min_delta_us: float = 0.0) -> List[str]:
+    """
+    每项与历史中最近 window 次记录的 min_us 中位数对比，超过 (1 + tolerance) 倍视为退化；
+    绝对差不足 min_delta_us 的忽略（亚微秒级的项抖动比例很大）
+    """
+    regressions = []
+    for name, current in results.items():
+        past = [run['results'][name]['min_us'] for run in history if name in run.get('results', {})][-window:]
+        if not past:
+            continue
+        base = statistics.median(past)
+        if current['min_us'] > base * (1 + tolerance) and current['min_us'] - base > min_delta_us:
+            regressions.append(f"{name}: {base:.2f} -> {current['min_us']:.2f} us "
+                               f"(+{(current['min_us'] / base - 1):.0%}, {len(past)} runs)")
+    return regressions
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot path microbenchmarks with a regression gate')
+    parser.add_argument('--sizes', default='1000,10000', help='corpus sizes for the database benchmarks')
+    parser.add_argument('--candidates', default='10,100,1000', help='candidate counts for fuse/threshold')
+    parser.add_argument('--vectors', default='1000,10000', help='index sizes for vector scoring')
+    parser.add_argument('--dims', default='64,384', help='vector dimensions for _cosine')
+    parser.add_argument('--messages', type=int, default=100, help='messages per synthetic session')
+    parser.add_argument('--only', default=None, help='run benchmarks whose name contains any of these (comma list)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per round')
+    parser.add_argument('--data-dir', default=None, help='keep generated corpora here and reuse them (default: temp)')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON lines file of previous runs')
+    parser.add_argument('--record', action='store_true', help='append this run to the history file')
+    parser.add_argument('--gate', action='store_true', help='exit 1 if any benchmark regressed vs history')
+    parser.add_argument('--window', type=int, default=5, help='recent runs used as the gate baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--min-delta-us', type=float, default=0.5, help='ignore changes smaller than this')
+    parser.add_argument('--output', default=None, help='also write this run as JSON')
+    args = parser.parse_args()
+
+    sizes = _ints(args.sizes)
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix='wonk-micro-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    def db_for(size: int) -> str:
+        return os.path.join(work_dir, f'corpus_{size}_{args.seed}.db')
+
+    # data_manager 在导入时读取库路径，先指向基准库，避免触碰 data/database.db
+    os.environ['WONK_DB_PATH'] = db_for(sizes[0] if sizes else 0)
+    from app.utils.logger import logger
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    benches = pure_benchmarks(_ints(args.candidates), _ints(args.vectors), _ints(args.dims), args.seed)
+    benches += db_benchmarks(sizes, db_for, args.seed, args.messages)
+    if args.only:
+        keys = [k.strip() for k in args.only.split(',') if k.strip()]
+        benches = [(name, setup) for name, setup in benches if any(k in name for k in keys)]
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'benchmark':34} {'min us':>12} {'median us':>12} {'loops':>8}")
+    for name, setup in benches:
+        fn = setup()
+        try:
+            r = measure(fn, args.repeat, args.min_time)
+        finally:
+            cleanup = getattr(fn, 'cleanup', None)
+            if cleanup:
+                cleanup()
+        results[name] = r
+        print(f"{name:34} {r['min_us']:>12.2f} {r['median_us']:>12.2f} {r['loops']:>8}")
+
+    if not args.data_dir:
+        from app.core.data_manager import close_pool
+        close_pool()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    run = {
+        'ts': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    status = 0
+    history: List[Dict[str, Any]] = []
+    if args.gate:
+        history = [r for r in read_history(args.history) if machine_fingerprint(r) == machine_fingerprint(run)]
+        if not history:
+            print(f"gate skipped: no runs in {args.history} recorded on this machine "
+                  f"(platform {run['platform']}, python {run['python']}); record some with --record first")
+    if history:
+        regressions = gate(results, history, args.window, args.tolerance, args.min_delta_us)
+        if regressions:
+            print(f"{len(regressions)} regression(s) vs {args.history} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"no regressions vs {len(history)} recorded run(s) (tolerance {args.tolerance:.0%})")
+    if args.record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run, ensure_ascii=False) + '\n')
+        print(f"recorded to {args.history}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
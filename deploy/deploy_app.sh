@@ -71,9 +71,9 @@ Type=simple
 User=$APP_USER
 WorkingDirectory=$APP_DIR
 Environment=PATH=$APP_DIR/venv/bin
-Environment=FLASK_ENV=production
 Environment=PYTHONUNBUFFERED=1
-ExecStart=$APP_DIR/venv/bin/python app.py
+# 单进程 ASGI：聊天页面与 /api/* 共用一个检索器与缓存
+ExecStart=$APP_DIR/venv/bin/uvicorn app.main:app --host 0.0.0.0 --port 5000 --workers 1 --proxy-headers
 Restart=always
 RestartSec=3
 
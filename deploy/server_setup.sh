@@ -72,7 +72,7 @@ setup_firewall() {
     ufw allow ssh
     ufw allow 80/tcp
     ufw allow 443/tcp
-    ufw allow 5000/tcp  # Flask应用端口
+    ufw allow 5000/tcp  # 应用端口（uvicorn）
     ufw --force enable
     log_info "防火墙配置完成"
 }
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+FAQ 向量预计算工具
+为尚无当前模型向量的FAQ批量编码并写入 faq_embeddings。
+适合在批量导入后单独运行（可放在有 GPU 的机器上，对同一数据库文件执行），
+服务端启动后直接加载已存储的向量。
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.data_manager import init_db, count_faqs, count_embeddings  # noqa: E402
+from app.core.retriever import get_semantic_retriever  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute FAQ embeddings')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows per read/write transaction')
+    parser.add_argument('--batch-size', type=int, default=None, help='encoder batch size (default: models.batch_size)')
+    args = parser.parse_args()
+
+    init_db()
+    retriever = get_semantic_retriever()
+    if not retriever.available:
+        print("Semantic retrieval is not available (install fastembed or sentence-transformers)")
+        return 1
+    started = time.perf_counter()
+    encoded = retriever.embed_missing(chunk_size=args.chunk_size, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+    rate = encoded / elapsed if elapsed > 0 else 0.0
+    print(f"Encoded {encoded} faqs in {elapsed:.1f}s ({rate:,.0f} rows/s), model={retriever.model_tag}")
+    print(f"Stored vectors: {count_embeddings(retriever.model_tag)}/{count_faqs()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
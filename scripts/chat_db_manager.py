@@ -7,14 +7,18 @@
 import sys
 import os
 import argparse
-from datetime import datetime, timedelta
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.core.data_manager import (
     init_db, get_conn, get_chat_sessions, get_chat_messages,
-    delete_chat_session, create_chat_session, add_chat_message
+    delete_chat_session, create_chat_session, add_chat_message, iter_chat_export,
+    get_db_stats, refresh_db_stats
+)
+from app.core.retention import (
+    count_old_sessions, count_orphan_messages, run_retention,
+    enable_incremental_vacuum, archive_idle_sessions, get_archive_stats
 )
 
 
@@ -46,106 +50,98 @@ def show_session_messages(session_id, limit=100):
         print(f"   {msg['content']}")
 
 
-def cleanup_old_sessions(days=30, dry_run=True):
-    """清理旧的会话"""
-    cutoff_date = datetime.now() - timedelta(days=days)
+def cleanup_old_sessions(days=30, dry_run=True, batch_size=500, vacuum_pages=0, pause=0.0):
+    """清理旧的会话（分批事务删除 + 孤儿消息清扫 + 增量 VACUUM）"""
+    old_count = count_old_sessions(days)
+    orphan_count = count_orphan_messages()
+    
+    print(f"\n🧹 发现 {old_count} 个超过 {days} 天的会话, {orphan_count} 条孤儿消息")
+    
+    if not old_count and not orphan_count:
+        print("   没有需要清理的会话")
+        return
     
     with get_conn() as conn:
         cur = conn.cursor()
-        
-        # 查找旧会话
         cur.execute(
-            "SELECT id, title, updated_at FROM chat_sessions WHERE updated_at < ?",
-            (cutoff_date.isoformat(),)
+            "SELECT id, title, updated_at FROM chat_sessions WHERE updated_at < datetime('now', ?) "
+            "ORDER BY updated_at LIMIT 20",
+            (f"-{int(days)} days",)
         )
-        old_sessions = cur.fetchall()
-        
-        print(f"\n🧹 发现 {len(old_sessions)} 个超过 {days} 天的会话:")
-        
-        if not old_sessions:
-            print("   没有需要清理的会话")
-            return
-        
-        for session in old_sessions:
+        for session in cur.fetchall():
             print(f"   - ID: {session['id']}, 标题: {session['title']}, 最后更新: {session['updated_at']}")
-        
-        if dry_run:
-            print(f"\n⚠️  这是预览模式，使用 --execute 参数来实际删除")
-            return
-        
-        # 实际删除
-        deleted_count = 0
-        for session in old_sessions:
-            try:
-                delete_chat_session(session['id'])
-                deleted_count += 1
-                print(f"   ✅ 已删除会话 {session['id']}")
-            except Exception as e:
-                print(f"   ❌ 删除会话 {session['id']} 失败: {e}")
-        
-        print(f"\n✅ 成功删除 {deleted_count} 个会话")
-
-
-def export_sessions(output_file, user_id=None):
-    """导出会话数据"""
-    import json
+        if old_count > 20:
+            print(f"   ... 以及另外 {old_count - 20} 个会话")
     
-    sessions = get_chat_sessions(user_id, limit=1000)
-    export_data = []
+    if dry_run:
+        print(f"\n⚠️  这是预览模式，使用 --execute 参数来实际删除")
+        return
     
-    for session in sessions:
-        messages = get_chat_messages(session['id'], limit=1000)
-        session_data = {
-            'id': session['id'],
-            'title': session['title'],
-            'user_id': session['user_id'],
-            'created_at': session['created_at'],
-            'updated_at': session['updated_at'],
-            'messages': [
-                {
-                    'id': msg['id'],
-                    'role': msg['role'],
-                    'content': msg['content'],
-                    'timestamp': msg['timestamp']
-                }
-                for msg in messages
-            ]
-        }
-        export_data.append(session_data)
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, ensure_ascii=False, indent=2)
-    
-    print(f"✅ 已导出 {len(export_data)} 个会话到 {output_file}")
-
-
-def show_stats():
-    """显示数据库统计信息"""
-    with get_conn() as conn:
-        cur = conn.cursor()
-        
-        # 会话统计
-        cur.execute("SELECT COUNT(*) FROM chat_sessions")
-        session_count = cur.fetchone()[0]
-        
-        # 消息统计
-        cur.execute("SELECT COUNT(*) FROM chat_messages")
-        message_count = cur.fetchone()[0]
-        
-        # 用户统计
-        cur.execute("SELECT COUNT(DISTINCT user_id) FROM chat_sessions WHERE user_id IS NOT NULL")
-        user_count = cur.fetchone()[0]
-        
-        # 最近活动
-        cur.execute("SELECT MAX(updated_at) FROM chat_sessions")
-        last_activity = cur.fetchone()[0]
-        
-        print(f"\n📊 数据库统计信息:")
-        print("-" * 40)
-        print(f"总会话数:     {session_count}")
-        print(f"总消息数:     {message_count}")
-        print(f"活跃用户数:   {user_count}")
-        print(f"最后活动:     {last_activity or 'N/A'}")
+    # 实际删除
+    stats = run_retention(days, batch_size=batch_size, vacuum_pages=vacuum_pages, pause=pause)
+    print(f"\n✅ 成功删除 {stats['sessions']} 个会话, {stats['messages']} 条消息 "
+          f"({stats['batches']} 个批次), 清扫孤儿消息 {stats['orphans']} 条, 回收 {stats['freed_pages']} 页")
+
+
+def archive_sessions(days=90, codec=None, batch_size=100, pause=0.0):
+    """将长期空闲会话的历史消息压缩归档"""
+    stats = archive_idle_sessions(days, batch_size=batch_size, codec=codec, pause=pause)
+    print(f"\n🗄️  归档 {stats['sessions']} 个会话, {stats['messages']} 条消息")
+    print(f"   原始 {stats['raw_bytes']} 字节 → 压缩后 {stats['stored_bytes']} 字节")
+
+
+def export_sessions(output_file, user_id=None, since=None, until=None, resume_from_id=0, use_gzip=None):
+    """
+    流式导出会话数据为 JSONL（每行一个会话及其全部消息）
+    内存占用与导出总量无关；--resume-from-id 续导时追加写入同一文件
+    """
+    import gzip
+    import json
+    
+    if use_gzip is None:
+        use_gzip = output_file.endswith('.gz')
+    mode = 'at' if resume_from_id else 'wt'
+    opener = gzip.open if use_gzip else open
+    
+    session_count = 0
+    message_count = 0
+    last_id = resume_from_id
+    with opener(output_file, mode, encoding='utf-8') as f:
+        for session in iter_chat_export(user_id, since, until, resume_from_id):
+            f.write(json.dumps(session, ensure_ascii=False) + '\n')
+            session_count += 1
+            message_count += len(session['messages'])
+            last_id = session['id']
+            if session_count % 1000 == 0:
+                print(f"   ... 已导出 {session_count} 个会话 (最后会话ID: {last_id})")
+    
+    print(f"✅ 已导出 {session_count} 个会话, {message_count} 条消息到 {output_file}")
+    print(f"   最后会话ID: {last_id}（中断后可用 --resume-from-id {last_id} 续导）")
+
+
+def show_stats(days=7, refresh=False):
+    """显示数据库统计信息（读取触发器维护的计数器，无全表扫描）"""
+    if refresh:
+        refresh_db_stats()
+    stats = get_db_stats(days)
+    
+    print(f"\n📊 数据库统计信息:")
+    print("-" * 40)
+    print(f"总会话数:     {stats['sessions']}")
+    print(f"总消息数:     {stats['messages'] + stats['archived_messages']}")
+    print(f"活跃用户数:   {stats['users']}")
+    print(f"FAQ 条目数:   {stats['faqs']}")
+    print(f"最后活动:     {stats['last_activity'] or 'N/A'}")
+    if stats['daily_messages']:
+        print(f"\n最近 {days} 天消息数:")
+        for item in stats['daily_messages']:
+            print(f"   {item['day']}: {item['messages']}")
+    
+    archive = get_archive_stats()
+    if archive['sessions']:
+        print(f"归档会话数:   {archive['sessions']}")
+        print(f"归档消息数:   {archive['messages']}")
+        print(f"归档节省:     {archive['saved_bytes']} 字节 ({archive['raw_bytes']} → {archive['stored_bytes']})")
 
 
 def main():
@@ -166,14 +162,33 @@ def main():
     cleanup_parser = subparsers.add_parser('cleanup', help='清理旧会话')
     cleanup_parser.add_argument('--days', type=int, default=30, help='清理多少天前的会话')
     cleanup_parser.add_argument('--execute', action='store_true', help='实际执行删除操作')
+    cleanup_parser.add_argument('--batch-size', type=int, default=500, help='每个事务删除的会话数')
+    cleanup_parser.add_argument('--pause', type=float, default=0.0, help='批次间休眠秒数，减少对在线请求的影响')
+    cleanup_parser.add_argument('--vacuum-pages', type=int, default=0, help='增量 VACUUM 回收页数（0 表示全部）')
+    
+    # 切换为增量 VACUUM 模式
+    subparsers.add_parser('enable-vacuum', help='将已有数据库切换为增量 VACUUM 模式（需完整 VACUUM 一次）')
+    
+    # 归档冷数据
+    archive_parser = subparsers.add_parser('archive', help='压缩归档长期空闲会话的历史消息')
+    archive_parser.add_argument('--days', type=int, default=90, help='归档多少天未活动的会话')
+    archive_parser.add_argument('--codec', choices=['zlib', 'zstd'], help='压缩算法（默认可用时优先 zstd）')
+    archive_parser.add_argument('--batch-size', type=int, default=100, help='每个事务归档的会话数')
+    archive_parser.add_argument('--pause', type=float, default=0.0, help='批次间休眠秒数')
     
     # 导出数据
-    export_parser = subparsers.add_parser('export', help='导出会话数据')
-    export_parser.add_argument('output_file', help='输出文件路径')
+    export_parser = subparsers.add_parser('export', help='导出会话数据 (JSONL)')
+    export_parser.add_argument('output_file', help='输出文件路径（.gz 结尾自动 gzip 压缩）')
     export_parser.add_argument('--user-id', help='指定用户ID')
+    export_parser.add_argument('--since', help='只导出该时间之后有更新的会话 (YYYY-MM-DD[ HH:MM:SS])')
+    export_parser.add_argument('--until', help='只导出该时间之前有更新的会话 (YYYY-MM-DD[ HH:MM:SS])')
+    export_parser.add_argument('--resume-from-id', type=int, default=0, help='从该会话ID之后继续导出（追加写入）')
+    export_parser.add_argument('--gzip', action='store_true', default=None, help='使用 gzip 压缩输出')
     
     # 统计信息
-    subparsers.add_parser('stats', help='显示数据库统计信息')
+    stats_parser = subparsers.add_parser('stats', help='显示数据库统计信息')
+    stats_parser.add_argument('--days', type=int, default=7, help='显示最近多少天的每日消息数')
+    stats_parser.add_argument('--refresh', action='store_true', help='全量重算计数器（修复用，每日消息数只补齐不清空）')
     
     # 初始化数据库
     subparsers.add_parser('init', help='初始化数据库')
@@ -192,11 +207,17 @@ def main():
     elif args.command == 'show':
         show_session_messages(args.session_id, args.limit)
     elif args.command == 'cleanup':
-        cleanup_old_sessions(args.days, not args.execute)
+        cleanup_old_sessions(args.days, not args.execute, args.batch_size, args.vacuum_pages, args.pause)
+    elif args.command == 'enable-vacuum':
+        enable_incremental_vacuum()
+        print("✅ 已切换为增量 VACUUM 模式")
+    elif args.command == 'archive':
+        archive_sessions(args.days, args.codec, args.batch_size, args.pause)
     elif args.command == 'export':
-        export_sessions(args.output_file, args.user_id)
+        export_sessions(args.output_file, args.user_id, args.since, args.until,
+                        args.resume_from_id, args.gzip)
     elif args.command == 'stats':
-        show_stats()
+        show_stats(args.days, args.refresh)
     elif args.command == 'init':
         print("✅ 数据库已初始化")
 
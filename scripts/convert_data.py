@@ -5,11 +5,9 @@
 """
 
 import argparse
-import json
-import os
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 import pandas as pd
 from loguru import logger
@@ -17,20 +15,25 @@ from loguru import logger
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.core.data_manager import init_db, insert_faqs, rebuild_fts
+from app.core.data_manager import init_db, insert_faqs, rebuild_fts, optimize_fts
+from app.core.retriever import embed_missing_faqs
 from app.utils.logger import logger as app_logger
 
 
 class DataConverter:
-    """数据转换器"""
+    """数据转换器（分块读取 + 向量化列变换 + 增量写出）"""
     
-    def __init__(self):
+    # 编码探测顺序：带 BOM 的 UTF-8 优先识别，其余按常见程度
+    encodings = ['utf-8', 'gbk', 'gb2312']
+    
+    def __init__(self, chunksize: int = 50000):
         self.required_columns = ['question', 'answer']
         self.optional_columns = ['language', 'tags', 'source']
         self.all_columns = self.required_columns + self.optional_columns
+        self.chunksize = chunksize
     
     def validate_data(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
-        """验证数据格式"""
+        """验证数据格式（整列操作，不逐行处理）"""
         errors = []
         
         # 检查必需列
@@ -43,150 +46,224 @@ class DataConverter:
         original_count = len(df)
         
         # 移除question或answer为空的行
-        df = df.dropna(subset=['question', 'answer'])
-        df = df[df['question'].str.strip() != '']
-        df = df[df['answer'].str.strip() != '']
+        df = df.dropna(subset=['question', 'answer']).copy()
+        df['question'] = df['question'].astype(str).str.strip()
+        df['answer'] = df['answer'].astype(str).str.strip()
+        df = df[(df['question'] != '') & (df['answer'] != '')]
         
         dropped_count = original_count - len(df)
         if dropped_count > 0:
             errors.append(f"移除了 {dropped_count} 行空数据")
         
-        # 处理可选列
+        # 处理可选列（缺列或空值都填默认值）
+        defaults = {'language': 'auto', 'tags': '', 'source': 'imported'}
         for col in self.optional_columns:
             if col not in df.columns:
-                if col == 'language':
-                    df[col] = 'auto'
-                elif col == 'tags':
-                    df[col] = ''
-                elif col == 'source':
-                    df[col] = 'imported'
-        
-        # 处理tags列（转换为逗号分隔的字符串）
-        if 'tags' in df.columns:
-            df['tags'] = df['tags'].fillna('').astype(str)
-            # 如果tags包含列表格式，转换为逗号分隔
-            df['tags'] = df['tags'].apply(self._process_tags)
+                df[col] = defaults[col]
+            else:
+                df[col] = df[col].fillna(defaults[col]).astype(str).str.strip()
         
         return df, errors
     
-    def _process_tags(self, tags_value: Any) -> str:
-        """处理tags字段"""
-        if pd.isna(tags_value) or tags_value == '':
-            return ''
-        
-        if isinstance(tags_value, str):
-            # 如果是字符串，直接返回
-            return tags_value.strip()
-        elif isinstance(tags_value, (list, tuple)):
-            # 如果是列表，转换为逗号分隔
-            return ','.join(str(tag).strip() for tag in tags_value if str(tag).strip())
-        else:
-            return str(tags_value).strip()
+    @staticmethod
+    def _tags_for_jsonl(tags: pd.Series) -> List[List[str]]:
+        """tags 转为列表：有逗号按逗号分割，否则按分号分割"""
+        has_comma = tags.str.contains(',', regex=False)
+        normalized = tags.where(has_comma, tags.str.replace(';', ',', regex=False))
+        normalized = DataConverter._squeeze_commas(normalized)
+        return [t.split(',') if t else [] for t in normalized]
     
-    def read_file(self, file_path: str) -> pd.DataFrame:
-        """读取文件"""
+    @staticmethod
+    def _tags_for_db(tags: pd.Series) -> List[Optional[str]]:
+        """tags 规范为逗号分隔字符串，空值为 None"""
+        normalized = DataConverter._squeeze_commas(tags)
+        return [t or None for t in normalized.tolist()]
+    
+    @staticmethod
+    def _squeeze_commas(tags: pd.Series) -> pd.Series:
+        # 去掉分隔符两侧空白、连续/首尾的多余逗号
+        return (tags.str.replace(r'\s*,\s*', ',', regex=True)
+                    .str.replace(r',{2,}', ',', regex=True)
+                    .str.strip(','))
+    
+    def detect_encoding(self, file_path: Path, sample_size: int = 64 * 1024) -> str:
+        """读取文件开头的样本探测编码，避免整文件反复解析"""
+        with open(file_path, 'rb') as f:
+            sample = f.read(sample_size)
+        if sample.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
+        for encoding in self.encodings:
+            # 样本末尾可能截断多字节字符，允许丢弃最多 3 个字节
+            for trim in range(4):
+                chunk = sample[:len(sample) - trim] if trim else sample
+                try:
+                    chunk.decode(encoding)
+                    return encoding
+                except UnicodeDecodeError:
+                    continue
+        raise ValueError("无法识别CSV文件编码，请检查文件编码")
+    
+    def iter_frames(self, file_path: str) -> Iterator[pd.DataFrame]:
+        """按 chunksize 分块读取文件，所有列按字符串读取"""
         file_path = Path(file_path)
         
         if not file_path.exists():
             raise FileNotFoundError(f"文件不存在: {file_path}")
         
-        try:
-            if file_path.suffix.lower() == '.csv':
-                # 尝试不同编码读取CSV
-                for encoding in ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']:
-                    try:
-                        df = pd.read_csv(file_path, encoding=encoding)
-                        logger.info(f"成功读取CSV文件 (编码: {encoding}): {len(df)} 行")
-                        return df
-                    except UnicodeDecodeError:
-                        continue
-                raise ValueError("无法读取CSV文件，请检查文件编码")
-            
-            elif file_path.suffix.lower() in ['.xlsx', '.xls']:
-                df = pd.read_excel(file_path)
-                logger.info(f"成功读取Excel文件: {len(df)} 行")
-                return df
-            
-            else:
-                raise ValueError(f"不支持的文件格式: {file_path.suffix}")
+        suffix = file_path.suffix.lower()
+        if suffix == '.csv':
+            encoding = self.detect_encoding(file_path)
+            logger.info(f"CSV文件编码: {encoding}")
+            yield from pd.read_csv(file_path, encoding=encoding, dtype=str, chunksize=self.chunksize)
+        elif suffix == '.xlsx':
+            yield from self._iter_excel_frames(file_path)
+        elif suffix == '.xls':
+            # openpyxl 不支持旧版 .xls，只能整表读取
+            yield pd.read_excel(file_path, dtype=str)
+        else:
+            raise ValueError(f"不支持的文件格式: {file_path.suffix}")
+    
+    def _iter_excel_frames(self, file_path: Path) -> Iterator[pd.DataFrame]:
+        """openpyxl 只读模式流式读取 Excel，内存只保留当前块"""
+        from openpyxl import load_workbook
         
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(c).strip() if c is not None else f'column_{i}' for i, c in enumerate(header)]
+            buffer = []
+            for row in rows:
+                buffer.append(row)
+                if len(buffer) >= self.chunksize:
+                    yield self._excel_frame(buffer, columns)
+                    buffer = []
+            if buffer:
+                yield self._excel_frame(buffer, columns)
+        finally:
+            wb.close()
+    
+    @staticmethod
+    def _excel_frame(rows: List[tuple], columns: List[str]) -> pd.DataFrame:
+        df = pd.DataFrame(rows, columns=columns, dtype=object)
+        missing = df.isna()
+        return df.astype(str).mask(missing)
+    
+    def read_file(self, file_path: str) -> pd.DataFrame:
+        """读取整个文件（小文件或预览用；大文件请使用 iter_frames）"""
+        try:
+            frames = list(self.iter_frames(file_path))
+        except (FileNotFoundError, ValueError):
+            raise
         except Exception as e:
             raise ValueError(f"读取文件失败: {e}")
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.all_columns)
+        logger.info(f"成功读取文件: {len(df)} 行")
+        return df
     
-    def convert_to_jsonl(self, df: pd.DataFrame, output_path: str) -> int:
-        """转换为JSONL格式"""
+    def convert_to_jsonl(self, df: pd.DataFrame, output_path: str, append: bool = False) -> int:
+        """转换为JSONL格式（append=True 时追加写入，供分块转换使用）"""
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
+        if df.empty:
+            return 0
         
-        count = 0
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for _, row in df.iterrows():
-                item = {
-                    'question': str(row['question']).strip(),
-                    'answer': str(row['answer']).strip(),
-                    'language': str(row.get('language', 'auto')).strip(),
-                    'source': str(row.get('source', 'imported')).strip()
-                }
-                
-                # 处理tags
-                tags_str = str(row.get('tags', '')).strip()
-                if tags_str:
-                    # 分割tags并清理（支持逗号和分号分隔）
-                    tags = []
-                    for separator in [',', ';']:
-                        if separator in tags_str:
-                            tags = [tag.strip() for tag in tags_str.split(separator) if tag.strip()]
-                            break
-                    if not tags:  # 如果没有分隔符，整个字符串作为一个tag
-                        tags = [tags_str]
-                    item['tags'] = tags
-                else:
-                    item['tags'] = []
-                
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-                count += 1
+        out = pd.DataFrame({
+            'question': df['question'],
+            'answer': df['answer'],
+            'language': df['language'],
+            'source': df['source'],
+        })
+        out['tags'] = self._tags_for_jsonl(df['tags'])
+        text = out.to_json(orient='records', lines=True, force_ascii=False)
         
-        logger.info(f"转换完成: {count} 条记录写入 {output_path}")
-        return count
+        with open(output_path, 'a' if append else 'w', encoding='utf-8') as f:
+            f.write(text)
+            if not text.endswith('\n'):
+                f.write('\n')
+        
+        logger.debug(f"写入 {len(out)} 条记录到 {output_path}")
+        return len(out)
     
-    def import_to_database(self, df: pd.DataFrame, rebuild_index: bool = True) -> int:
-        """直接导入到数据库"""
+    def import_to_database(self, df: pd.DataFrame, rebuild_index: bool = False,
+                           optimize_index: bool = False, embed: bool = False) -> int:
+        """直接导入到数据库（FTS 由触发器增量维护，rebuild_index 仅用于修复；embed 时预计算向量）"""
         init_db()
         
-        rows = []
-        for _, row in df.iterrows():
-            tags_str = str(row.get('tags', '')).strip()
-            if tags_str:
-                # 处理tags为逗号分隔的字符串
-                tags = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
-                tags_final = ','.join(tags) if tags else None
-            else:
-                tags_final = None
-            
-            rows.append((
-                str(row['question']).strip(),
-                str(row['answer']).strip(),
-                str(row.get('language', 'auto')).strip(),
-                tags_final,
-                str(row.get('source', 'imported')).strip()
-            ))
-        
-        count = insert_faqs(rows)
-        
+        count = self._insert_frame(df)
+        self._finish_import(rebuild_index, optimize_index, embed)
+        logger.info(f"成功导入 {count} 条记录到数据库")
+        return count
+    
+    def _insert_frame(self, df: pd.DataFrame) -> int:
+        if df.empty:
+            return 0
+        rows = list(zip(
+            df['question'].tolist(),
+            df['answer'].tolist(),
+            df['language'].tolist(),
+            self._tags_for_db(df['tags']),
+            df['source'].tolist(),
+        ))
+        return insert_faqs(rows)
+    
+    @staticmethod
+    def _finish_import(rebuild_index: bool, optimize_index: bool, embed: bool = False) -> None:
         if rebuild_index:
             rebuild_fts()
             logger.info("已重建全文索引")
-        
-        logger.info(f"成功导入 {count} 条记录到数据库")
-        return count
+        elif optimize_index:
+            optimize_fts()
+            logger.info("已合并全文索引段")
+        if embed:
+            logger.info(f"已预计算 {embed_missing_faqs()} 条向量")
+    
+    def _iter_valid_frames(self, input_path: str, errors: List[str]) -> Iterator[pd.DataFrame]:
+        for i, frame in enumerate(self.iter_frames(input_path)):
+            clean, chunk_errors = self.validate_data(frame)
+            errors.extend(f"第 {i + 1} 块: {e}" for e in chunk_errors)
+            if any(e.startswith('缺少必需列') for e in chunk_errors):
+                return
+            yield clean
+    
+    def convert_file(self, input_path: str, output_path: str) -> Tuple[int, List[str]]:
+        """分块转换文件为 JSONL，返回 (记录数, 警告列表)"""
+        errors: List[str] = []
+        count = 0
+        # 先清空输出文件，各块一律追加：首块为空或没有有效数据时也不会残留上次的内容
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        open(output_path, 'w', encoding='utf-8').close()
+        for clean in self._iter_valid_frames(input_path, errors):
+            count += self.convert_to_jsonl(clean, output_path, append=True)
+            logger.info(f"已转换 {count} 条记录")
+        return count, errors
+    
+    def import_file(self, input_path: str, rebuild_index: bool = False,
+                    optimize_index: bool = False, embed: bool = False) -> Tuple[int, List[str]]:
+        """分块导入文件到数据库，每块一个事务，返回 (记录数, 警告列表)"""
+        init_db()
+        errors: List[str] = []
+        count = 0
+        for clean in self._iter_valid_frames(input_path, errors):
+            count += self._insert_frame(clean)
+            logger.info(f"已导入 {count} 条记录")
+        self._finish_import(rebuild_index, optimize_index, embed)
+        return count, errors
 
 
 def main():
     parser = argparse.ArgumentParser(description='数据转换工具：CSV/Excel 转 JSONL 或直接导入数据库')
     parser.add_argument('input_file', help='输入文件路径 (CSV/Excel)')
     parser.add_argument('-o', '--output', help='输出JSONL文件路径 (不指定则直接导入数据库)')
-    parser.add_argument('--no-rebuild', action='store_true', help='导入数据库时不重建索引')
+    parser.add_argument('--optimize-index', action='store_true', help='导入后合并全文索引段')
+    parser.add_argument('--rebuild-index', action='store_true', help='导入后全量重建全文索引（仅用于修复）')
+    parser.add_argument('--embed', action='store_true', help='导入后为新记录预计算向量')
+    # 兼容旧参数：现在默认就不重建
+    parser.add_argument('--no-rebuild', action='store_true', help=argparse.SUPPRESS)
     parser.add_argument('--preview', action='store_true', help='预览模式：只显示前5行数据，不执行转换')
+    parser.add_argument('--chunksize', type=int, default=50000, help='每块读取的行数')
     parser.add_argument('-v', '--verbose', action='store_true', help='详细输出')
     
     args = parser.parse_args()
@@ -196,33 +273,23 @@ def main():
         logger.remove()
         logger.add(sys.stderr, level="DEBUG")
     
-    converter = DataConverter()
+    converter = DataConverter(chunksize=args.chunksize)
     
     try:
-        # 读取文件
         logger.info(f"读取文件: {args.input_file}")
-        df = converter.read_file(args.input_file)
-        
-        # 验证数据
-        logger.info("验证数据格式...")
-        df_clean, errors = converter.validate_data(df)
         
-        if errors:
-            logger.warning("数据验证警告:")
+        # 预览模式：只读取第一块
+        if args.preview:
+            first = next(converter.iter_frames(args.input_file), None)
+            if first is None:
+                logger.error("没有有效数据可处理")
+                return 1
+            df_clean, errors = converter.validate_data(first)
             for error in errors:
                 logger.warning(f"  - {error}")
-        
-        if len(df_clean) == 0:
-            logger.error("没有有效数据可处理")
-            return 1
-        
-        logger.info(f"有效数据: {len(df_clean)} 行")
-        
-        # 预览模式
-        if args.preview:
             logger.info("预览前5行数据:")
             print("\n" + "="*80)
-            for i, (_, row) in enumerate(df_clean.head().iterrows()):
+            for i, row in enumerate(df_clean.head().to_dict('records')):
                 print(f"第 {i+1} 行:")
                 print(f"  问题: {row['question']}")
                 print(f"  答案: {row['answer']}")
@@ -233,14 +300,24 @@ def main():
             print("="*80)
             return 0
         
-        # 执行转换或导入
+        # 执行转换或导入（分块流式处理）
+        if args.output:
+            count, errors = converter.convert_file(args.input_file, args.output)
+        else:
+            count, errors = converter.import_file(args.input_file, args.rebuild_index, args.optimize_index, args.embed)
+        
+        if errors:
+            logger.warning("数据验证警告:")
+            for error in errors:
+                logger.warning(f"  - {error}")
+        
+        if count == 0:
+            logger.error("没有有效数据可处理")
+            return 1
+        
         if args.output:
-            # 转换为JSONL
-            count = converter.convert_to_jsonl(df_clean, args.output)
             logger.success(f"转换完成: {count} 条记录")
         else:
-            # 直接导入数据库
-            count = converter.import_to_database(df_clean, not args.no_rebuild)
             logger.success(f"导入完成: {count} 条记录")
         
         return 0
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+FAQ 重复检测工具
+- 默认：MinHash/LSH 近似重复扫描（只比较同桶候选，不做两两全量比对）
+- --exact：按规范化内容指纹查找完全重复
+- --delete：删除每组中较晚写入的重复项，保留最早的一条；近似重复只按问题相似度分桶，
+  答案相似度也达到 --answer-threshold 的才删除（问题相近但答案不同的只报告）
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.data_manager import init_db, get_conn, content_hash, delete_faq, get_faqs_by_ids  # noqa: E402
+from app.core.dedup import scan_near_duplicates, minhash, similarity, DEFAULT_THRESHOLD  # noqa: E402
+
+
+def exact_duplicates():
+    """返回 [(保留ID, 重复ID)]"""
+    first = {}
+    pairs = []
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, question, answer, content_hash FROM faqs ORDER BY id;")
+        for row in cur:
+            h = row['content_hash'] or content_hash(row['question'], row['answer'])
+            if h in first:
+                pairs.append((first[h], row['id']))
+            else:
+                first[h] = row['id']
+    return pairs
+
+
+def answer_similarities(pairs, batch_size=500):
+    """为近似重复对估计答案的相似度，返回 {(保留ID, 重复ID): 相似度}"""
+    ids = sorted({faq_id for keep, dup, _ in pairs for faq_id in (keep, dup)})
+    sigs = {}
+    for i in range(0, len(ids), batch_size):
+        for faq_id, row in get_faqs_by_ids(ids[i:i + batch_size]).items():
+            sigs[faq_id] = minhash(row['answer'])
+    return {(keep, dup): similarity(sigs[keep], sigs[dup])
+            for keep, dup, _ in pairs if keep in sigs and dup in sigs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find duplicate / near-duplicate FAQs')
+    parser.add_argument('--exact', action='store_true', help='only report exact (normalized) duplicates')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='near-duplicate similarity threshold')
+    parser.add_argument('--answer-threshold', type=float, default=None,
+                        help='answer similarity required before --delete removes a near duplicate '
+                             '(default: same as --threshold)')
+    parser.add_argument('--delete', action='store_true', help='delete the later row of each duplicate pair')
+    args = parser.parse_args()
+    answer_threshold = args.threshold if args.answer_threshold is None else args.answer_threshold
+
+    init_db()
+    if args.exact:
+        # 内容指纹包含答案，完全重复的问答可以直接删除
+        pairs = [(keep, dup, 1.0) for keep, dup in exact_duplicates()]
+        answers = {(keep, dup): 1.0 for keep, dup, _ in pairs}
+    else:
+        pairs = scan_near_duplicates(args.threshold)
+        answers = answer_similarities(pairs)
+
+    print(f"Found {len(pairs)} duplicate pairs")
+    removable = set()
+    for keep, dup, score in pairs:
+        answer_score = answers.get((keep, dup), 0.0)
+        note = ''
+        if answer_score >= answer_threshold:
+            removable.add(dup)
+        else:
+            note = '  (answers differ, not deleted)'
+        print(f"  keep={keep} dup={dup} similarity={score:.2f} answer_similarity={answer_score:.2f}{note}")
+
+    if args.delete and removable:
+        deleted = 0
+        for dup in sorted(removable):
+            deleted += delete_faq(dup)
+        print(f"Deleted {deleted} duplicate faqs")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,54 +1,197 @@
 import sys
 import os
 import json
+import time
+import hashlib
+import argparse
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 
 # 兼容直接运行脚本的导入路径
 ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from app.core.data_manager import init_db, insert_faqs, rebuild_fts  # noqa: E402
+from app.core.data_manager import init_db, insert_faqs, rebuild_fts, optimize_fts  # noqa: E402
+from app.core.retriever import embed_missing_faqs  # noqa: E402
 
+FAQRow = Tuple[str, str, str, Optional[str], Optional[str]]
 
-def main(path: str):
+
+def parse_line(line: bytes) -> Optional[FAQRow]:
+    """解析一行 JSONL，无效行返回 None（question/answer 须为非空字符串，language/source 为字符串或缺省）"""
+    try:
+        obj = json.loads(line)
+    except Exception:
+        return None
+    if not isinstance(obj, dict):
+        return None
+    q = obj.get('question')
+    a = obj.get('answer')
+    if not isinstance(q, str) or not isinstance(a, str) or not q or not a:
+        return None
+    lang = obj.get('language')
+    tags = obj.get('tags')
+    source = obj.get('source')
+    # 类型不对的记录整行跳过并计入无效行，不让数字/对象写进文本列或在写库时中断整个导入
+    if not isinstance(lang, (str, type(None))) or not isinstance(source, (str, type(None))):
+        return None
+    if not isinstance(tags, (list, str, type(None))):
+        return None
+    lang = lang or 'auto'
+    # 标签元素可能是数字等非字符串，统一转为字符串，避免单行异常中断整个导入
+    return (q, a, lang, ",".join(str(t) for t in tags) if isinstance(tags, list) else tags, source)
+
+
+def parse_chunk(chunk: Tuple[int, List[bytes]]) -> Tuple[int, List[FAQRow], int]:
+    """解析一批行，返回 (该批结束处的字节偏移, 有效行, 无效行数)"""
+    end_offset, lines = chunk
+    items = []
+    bad = 0
+    for line in lines:
+        item = parse_line(line)
+        if item is None:
+            bad += 1
+        else:
+            items.append(item)
+    return end_offset, items, bad
+
+
+def iter_chunks(path: Path, chunk_lines: int, start_offset: int = 0) -> Iterator[Tuple[int, List[bytes]]]:
+    """从 start_offset 开始按行流式读取，每 chunk_lines 个非空行产出一批"""
+    offset = start_offset
+    lines: List[bytes] = []
+    with path.open('rb') as f:
+        f.seek(start_offset)
+        for line in f:
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            lines.append(line)
+            if len(lines) >= chunk_lines:
+                yield offset, lines
+                lines = []
+    if lines:
+        yield offset, lines
+
+
+def iter_parsed(path: Path, batch_size: int, start_offset: int, workers: int):
+    """按原始顺序产出解析结果；workers > 0 时用进程池并行解析，在途批次数有上限"""
+    chunks = iter_chunks(path, batch_size, start_offset)
+    if workers <= 0:
+        for chunk in chunks:
+            yield parse_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def default_checkpoint(path: str) -> Path:
+    """
+    默认断点文件 <path>.offset；数据文件所在目录不可写（只读挂载等）时改放到 data/import_checkpoints/，
+    再不可写则放到系统临时目录。文件名带源路径的哈希，--resume 时按同样规则找回
+    """
+    source = Path(path).resolve()
+    if os.access(source.parent, os.W_OK):
+        return source.with_name(source.name + '.offset')
+    name = f"{source.name}.{hashlib.md5(str(source).encode('utf-8')).hexdigest()[:12]}.offset"
+    fallback = ROOT / 'data' / 'import_checkpoints'
+    try:
+        fallback.mkdir(parents=True, exist_ok=True)
+        if os.access(fallback, os.W_OK):
+            return fallback / name
+    except OSError:
+        pass
+    return Path(tempfile.gettempdir()) / name
+
+
+def _write_checkpoint(checkpoint: Optional[Path], offset: int) -> None:
+    if checkpoint is None:
+        return
+    tmp = checkpoint.with_name(checkpoint.name + '.tmp')
+    tmp.write_text(str(offset), encoding='utf-8')
+    os.replace(tmp, checkpoint)
+
+
+def main(path: str, rebuild: bool = False, optimize: bool = False, batch_size: int = 1000,
+         workers: int = 0, resume_offset: int = 0, checkpoint: Optional[str] = None,
+         embed: bool = False):
+    """
+    流式导入 JSONL：按 batch_size 分批解析并各自提交事务，内存占用与文件大小无关。
+    每批提交后把字节偏移写入 checkpoint 文件，中断后可用 --resume 从该处继续。
+    """
     p = Path(path)
     if not p.exists():
         print(f"File not found: {p}")
         sys.exit(1)
     init_db()
-    items = []
+    checkpoint_path = Path(checkpoint) if checkpoint else None
+    total_size = p.stat().st_size
+    count = 0
     bad = 0
-    with p.open('r', encoding='utf-8') as f:
-        for i, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except Exception:
-                bad += 1
-                continue
-            q = obj.get('question')
-            a = obj.get('answer')
-            if not q or not a:
-                bad += 1
-                continue
-            lang = obj.get('language', 'auto')
-            tags = obj.get('tags')
-            source = obj.get('source')
-            items.append((q, a, lang, ",".join(tags) if isinstance(tags, list) else tags, source))
-    if not items:
+    offset = resume_offset
+    started = time.perf_counter()
+    for offset, items, chunk_bad in iter_parsed(p, batch_size, resume_offset, workers):
+        bad += chunk_bad
+        if items:
+            # 每批独立事务，写锁只在单批写入期间持有；FTS 由触发器增量维护
+            count += insert_faqs(items)
+        _write_checkpoint(checkpoint_path, offset)
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        pct = offset * 100.0 / total_size if total_size else 100.0
+        print(f"\r{pct:5.1f}% offset={offset} imported={count} bad={bad} ({rate:,.0f} rows/s)",
+              end='', flush=True)
+    print()
+    if count == 0 and bad == 0 and offset == resume_offset:
         print("No items to import")
         return
-    count = insert_faqs(items)
-    rebuild_fts()
-    print(f"Imported {count} items and rebuilt FTS index; skipped {bad} bad lines")
+    if rebuild:
+        rebuild_fts()
+    elif optimize:
+        optimize_fts()
+    if checkpoint_path is not None and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    if embed:
+        print(f"Embedded {embed_missing_faqs()} items")
+    elapsed = time.perf_counter() - started
+    print(f"Imported {count} items in {elapsed:.1f}s; skipped {bad} bad lines")
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/import_data.py data/samples/faq_sample.jsonl")
-        sys.exit(1)
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Import FAQ items from a JSONL file')
+    parser.add_argument('path', help='JSONL file, e.g. data/samples/faq_sample.jsonl')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per parse chunk and per transaction')
+    parser.add_argument('--workers', type=int, default=0, help='parse worker processes (0 = parse inline)')
+    parser.add_argument('--resume', action='store_true', help='continue from the offset saved in the checkpoint file')
+    parser.add_argument('--resume-offset', type=int, default=None, help='continue from this byte offset')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint file (default: <path>.offset, or under data/ or the temp dir '
+                             'when the file\'s directory is read-only)')
+    parser.add_argument('--optimize', action='store_true', help='merge FTS segments after import')
+    parser.add_argument('--rebuild', action='store_true', help='fully rebuild the FTS index (repair only)')
+    parser.add_argument('--embed', action='store_true', help='precompute embeddings for the imported items')
+    args = parser.parse_args()
 
+    checkpoint_file = args.checkpoint or str(default_checkpoint(args.path))
+    if not args.checkpoint and Path(checkpoint_file).parent != Path(args.path).resolve().parent:
+        print(f"Data directory is read-only, checkpoint file: {checkpoint_file}")
+    start = 0
+    if args.resume_offset is not None:
+        start = args.resume_offset
+    elif args.resume and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            start = int(f.read().strip() or 0)
+        print(f"Resuming from byte offset {start}")
+    main(args.path, rebuild=args.rebuild, optimize=args.optimize, batch_size=args.batch_size,
+         workers=args.workers, resume_offset=start, checkpoint=checkpoint_file, embed=args.embed)
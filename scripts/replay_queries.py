@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+查询日志回放压测工具
+按指定速率把查询日志（logs/queries.jsonl）中的真实查询重新发给本地服务：
+kind=query 发往 POST /api/query，kind=chat 发往 POST /chat。
+以开环方式按计划时间发送（服务变慢时不会自动降速），报告实际速率、错误数与 p50/p95/p99 延迟，
+以及相对计划时间的排队延迟（发送端跟不上时偏大，需增加 --workers）。
+
+用法:
+    python scripts/replay_queries.py --rate 50 --limit 2000
+    python scripts/replay_queries.py --log logs/queries.jsonl.2025-08-01 --kind query --speedup
+"""
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import http.client
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.query_log import read_query_log  # noqa: E402
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class Replayer:
+    def __init__(self, base_url: str, workers: int, timeout: float):
+        url = urlparse(base_url)
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.https = url.scheme == 'https'
+        self.timeout = timeout
+        self.workers = workers
+        self.jobs: 'queue.Queue[Optional[Tuple[float, Dict]]]' = queue.Queue()
+        self.results: List[Tuple[str, float, float, bool]] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _send(self, conn: http.client.HTTPConnection, record: Dict) -> bool:
+        if record.get('kind') == 'chat':
+            path, body = '/chat', {'message': record['q']}
+        else:
+            path, body = '/api/query', {'query': record['q'], 'top_k': int(record.get('top_k') or 5)}
+        conn.request('POST', path, body=json.dumps(body, ensure_ascii=False).encode('utf-8'),
+                     headers={'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status == 200
+
+    def _worker(self) -> None:
+        conn = self._connect()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            scheduled, record = job
+            started = time.perf_counter()
+            try:
+                ok = self._send(conn, record)
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = self._connect()
+            done = time.perf_counter()
+            with self._lock:
+                self.results.append((record.get('kind', 'query'), (done - started) * 1000,
+                                     max(0.0, (started - scheduled) * 1000), ok))
+        conn.close()
+
+    def run(self, records: List[Dict], rate: float) -> float:
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        started = time.perf_counter()
+        for i, record in enumerate(records):
+            scheduled = started + i / rate if rate > 0 else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.jobs.put((scheduled, record))
+        for _ in threads:
+            self.jobs.put(None)
+        for t in threads:
+            t.join()
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded query log against a local server')
+    parser.add_argument('--log', default=None, help='query log path (default: monitoring.query_log.path)')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--rate', type=float, default=20.0, help='requests per second (0 = as fast as possible)')
+    parser.add_argument('--speedup', action='store_true', help='same as --rate 0')
+    parser.add_argument('--limit', type=int, default=None, help='replay only the last N records')
+    parser.add_argument('--kind', choices=['all', 'query', 'chat'], default='all')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    records = read_query_log(args.log, last=args.limit)
+    if args.kind != 'all':
+        records = [r for r in records if r.get('kind', 'query') == args.kind]
+    if not records:
+        print("No records to replay")
+        return 1
+
+    rate = 0.0 if args.speedup else args.rate
+    replayer = Replayer(args.base_url, args.workers, args.timeout)
+    print(f"Replaying {len(records)} queries to {args.base_url} at "
+          f"{'max' if rate <= 0 else f'{rate:g}/s'} with {args.workers} workers ...")
+    elapsed = replayer.run(records, rate)
+
+    results = replayer.results
+    errors = sum(1 for r in results if not r[3])
+    print(f"done in {elapsed:.1f}s, achieved {len(results) / elapsed:.1f} req/s, errors={errors}")
+    print(f"{'kind':8} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'lag p95':>9}")
+    for kind in ['all'] + sorted({r[0] for r in results}):
+        rows = results if kind == 'all' else [r for r in results if r[0] == kind]
+        lat = sorted(r[1] for r in rows)
+        lag = sorted(r[2] for r in rows)
+        print(f"{kind:8} {len(rows):>7} {percentile(lat, 0.50):>9.1f} {percentile(lat, 0.95):>9.1f} "
+              f"{percentile(lat, 0.99):>9.1f} {lat[-1]:>9.1f} {percentile(lag, 0.95):>9.1f}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
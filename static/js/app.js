@@ -99,8 +99,8 @@ class ChatApp {
         this.showTypingIndicator();
 
         try {
-            // 发送消息到后端
-            const response = await fetch('/chat', {
+            // 流式接口：答案一就绪就渲染，不等待写库完成
+            const response = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -111,21 +111,42 @@ class ChatApp {
                 })
             });
 
-            const data = await response.json();
-            
-            // 隐藏打字指示器
-            this.hideTypingIndicator();
-
-            if (data.success) {
-                // 更新当前会话ID
-                this.currentSessionId = data.session_id;
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP ${response.status}`);
+            }
 
-                // 添加机器人回复
-                this.addMessage(data.response, 'bot');
+            let answered = false;
+            await this.readEventStream(response, (event, data) => {
+                switch (event) {
+                    case 'session':
+                        // 更新当前会话ID
+                        this.currentSessionId = data.session_id;
+                        break;
+                    case 'answer':
+                        // 隐藏打字指示器并添加机器人回复
+                        this.hideTypingIndicator();
+                        this.addMessage(data.response, 'bot');
+                        answered = true;
+                        break;
+                    case 'candidates':
+                        this.addSuggestions(data.candidates);
+                        break;
+                    case 'done':
+                        // 用响应携带的会话摘要就地更新列表，无需重新拉取
+                        this.upsertSession(data.session);
+                        break;
+                    case 'error':
+                        if (!answered) {
+                            this.hideTypingIndicator();
+                            this.addMessage('抱歉，发生了错误，请稍后再试。', 'bot');
+                            answered = true;
+                        }
+                        break;
+                }
+            });
 
-                // 更新会话列表
-                this.loadSessions();
-            } else {
+            if (!answered) {
+                this.hideTypingIndicator();
                 this.addMessage('抱歉，发生了错误，请稍后再试。', 'bot');
             }
         } catch (error) {
@@ -135,6 +156,54 @@ class ChatApp {
         }
     }
 
+    async readEventStream(response, onEvent) {
+        // 解析 SSE：事件之间以空行分隔，每个事件含 event: 与 data: 行
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                const dataLines = [];
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                }
+                if (dataLines.length) {
+                    onEvent(event, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+
+    addSuggestions(candidates) {
+        // 相关问题：除首个命中外最多展示 3 个，点击即发送
+        const items = (candidates || []).slice(1, 4);
+        if (!items.length) return;
+
+        const container = document.createElement('div');
+        container.className = 'suggestions';
+        items.forEach(candidate => {
+            const item = document.createElement('div');
+            item.className = 'suggestion-item';
+            item.textContent = candidate.question;
+            item.addEventListener('click', () => sendQuickMessage(candidate.question));
+            container.appendChild(item);
+        });
+
+        this.chatContainer.appendChild(container);
+        this.scrollToBottom();
+    }
+
     addMessage(content, type) {
         // 清除欢迎消息
         this.clearWelcomeMessage();
@@ -223,7 +292,7 @@ class ChatApp {
                 this.chatContainer.innerHTML = '';
                 this.addWelcomeScreen();
                 this.messageInput.focus();
-                this.loadSessions();
+                this.upsertSession(data.session);
             }
         } catch (error) {
             console.error('Error creating new chat:', error);
@@ -244,6 +313,16 @@ class ChatApp {
         }
     }
 
+    // 将会话摘要放到列表顶部（已存在则替换），缺少摘要时回退为整表拉取
+    upsertSession(session) {
+        if (!session) {
+            this.loadSessions();
+            return;
+        }
+        this.sessions = [session, ...this.sessions.filter(s => s.id !== session.id)];
+        this.updateSessionsList();
+    }
+
     updateSessionsList() {
         const historyContainer = document.querySelector('.chat-history');
         if (!historyContainer) return;
@@ -312,7 +391,8 @@ class ChatApp {
                     this.chatContainer.innerHTML = '';
                 }
 
-                this.loadSessions();
+                this.sessions = this.sessions.filter(s => s.id !== sessionId);
+                this.updateSessionsList();
             }
         } catch (error) {
             console.error('Error deleting session:', error);
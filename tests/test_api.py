@@ -35,3 +35,241 @@ def test_query():
     data = r.json()
     assert data['answer']
 
+
+
+def test_faqs_keyset_pagination_and_projection():
+    dm.insert_faqs([(f'Paging question {i}', f'Paging answer {i}', 'en', 'paging,demo', 'pager') for i in range(5)])
+    c = TestClient(app)
+    r = c.get('/api/faqs', params={'limit': 3, 'fields': 'question', 'source': 'pager'})
+    assert r.status_code == 200
+    page = r.json()
+    assert len(page) == 3 and set(page[0]) == {'id', 'question'}
+    assert r.headers['X-Has-More'] == 'true'
+    r2 = c.get('/api/faqs', params={'limit': 3, 'source': 'pager', 'before_id': r.headers['X-Next-Before-Id']})
+    ids = [x['id'] for x in page] + [x['id'] for x in r2.json()]
+    assert len(ids) == 5 and ids == sorted(ids, reverse=True)
+    assert r2.headers['X-Has-More'] == 'false'
+    tagged = c.get('/api/faqs', params={'tag': 'demo', 'fields': 'tags'}).json()
+    assert len(tagged) == 5 and all('demo' in x['tags'] for x in tagged)
+    assert c.get('/api/faqs', params={'tag': 'dem'}).json() == []
+    # LIKE 通配符按字面匹配
+    assert c.get('/api/faqs', params={'tag': '%demo'}).json() == []
+
+
+def test_faq_update_and_delete():
+    c = TestClient(app)
+    auth = {'Authorization': 'Bearer ' + os.getenv('WONK_ADMIN_TOKEN', 'wonk-admin-2025')}
+    dm.insert_faqs([('Editable question', 'Old answer', 'en', None, 'edit'),
+                    ('Second editable', 'Another answer', 'en', None, 'edit')])
+    ids = [x['id'] for x in c.get('/api/faqs', params={'source': 'edit'}).json()]
+    r = c.put(f'/api/faqs/{ids[0]}', json={'answer': 'Brand new answer'}, headers=auth)
+    assert r.status_code == 200 and r.json()['updated'] == 1 and 'total' in r.json()['latency_ms']
+    # 部分更新只改答案，FTS 立即可检索
+    assert dm.get_faq(ids[0])['question'] == 'Second editable'
+    assert any(row['id'] == ids[0] for row in dm.search_bm25('Brand', top_k=5))
+    # 改成与已有FAQ相同的内容会冲突
+    r = c.put(f'/api/faqs/{ids[1]}', json={'question': 'Second editable', 'answer': 'Brand new answer'}, headers=auth)
+    assert r.status_code == 409
+    r = c.post('/api/faqs/bulk_update', json={'items': [{'id': ids[1], 'tags': ['x']}, {'id': 999999}]}, headers=auth)
+    assert r.json()['updated'] == 1 and r.json()['missing'] == [999999]
+    assert c.delete(f'/api/faqs/{ids[0]}', headers=auth).json()['deleted'] == 1
+    assert c.delete(f'/api/faqs/{ids[0]}', headers=auth).status_code == 404
+    r = c.post('/api/faqs/bulk_delete', json={'ids': [ids[1]]}, headers=auth)
+    assert r.json()['deleted'] == 1
+    assert c.put(f'/api/faqs/{ids[1]}', json={'answer': 'x'}).status_code in (401, 403)
+
+
+def test_chat_and_sessions_served_by_asgi_app():
+    from app.core.chat_service import chat_service
+    chat_service.cache.clear()
+    c = TestClient(app)
+    r = c.get('/')
+    assert r.status_code == 200 and '/static/js/app.js' in r.text
+    assert c.get('/static/js/app.js').status_code == 200
+    r = c.post('/chat', json={'message': 'What is Wonk?'})
+    data = r.json()
+    assert data['success'] and data['session_id']
+    # 用户ID保存在会话 Cookie 中，同一客户端看到自己的会话
+    r = c.get('/sessions')
+    assert [s['id'] for s in r.json()['sessions']] == [data['session_id']]
+    assert c.get('/sessions', headers={'If-None-Match': r.headers['etag']}).status_code == 304
+    r = c.post('/chat/stream', json={'message': 'hello', 'session_id': data['session_id']})
+    assert r.headers['content-type'].startswith('text/event-stream')
+    assert 'event: done' in r.text
+    messages = c.get(f"/sessions/{data['session_id']}/messages").json()['messages']
+    assert len(messages) == 4
+    assert c.delete(f"/sessions/{data['session_id']}").json()['success']
+
+
+def test_legacy_flask_cookie_migrates_and_cors_limited_to_api():
+    import hashlib
+    from itsdangerous import URLSafeTimedSerializer
+    from app.utils.auth import get_session_secret
+    sid = dm.create_chat_session('旧版会话', 'legacy-user')
+    # 旧版 Flask 入口签发的会话 Cookie
+    legacy = URLSafeTimedSerializer(get_session_secret(), salt='cookie-session', signer_kwargs={
+        'key_derivation': 'hmac', 'digest_method': hashlib.sha1}).dumps({'user_id': 'legacy-user'})
+    c = TestClient(app)
+    r = c.get('/sessions', headers={'Cookie': f'session={legacy}'})
+    assert [s['id'] for s in r.json()['sessions']] == [sid]
+    # 响应换发新格式的 Cookie，之后的请求不再依赖旧 Cookie
+    assert c.cookies.get('session') != legacy
+    assert [s['id'] for s in c.get('/sessions').json()['sessions']] == [sid]
+
+    origin = {'Origin': 'https://evil.example'}
+    r = c.get('/sessions', headers=origin)
+    assert 'access-control-allow-origin' not in r.headers
+    r = c.options(f'/sessions/{sid}', headers={**origin, 'Access-Control-Request-Method': 'DELETE'})
+    assert 'access-control-allow-origin' not in r.headers
+    r = c.post('/api/query', json={'query': 'Wonk', 'top_k': 1}, headers=origin)
+    assert r.headers['access-control-allow-origin'] == '*'
+    assert 'access-control-allow-credentials' not in r.headers
+
+
+def test_rate_limit_token_bucket_and_inflight_gate(monkeypatch):
+    import asyncio
+    from app.utils import ratelimit
+    from app.utils.config import reload_config_cache
+    conf = {'enabled': True, 'requests_per_minute': 60, 'burst': 2, 'paths': ['/api/query']}
+    monkeypatch.setattr(ratelimit, 'get_conf', lambda path, default=None: conf)
+    reload_config_cache()
+    c = TestClient(app)
+    try:
+        for _ in range(2):
+            r = c.post('/api/query', json={'query': 'Wonk', 'top_k': 1})
+            assert r.status_code == 200 and 'x-queue-wait-ms' in r.headers
+        r = c.post('/api/query', json={'query': 'Wonk', 'top_k': 1})
+        assert r.status_code == 429 and int(r.headers['retry-after']) >= 1
+        # 无关的配置变更不重置令牌桶
+        reload_config_cache()
+        assert c.post('/api/query', json={'query': 'Wonk', 'top_k': 1}).status_code == 429
+        # /health 不在限流路径内，并报告限流计数
+        assert c.get('/health').json()['rate_limit']['limited'] == 2
+    finally:
+        monkeypatch.undo()
+        reload_config_cache()
+
+    async def run_gate():
+        gate = ratelimit.InflightGate(max_inflight=1, max_queue=1, timeout=0.05)
+        assert (await gate.acquire()) == (True, 0.0)
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        # 队列已满，立即拒绝
+        assert (await gate.acquire()) == (False, 0.0)
+        ok, waited = await waiter
+        assert not ok and waited >= 40
+        gate.release()
+        assert (await gate.acquire())[0] and gate.rejected == 2
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run_gate())
+    finally:
+        loop.close()
+
+
+def test_rate_limit_charges_ip_when_cookies_rotate(monkeypatch):
+    from app.utils import ratelimit
+    from app.utils.config import reload_config_cache
+    # 与上一个测试的参数不同，换一组新的令牌桶
+    conf = {'enabled': True, 'requests_per_minute': 60, 'burst': 3, 'paths': ['/chat']}
+    monkeypatch.setattr(ratelimit, 'get_conf', lambda path, default=None: conf)
+    reload_config_cache()
+    c = TestClient(app)
+    try:
+        statuses = []
+        for _ in range(5):
+            # 每次换一个新 Cookie（新的 user_id），同一 IP 仍共用一个桶
+            c.cookies.clear()
+            assert c.get('/sessions').status_code == 200
+            statuses.append(c.post('/chat', json={'message': 'What is Wonk?'}).status_code)
+        assert statuses == [200, 200, 200, 429, 429]
+    finally:
+        monkeypatch.undo()
+        reload_config_cache()
+
+
+def test_metrics_exposes_stage_histograms_and_cache_ratios(monkeypatch):
+    from app import main
+    c = TestClient(app)
+    c.post('/api/query', json={'query': 'What is Wonk?', 'top_k': 3})
+    c.post('/chat', json={'message': 'What is Wonk?'})
+    # 未开启时不暴露
+    assert c.get('/metrics').status_code == 404
+    monkeypatch.setattr(main, 'get_conf', lambda path, default=None:
+                        True if path == 'monitoring.metrics.enabled' else default)
+    # 开启后必须携带 token
+    assert c.get('/metrics').status_code == 401
+    assert c.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    monkeypatch.setenv('WONK_METRICS_TOKEN', 'scrape-token')
+    r = c.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert r.status_code == 200 and r.headers['content-type'].startswith('text/plain')
+    text = r.text
+    assert '# TYPE wonk_stage_duration_seconds histogram' in text
+    for stage in ('bm25', 'fuse', 'hydrate', 'chat_db_write'):
+        assert f'wonk_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}}' in text
+        assert f'wonk_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'wonk_session_cache_hit_ratio{kind="history"}' in text
+    assert 'wonk_chat_answers_total{level=' in text
+    assert 'wonk_vector_index_generation' in text
+
+
+def test_query_trace_debug_timings_and_slow_log(monkeypatch):
+    import json
+    from app.utils import tracing
+    from app.utils.logger import logger
+    c = TestClient(app)
+    auth = {'Authorization': 'Bearer ' + os.getenv('WONK_ADMIN_TOKEN', 'wonk-admin-2025')}
+    body = {'query': 'What is Wonk?', 'top_k': 3, 'debug': True}
+    # debug 仅对管理员生效
+    assert c.post('/api/query', json=body).json()['timings'] is None
+    data = c.post('/api/query', json=body, headers=auth).json()
+    assert data['trace_id'] and data['timings']['bm25'] >= 0 and data['timings']['total'] >= data['timings']['bm25']
+
+    log_path = os.path.join(_td.name, 'slow.jsonl')
+    conf = {'monitoring.tracing.slow_ms': 0, 'monitoring.tracing.path': log_path}
+    monkeypatch.setattr(tracing, 'get_conf', lambda path, default=None: conf.get(path, default))
+    monkeypatch.setattr(tracing, '_sink_id', None)
+    try:
+        trace_id = c.post('/api/query', json={'query': 'FAQ chatbot', 'top_k': 3}).json()['trace_id']
+        logger.complete()
+        with open(log_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+    finally:
+        logger.remove(tracing._sink_id)
+    record = next(r for r in records if r['trace_id'] == trace_id)
+    assert record['slow'] and record['candidates'] >= 1 and 'bm25' in record['spans']
+
+
+def test_result_cache_generation_query_log_and_warm(monkeypatch):
+    import json
+    from app.core import query_log
+    from app.core.retriever import get_result_cache
+    from app.utils.logger import logger
+    log_path = os.path.join(_td.name, 'queries.jsonl')
+    real_get_conf = query_log.get_conf
+    monkeypatch.setattr(query_log, 'get_conf', lambda path, default=None:
+                        log_path if path == 'monitoring.query_log.path' else real_get_conf(path, default))
+    monkeypatch.setattr(query_log, '_sink_id', None)
+    c = TestClient(app)
+    cache = get_result_cache()
+    try:
+        body = {'query': 'local   chatbot', 'top_k': 2}
+        first = c.post('/api/query', json=body).json()
+        hits = cache.hits
+        assert c.post('/api/query', json=body).json()['candidates'] == first['candidates']
+        assert cache.hits == hits + 1
+        # 任何FAQ写入都会推进代数，旧结果不再命中
+        dm.insert_faqs([('Is the chatbot local?', 'Yes, fully local.', 'en', None, 'cache')])
+        c.post('/api/query', json=body)
+        assert cache.hits == hits + 1
+        logger.complete()
+        records = query_log.read_query_log(log_path)
+        assert [r['cache'] for r in records[-3:]] == ['miss', 'hit', 'miss']
+        assert records[-1]['q'] == 'local chatbot' and records[-1]['found']
+        cache.clear()
+        assert query_log.warm_caches(top_n=5) >= 1
+        c.post('/api/query', json=body)
+        assert cache.hits == hits + 2
+    finally:
+        logger.remove(query_log._sink_id)
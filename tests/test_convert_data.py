@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from convert_data import DataConverter  # noqa: E402
+
+
+def test_tags_split_on_commas_or_semicolons():
+    tags = pd.Series(['a, b', 'x;y', '', 'a,,b,', 'k;v, w'])
+    assert DataConverter._tags_for_jsonl(tags) == [['a', 'b'], ['x', 'y'], [], ['a', 'b'], ['k;v', 'w']]
+    assert DataConverter._tags_for_db(tags) == ['a,b', 'x;y', None, 'a,b', 'k;v,w']
+
+
+def test_detect_encoding_from_sample():
+    conv = DataConverter()
+    with tempfile.TemporaryDirectory() as td:
+        cases = {
+            'bom.csv': ('utf-8-sig', 'question,answer\n问题,答案\n'),
+            'gbk.csv': ('gbk', 'question,answer\n如何重置密码,点击忘记密码\n'),
+        }
+        for name, (encoding, text) in cases.items():
+            path = Path(td) / name
+            path.write_bytes(text.encode(encoding))
+            assert conv.detect_encoding(path) == encoding
+        # 样本在多字节字符中间截断时仍识别为 UTF-8
+        path = Path(td) / 'utf8.csv'
+        path.write_bytes('question,answer\n问题,答案\n'.encode('utf-8'))
+        assert conv.detect_encoding(path, sample_size=len('question,answer\n问'.encode('utf-8')) + 1) == 'utf-8'
+
+
+def test_excel_streams_in_chunks():
+    from openpyxl import Workbook
+    conv = DataConverter(chunksize=2)
+    with tempfile.TemporaryDirectory() as td:
+        path = Path(td) / 'faqs.xlsx'
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['question', 'answer', 'tags', None])
+        for i in range(5):
+            ws.append([f'q{i}', f'a{i}', None if i % 2 else 't1;t2', i])
+        wb.save(path)
+        frames = list(conv.iter_frames(str(path)))
+        assert [len(f) for f in frames] == [2, 2, 1]
+        assert list(frames[0].columns) == ['question', 'answer', 'tags', 'column_3']
+        assert frames[0]['column_3'].tolist() == ['0', '1'] and pd.isna(frames[0]['tags'][1])
+        clean, errors = conv.validate_data(frames[0])
+        assert errors == [] and clean['tags'].tolist() == ['t1;t2', ''] and clean['source'].tolist() == ['imported'] * 2
+
+
+def test_convert_file_truncates_output_once():
+    conv = DataConverter(chunksize=2)
+    with tempfile.TemporaryDirectory() as td:
+        src = Path(td) / 'faqs.csv'
+        out = Path(td) / 'out' / 'faqs.jsonl'
+        out.parent.mkdir()
+        out.write_text('stale\n', encoding='utf-8')
+        # 首块全部无效，后续块仍追加到已清空的文件
+        src.write_text('question,answer,tags\n,,\n , \nq1,a1,"a, b"\nq2,a2,\nq3,a3,x;y\n', encoding='utf-8')
+        count, errors = conv.convert_file(str(src), str(out))
+        records = [json.loads(line) for line in out.read_text(encoding='utf-8').splitlines()]
+        assert count == 3 and [r['question'] for r in records] == ['q1', 'q2', 'q3']
+        assert [r['tags'] for r in records] == [['a', 'b'], [], ['x', 'y']]
+        assert errors == ['第 1 块: 移除了 2 行空数据']
+        # 没有任何有效数据时输出被清空，而不是保留上次的内容
+        src.write_text('question,answer\n,\n', encoding='utf-8')
+        assert conv.convert_file(str(src), str(out))[0] == 0
+        assert out.read_text(encoding='utf-8') == ''
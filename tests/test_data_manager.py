@@ -1,4 +1,5 @@
 import os
+import sqlite3
 import tempfile
 from app.core import data_manager as dm
 
@@ -24,3 +25,427 @@ def test_insert_and_search_bm25():
         res_cn = dm.search_bm25('本地运行', top_k=5)
         assert len(res_cn) >= 1
 
+
+
+def test_chat_messages_keyset_pagination():
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        sid = dm.create_chat_session('分页测试', 'u1')
+        ids = [dm.add_chat_message(sid, 'user', f'msg {i}') for i in range(10)]
+        # 默认返回最新一页，按时间正序
+        latest = dm.get_chat_messages(sid, limit=3)
+        assert [m['id'] for m in latest] == ids[-3:]
+        # 向上翻页
+        older = dm.get_chat_messages(sid, limit=3, before_id=latest[0]['id'])
+        assert [m['id'] for m in older] == ids[-6:-3]
+        # 增量拉取
+        newer = dm.get_chat_messages(sid, limit=5, after_id=ids[7])
+        assert [m['id'] for m in newer] == ids[8:]
+
+
+def test_sessions_etag_tracks_every_list_change():
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        older = dm.create_chat_session('a', 'u1')
+        latest = dm.create_chat_session('b', 'u1')
+        dm.add_chat_message(latest, 'user', 'hi')
+        tags = [dm.get_chat_sessions_etag('u1')]
+        # 同一秒内给较早的会话发消息：MAX(updated_at) 不变，但列表顺序变了
+        dm.add_chat_message(older, 'user', 'hi')
+        tags.append(dm.get_chat_sessions_etag('u1'))
+        dm.delete_chat_session(older)
+        dm.delete_chat_session(latest)
+        tags.append(dm.get_chat_sessions_etag('u1'))
+        # 删光后新建的会话复用了被删会话的ID
+        assert dm.create_chat_session('c', 'u1') in (older, latest)
+        tags.append(dm.get_chat_sessions_etag('u1'))
+        assert len(set(tags)) == len(tags)
+        assert dm.get_chat_sessions_etag('u2') == '0-0'
+        dm.refresh_db_stats()
+        assert dm.get_chat_sessions_etag('u1') not in tags
+
+
+def test_retention_purge_and_orphan_sweep():
+    from app.core import retention
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        old_ids = [dm.create_chat_session(f'旧会话 {i}', 'u1') for i in range(5)]
+        keep = dm.create_chat_session('新会话', 'u1')
+        for sid in old_ids + [keep]:
+            dm.add_chat_message(sid, 'user', 'hello')
+        with dm.get_conn() as conn:
+            conn.execute("UPDATE chat_sessions SET updated_at = datetime('now', '-90 days') WHERE id != ?;", (keep,))
+        # 模拟外键未启用时遗留的孤儿消息
+        raw = sqlite3.connect(dm.DB_PATH)
+        raw.execute("INSERT INTO chat_messages (session_id, role, content) VALUES (9999, 'user', 'orphan');")
+        raw.commit()
+        raw.close()
+
+        # 外键启用后删除会话会级联删除消息
+        assert dm.delete_chat_session(old_ids[0]) == 1
+        assert dm.get_chat_messages(old_ids[0]) == []
+
+        stats = retention.run_retention(days=30, batch_size=2)
+        assert stats['sessions'] == 4
+        assert stats['messages'] == 4
+        assert stats['orphans'] == 1
+        assert [s['id'] for s in dm.get_chat_sessions('u1')] == [keep]
+        assert len(dm.get_chat_messages(keep)) == 1
+
+
+def test_iter_chat_export_groups_and_resumes():
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        s1 = dm.create_chat_session('a', 'u1')
+        s2 = dm.create_chat_session('b', 'u2')
+        s3 = dm.create_chat_session('c', 'u1')
+        dm.add_chat_message(s1, 'user', 'q1')
+        dm.add_chat_message(s1, 'assistant', 'a1')
+        dm.add_chat_message(s3, 'user', 'q3')
+        exported = list(dm.iter_chat_export())
+        assert [s['id'] for s in exported] == [s1, s2, s3]
+        assert [m['content'] for m in exported[0]['messages']] == ['q1', 'a1']
+        assert exported[1]['messages'] == []
+        assert [s['id'] for s in dm.iter_chat_export(user_id='u1', after_session_id=s1)] == [s3]
+
+
+def test_archive_idle_sessions_is_transparent():
+    from app.core import retention
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        sid = dm.create_chat_session('归档', 'u1')
+        ids = [dm.add_chat_message(sid, 'user', f'历史消息 {i}' * 20) for i in range(6)]
+        with dm.get_conn() as conn:
+            conn.execute("UPDATE chat_sessions SET updated_at = datetime('now', '-120 days');")
+        stats = retention.archive_idle_sessions(days=90)
+        assert stats['sessions'] == 1 and stats['messages'] == 5
+        assert stats['stored_bytes'] < stats['raw_bytes']
+        # 最后一条消息保留在线，新消息ID不会与归档消息冲突
+        new_id = dm.add_chat_message(sid, 'assistant', '新消息')
+        assert new_id > ids[-1]
+        history = dm.get_chat_messages(sid, limit=100)
+        assert [m['id'] for m in history] == ids + [new_id]
+        page = dm.get_chat_messages(sid, limit=2, before_id=ids[3])
+        assert [m['id'] for m in page] == ids[1:3]
+        # 跨越归档与在线消息的一页，以及归档内的增量拉取；结果统一为 dict
+        reads = dm.archive_read_stats()['reads']
+        page = dm.get_chat_messages(sid, limit=3)
+        assert [m['id'] for m in page] == ids[-2:] + [new_id]
+        assert all(isinstance(m, dict) and m['session_id'] == sid for m in page)
+        assert [m['id'] for m in dm.get_chat_messages(sid, limit=3, after_id=ids[1])] == ids[2:5]
+        assert [m['id'] for m in dm.get_chat_messages(sid, limit=3, after_id=ids[-1])] == [new_id]
+        # 同一归档翻页不重复解压；在线部分足够时不读归档
+        assert dm.archive_read_stats()['reads'] <= reads + 1
+        assert [m['id'] for m in dm.get_chat_messages(sid, limit=1)] == [new_id]
+        assert [m['id'] for m in next(dm.iter_chat_export())['messages']] == ids + [new_id]
+        assert retention.get_archive_stats()['saved_bytes'] > 0
+
+
+def test_db_stats_maintained_by_triggers():
+    from app.core import retention
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        dm.insert_faqs([('q1', 'a1', 'en', None, 'test'), ('q2', 'a2', 'en', None, 'test')])
+        s1 = dm.create_chat_session('a', 'u1')
+        s2 = dm.create_chat_session('b', 'u1')
+        s3 = dm.create_chat_session('c', 'u2')
+        for sid in (s1, s1, s1, s2, s3):
+            dm.add_chat_message(sid, 'user', 'hi')
+        dm.delete_chat_session(s3)
+        with dm.get_conn() as conn:
+            conn.execute("UPDATE chat_sessions SET updated_at = datetime('now', '-120 days') WHERE id = ?;", (s1,))
+        retention.archive_idle_sessions(days=90)
+        stats = dm.get_db_stats()
+        assert stats['faqs'] == 2
+        assert stats['sessions'] == 2
+        assert stats['users'] == 1
+        assert stats['messages'] == 2 and stats['archived_messages'] == 2
+        assert sum(d['messages'] for d in stats['daily_messages']) == 5
+        dm.refresh_db_stats()
+        refreshed = dm.get_db_stats()
+        for key in ('faqs', 'sessions', 'users', 'messages', 'archived_messages'):
+            assert refreshed[key] == stats[key]
+        # 已归档消息的每日计数不会被重算抹掉
+        assert refreshed['daily_messages'] == stats['daily_messages']
+
+        # 模拟升级前的库：缺少新增的计数项，每日统计中有已清理消息的历史
+        with dm.get_conn() as conn:
+            conn.execute("DELETE FROM db_stats WHERE key = 'faq_generation';")
+            conn.execute("INSERT INTO chat_daily_stats(day, messages) VALUES ('2020-01-01', 7);")
+        dm.init_db()
+        upgraded = dm.get_db_stats(days=100000)
+        assert upgraded['faq_generation'] >= 1 and upgraded['messages'] == stats['messages']
+        assert {'day': '2020-01-01', 'messages': 7} in upgraded['daily_messages']
+
+
+def test_incremental_fts_without_rebuild():
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        for i in range(3):
+            dm.insert_faqs([(f'How to reset password {i}', f'Answer {i}', 'en', None, 'test')])
+        # 触发器已增量索引，无需 rebuild
+        assert len(dm.search_bm25('password', top_k=10)) == 3
+        dm.optimize_fts()
+        dm.optimize_fts(merge_pages=16)
+        assert len(dm.search_bm25('password', top_k=10)) == 3
+        dm.rebuild_fts()
+        assert len(dm.search_bm25('password', top_k=10)) == 3
+
+
+def test_upsert_is_idempotent_and_flags_near_duplicates():
+    from app.core import dedup
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        rows = [
+            ('如何重置密码？', '在设置页点击“忘记密码”。', 'zh', None, 'a'),
+            ('How do I reset my password?', 'Use the forgot password link.', 'en', None, 'a'),
+        ]
+        assert dm.upsert_faqs(rows) == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+        # 格式差异（全角/空白/大小写）视为同一内容
+        again = [('如何重置密码?', '在设置页点击“忘记密码”。', 'zh', None, 'a'),
+                 ('how do i reset my  password', 'Use the forgot password link.', 'en', 'auth', 'b')]
+        assert dm.upsert_faqs(again) == {'inserted': 0, 'updated': 1, 'unchanged': 1}
+        assert dm.count_faqs() == 2
+        # 只返回新插入的行ID，供导入时只编码这些行
+        more = again + [('How do I close my account?', 'Contact support.', 'en', None, 'b')]
+        assert dm.upsert_faqs(more, with_ids=True) == {'inserted': 1, 'updated': 0, 'unchanged': 2,
+                                                        'inserted_ids': [3]}
+        dm.delete_faqs([3])
+
+        flagged = dedup.check_items(['How can I reset my password?', '完全无关的问题：发票怎么开'], threshold=0.5)
+        assert list(flagged) == [0]
+        assert flagged[0][0]['id'] == 2
+
+
+def test_embeddings_persisted_and_invalidated():
+    from app.core.retriever import SemanticRetriever
+
+    class FakeRetriever(SemanticRetriever):
+        def _lazy_init(self):
+            self.backend = 'fake'
+            self.available = True
+            self.encoded = 0
+
+        @property
+        def model_tag(self):
+            return 'fake:v1'
+
+        def _encode(self, texts, batch_size=None):
+            self.encoded += len(texts)
+            return [[float(len(t)), 1.0] for t in texts]
+
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        dm.insert_faqs([('q1', 'a1', 'en', None, 't'), ('q2', 'a2', 'en', None, 't')])
+        r = FakeRetriever()
+        assert r.embed_missing() == 2
+        # 已有向量时只加载，不再编码
+        r.build_from_db()
+        assert r.encoded == 2 and len(r.id_map) == 2
+        assert list(r.embeddings[0]) == [6.0, 1.0]
+        faq_id = r.id_map[0]
+        # 只改元数据不影响向量；改答案后向量失效，删除FAQ级联删除向量
+        dm.update_faq(faq_id, 'q1', 'a1', 'zh', 'x', 't')
+        assert dm.count_embeddings('fake:v1') == 2
+        dm.update_faq(faq_id, 'q1', 'a1 changed', 'zh', 'x', 't')
+        assert [row['id'] for row in dm.get_faqs_without_embedding('fake:v1')] == [faq_id]
+        dm.delete_faq(r.id_map[1])
+        assert dm.count_embeddings() == 0
+        # 其他模型的向量视为缺失
+        assert len(dm.get_faqs_without_embedding('other')) == 1
+        r.build_from_db()
+        assert r.encoded == 3 and r.id_map == [faq_id]
+        # 单条编辑只重新编码受影响的行，并就地替换缓存
+        dm.update_faqs([(faq_id, {'answer': 'a1 again'})])
+        assert r.refresh_ids([faq_id]) == 1
+        assert r.encoded == 4 and list(r.embeddings[0]) == [12.0, 1.0] and r.faq_count == 1
+        # 本进程修补后代数已同步，不会误判过期；其他 worker 的编辑（FAQ 数量不变）使缓存失效
+        r.check_stale()
+        assert r.embeddings
+        dm.update_faqs([(faq_id, {'answer': 'edited elsewhere'})])
+        r.check_stale()
+        assert r.embeddings == [] and r.query('edited', top_k=1)[0][0] == faq_id
+        assert list(r.embeddings[0]) == [20.0, 1.0]
+        # 编码期间其他编辑提交：修补后不同步代数，缓存仍按过期处理
+        dm.insert_faqs([('q3', 'a3', 'en', None, 't')])
+        with dm.get_conn() as conn:
+            other = [conn.execute("SELECT id FROM faqs WHERE question = 'q3';").fetchone()[0]]
+        r.refresh_ids(other)
+        encode = r._encode
+
+        def encode_during_edit(texts, batch_size=None):
+            dm.update_faqs([(faq_id, {'answer': 'edited concurrently'})])
+            return encode(texts, batch_size)
+
+        r._encode = encode_during_edit
+        dm.update_faqs([(other[0], {'answer': 'a3 changed'})])
+        r.refresh_ids(other)
+        r._encode = encode
+        r.check_stale()
+        assert r.embeddings == []
+        r.build_from_db()
+        dm.delete_faqs(other)
+        r.refresh_ids(other)
+        dm.delete_faqs([faq_id])
+        r.refresh_ids([faq_id])
+        assert r.id_map == [] and r.faq_count == 0
+
+
+def test_chat_answer_uses_retrieval_with_canned_fallback(monkeypatch):
+    from app.utils import config
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        path = os.path.join(td, 'config.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("retrieval:\n  top_k: 5\n  fuse_alpha: 0.0\n  confidence_threshold: {high: 0.8, low: 0.2}\n")
+        monkeypatch.setattr(config, 'CONFIG_PATH', path)
+        config.reload_config_cache()
+        # chat_service 导入时会初始化数据库，需在切换到临时库之后导入
+        from app.core import chat_service as cs
+        cs.chat_service.cache.clear()
+        dm.insert_faqs([('How do I reset my password', 'Use the reset link on the login page.', 'en', None, 't'),
+                        ('How do I change my avatar', 'Open settings and upload a picture.', 'en', None, 't')])
+        hit = cs.chat_service.answer('password')
+        assert hit['source_id'] is not None and 'reset link' in hit['response']
+        assert {'bm25', 'semantic', 'fuse', 'hydrate', 'answer'} <= set(hit['timings'])
+        miss = cs.chat_service.answer('你好')
+        assert miss['source_id'] is None and miss['level'] in ('low', 'none')
+        assert miss['response'].startswith('你好！')
+        resp = cs.chat_service.send_message('password', user_id='u1')
+        assert resp.success and resp.source_id == hit['source_id'] and resp.timings['total'] >= 0
+        monkeypatch.undo()
+    config.reload_config_cache()
+
+
+def test_chat_stream_events_and_persistence():
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        from app.core.chat_service import chat_service
+        chat_service.cache.clear()
+        events = list(chat_service.stream_message('hello', user_id='u1'))
+        assert [e for e, _ in events] == ['session', 'answer', 'candidates', 'done']
+        done = events[-1][1]
+        assert done['ttfb_ms'] <= done['total_ms']
+        history = dm.get_chat_messages(done['session_id'])
+        assert [(m['id'], m['role']) for m in history] == [
+            (done['user_message_id'], 'user'), (done['message_id'], 'assistant')]
+        # 客户端断开：回答前断开不写任何消息，推送回答后断开时问答成对写入
+        sid = done['session_id']
+        stream = chat_service.stream_message('gone early', session_id=sid, user_id='u1')
+        next(stream)
+        stream.close()
+        assert len(dm.get_chat_messages(sid)) == 2
+        stream = chat_service.stream_message('gone later', session_id=sid, user_id='u1')
+        next(stream), next(stream)
+        stream.close()
+        assert [m['role'] for m in dm.get_chat_messages(sid)] == ['user', 'assistant'] * 2
+
+
+def test_intent_matcher_priority_and_hot_reload(monkeypatch):
+    from app.core import intents
+    from app.utils import config
+    m = intents.IntentMatcher(intents.parse_intents([
+        {'name': 'low', 'priority': 1, 'keywords': ['she'], 'response': 'low'},
+        {'name': 'high', 'priority': 9, 'keywords': ['he', 'HERS'], 'response': 'high'},
+        {'name': 'mid', 'priority': 5, 'keywords': ['你好'], 'response': 'mid {time}'},
+    ]))
+    # 重叠关键词（she/he）经失败链同时命中，取优先级高者
+    assert m.match('ushers').name == 'high'
+    assert m.match('说声你好').name == 'mid' and '{time}' not in m.respond('你好')
+    assert m.match('nothing') is None
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, 'config.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("chat:\n  intents:\n    - {name: ping, keywords: [ping], response: pong}\n")
+        monkeypatch.setattr(config, 'CONFIG_PATH', path)
+        config.reload_config_cache()
+        assert intents.get_intent_matcher().respond('PING!') == 'pong'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("chat:\n  intents:\n    - {name: ping, keywords: [ping], response: pong2}\n")
+        os.utime(path, ns=(0, 1))
+        assert config.check_config_changed(interval=0)
+        assert intents.get_intent_matcher().respond('ping') == 'pong2'
+    config.reload_config_cache()
+
+
+def test_config_snapshot_atomic_save_and_reload(monkeypatch):
+    from app.utils import config
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, 'config.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("retrieval:\n  fuse_alpha: 0.3\n")
+        monkeypatch.setattr(config, 'CONFIG_PATH', path)
+        monkeypatch.setattr(config, 'CONFIG_CHECK_INTERVAL', 0.0)
+        config.reload_config_cache()
+        snap = config.get_snapshot()
+        assert snap.retrieval == (5, 0.3, 0.8, 0.5)
+        # 配置未变化时复用同一个快照
+        assert config.get_snapshot() is snap
+        # 其他进程改写了文件：按 mtime 发现后整体换新快照，已取得的旧快照不受影响
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("retrieval:\n  fuse_alpha: 0.7\n  top_k: 3\n")
+        os.utime(path, ns=(0, 1))
+        assert config.get_snapshot().retrieval == (3, 0.7, 0.8, 0.5) and snap.retrieval.fuse_alpha == 0.3
+        # 多项修改只写一次，经临时文件原子替换，不留下临时文件
+        config.update_conf({'retrieval.confidence_threshold.high': 0.9, 'retrieval.confidence_threshold.low': 0.4})
+        assert os.listdir(td) == ['config.yaml']
+        assert config.get_snapshot().retrieval == (3, 0.7, 0.9, 0.4)
+        # 并发修改不同键：读-改-写串行执行，每一项都不丢失
+        import threading
+        threads = [threading.Thread(target=config.set_conf, args=(f'extra.k{i}', i)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert config.get_conf('extra') == {f'k{i}': i for i in range(8)}
+        assert os.listdir(td) == ['config.yaml']
+        monkeypatch.undo()
+    config.reload_config_cache()
+
+
+def test_session_cache_write_through_and_invalidation(monkeypatch):
+    with tempfile.TemporaryDirectory() as td:
+        dm.DB_PATH = os.path.join(td, 'test.db')
+        dm.init_db()
+        from app.core.chat_service import chat_service
+        from app.core.session_cache import SessionCache
+        from app.core import retention
+        monkeypatch.setattr(chat_service, 'cache', SessionCache(max_sessions=8, tail_size=4))
+        first = chat_service.send_message('hello', user_id='u9')
+        sid = first.session_id
+        # 新会话 + 写穿：历史直接由缓存返回，且与库中一致
+        history = chat_service.get_session_history(sid)
+        assert [m['id'] for m in history] == [m['id'] for m in dm.get_chat_messages(sid)]
+        stats = chat_service.cache_stats()
+        assert stats['history']['hits'] == 1 and stats['history']['misses'] == 0
+        # 同一用户再次发送，最近会话映射命中
+        assert chat_service.send_message('again', user_id='u9').session_id == sid
+        assert chat_service.cache_stats()['latest']['hits'] == 1
+        # 超出尾部容量后不再完整，超范围的查询回到数据库
+        chat_service.send_message('third', session_id=sid, user_id='u9')
+        assert len(chat_service.get_session_history(sid, limit=4)) == 4
+        assert chat_service.cache_stats()['history']['misses'] == 0
+        assert len(chat_service.get_session_history(sid, limit=10)) == 6
+        assert chat_service.cache_stats()['history']['misses'] == 1
+        assert chat_service.delete_session(sid)
+        assert chat_service.cache.get_session(sid) is None
+        assert chat_service.cache.get_latest('u9') is None
+        # 保留策略清理会话后，缓存中不再残留已删除会话的历史
+        sid = chat_service.send_message('stale', user_id='u10').session_id
+        assert chat_service.cache.get_session(sid) is not None
+        with dm.get_conn() as conn:
+            conn.execute("UPDATE chat_sessions SET updated_at = datetime('now', '-60 days');")
+        assert retention.run_retention(30)['sessions'] == 1
+        assert chat_service.cache.get_session(sid) is None
+        assert chat_service.cache.get_latest('u10') is None
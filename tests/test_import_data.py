@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import import_data  # noqa: E402
+
+
+def test_parse_chunk_skips_and_counts_non_string_fields():
+    lines = [json.dumps(obj).encode('utf-8') for obj in [
+        {'question': 'q1', 'answer': 'a1', 'tags': ['x', 2]},
+        {'question': 'q2', 'answer': 'a2', 'language': None, 'source': 'faq'},
+        {'question': 123, 'answer': 'a3'},
+        {'question': 'q4', 'answer': ['a4']},
+        {'question': 'q5', 'answer': 'a5', 'language': 7},
+        {'question': 'q6', 'answer': 'a6', 'source': {'name': 'x'}},
+        {'question': 'q7', 'answer': 'a7', 'tags': {'k': 'v'}},
+        ['not', 'an', 'object'],
+    ]] + [b'{broken']
+    end, items, bad = import_data.parse_chunk((42, lines))
+    assert end == 42 and bad == 7
+    assert items == [('q1', 'a1', 'auto', 'x,2', None), ('q2', 'a2', 'auto', None, 'faq')]
+
+
+def test_default_checkpoint_falls_back_when_directory_is_read_only(monkeypatch):
+    with tempfile.TemporaryDirectory() as td:
+        data = Path(td) / 'faqs.jsonl'
+        data.write_text('', encoding='utf-8')
+        assert import_data.default_checkpoint(str(data)) == data.resolve().with_name('faqs.jsonl.offset')
+        # 模拟只读挂载的数据目录（以 root 运行时无法用目录权限模拟）
+        readonly = str(data.resolve().parent)
+        access = os.access
+        monkeypatch.setattr(import_data.os, 'access', lambda p, mode: str(p) != readonly and access(p, mode))
+        fallback = import_data.default_checkpoint(str(data))
+        assert fallback.parent != data.resolve().parent and os.access(fallback.parent, os.W_OK)
+        assert fallback.name.startswith('faqs.jsonl.') and fallback == import_data.default_checkpoint(str(data))